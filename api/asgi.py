@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+"""
+Asynchronous server mode of the edge API (Starlette on uvicorn), in place of the Flask development server of run.py:
+
+    python3 api/asgi.py [--port 5000] [--max-connections 64] [--max-streams 32] [--workers 4] [--wsgi-threads 10]
+
+The video feeds (/api/video_feed/<camera_id> and /api/video_feed/mosaic) are coroutines: a viewer waiting for the next frame holds no thread,
+it is woken by the capture thread of the camera (run.CameraHub), and only the JPEG encodes (and the mosaic
+composition) run in a pool of --workers threads. Every other route is the Flask app of run.py, unchanged, run in a thread (a2wsgi) for the
+duration of the request.
+
+Concurrency limits: --max-connections open connections (uvicorn answers 503 above it), of which at most
+--max-streams video feed viewers, mosaic included (503 above it). The Flask routes share --wsgi-threads threads
+(a2wsgi), none of them is held by a stream.
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import run
+
+MAX_CONNECTIONS = 64
+MAX_STREAMS = 32
+ENCODE_WORKERS = 4
+WSGI_THREADS = 10
+
+encode_executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix='encode')
+max_streams = MAX_STREAMS
+# Video feeds being streamed (only touched from the event loop)
+active_streams = 0
+
+
+class StreamSlot:
+    """
+    One of the --max-streams video feed slots: taken by the request handler, so two requests can not both pass the
+    check for the last slot, and given back once, by the stream or by the response if the stream never started.
+    """
+
+    def __init__(self):
+        global active_streams
+        active_streams += 1
+        self.released = False
+
+    def release(self):
+        global active_streams
+        if not self.released:
+            self.released = True
+            active_streams -= 1
+
+
+class VideoFeedResponse(StreamingResponse):
+    def __init__(self, content, slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # The viewer may leave before the first chunk, the generator is then never started
+            self.slot.release()
+
+
+async def generate_video_stream(slot, camera_id, width, fps, quality, remote):
+    """
+    Async version of run.generate_video_stream, with the same drop-to-latest pacing. `slot` is released when the
+    stream ends.
+    """
+    loop = asyncio.get_running_loop()
+    new_frame = asyncio.Event()
+
+    def wake():
+        # Called from the capture thread
+        loop.call_soon_threadsafe(new_frame.set)
+
+    feed = run.camera_hub.get(camera_id)
+    client = run.StreamClient(camera_id, width, fps, quality, remote)
+    feed.add_listener(wake)
+    feed.subscribe(client)
+    try:
+        seq = 0
+        while True:
+            new_frame.clear()
+            frame, latest = feed.next_frame(seq, timeout=0)
+            if frame is None:
+                if not feed.running:
+                    break
+                try:
+                    await asyncio.wait_for(new_frame.wait(), run.STREAM_FRAME_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                continue
+            if seq:
+                client.dropped += latest - seq - 1
+            seq = latest
+            jpeg = await loop.run_in_executor(encode_executor, feed.encode, frame, seq, width, quality)
+            if jpeg is None:
+                continue
+            sent_at = loop.time()
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+            client.sent += 1
+            if fps:
+                await asyncio.sleep(max(0.0, sent_at + 1.0 / fps - loop.time()))
+    finally:
+        feed.unsubscribe(client)
+        feed.remove_listener(wake)
+        slot.release()
+
+
+async def generate_mosaic_stream(slot, remote):
+    """
+    Async version of run.generate_mosaic_stream. `slot` is released when the stream ends.
+    """
+    loop = asyncio.get_running_loop()
+    new_frame = asyncio.Event()
+
+    def wake():
+        # Called from the capture threads
+        loop.call_soon_threadsafe(new_frame.set)
+
+    viewer = run.MosaicViewer(remote, wake)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(new_frame.wait(), run.STREAM_FRAME_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+            new_frame.clear()
+            if not viewer.update():
+                break
+            jpeg = await loop.run_in_executor(encode_executor, viewer.encode)
+            if jpeg is None:
+                continue
+            sent_at = loop.time()
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+            viewer.sent()
+            await asyncio.sleep(max(0.0, sent_at + 1.0 / run.MOSAIC_FPS - loop.time()))
+    finally:
+        viewer.close()
+        slot.release()
+
+
+def json_error(message, status):
+    return Response(json.dumps({'error': message}), status_code=status, media_type='application/json')
+
+
+async def video_feed_camera(request):
+    try:
+        width, fps, quality = run.stream_params(request.query_params)
+    except ValueError as e:
+        return json_error(str(e), 400)
+    if active_streams >= max_streams:
+        return json_error('too many video feed viewers', 503)
+    # (no await between the check and the reservation)
+    slot = StreamSlot()
+    camera_id = request.path_params.get('camera_id', 0)
+    remote = request.client.host if request.client else None
+    return VideoFeedResponse(generate_video_stream(slot, camera_id, width, fps, quality, remote), slot,
+                             media_type='multipart/x-mixed-replace; boundary=frame')
+
+
+async def video_feed_mosaic(request):
+    if active_streams >= max_streams:
+        return json_error('too many video feed viewers', 503)
+    slot = StreamSlot()
+    remote = request.client.host if request.client else None
+    return VideoFeedResponse(generate_mosaic_stream(slot, remote), slot,
+                             media_type='multipart/x-mixed-replace; boundary=frame')
+
+
+def create_app(wsgi_threads=WSGI_THREADS):
+    return Starlette(routes=[
+        Route('/api/video_feed/', video_feed_camera),
+        Route('/api/video_feed/mosaic', video_feed_mosaic),
+        Route('/api/video_feed/{camera_id:int}', video_feed_camera),
+        Mount('/', app=WSGIMiddleware(run.app, workers=wsgi_threads)),
+    ])
+
+
+app = create_app()
+
+
+def main():
+    global encode_executor, max_streams
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=run.PORT)
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS)
+    parser.add_argument('--max-streams', type=int, default=MAX_STREAMS)
+    parser.add_argument('--workers', type=int, default=ENCODE_WORKERS, help="threads encoding the video frames")
+    parser.add_argument('--wsgi-threads', type=int, default=WSGI_THREADS, help="threads running the Flask routes")
+    args = parser.parse_args()
+    encode_executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='encode')
+    max_streams = args.max_streams
+    uvicorn.run(create_app(args.wsgi_threads), host=args.host, port=args.port, limit_concurrency=args.max_connections, log_config=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 #!/usr/bin/python3
 
-from functools import lru_cache
+from collections import OrderedDict
 import datetime
+import random
+import threading
 import requests
 import psutil
 from html import escape
@@ -60,12 +62,47 @@ sys.stdout = StreamToLogger(logger, logging.INFO)
 sys.stderr = StreamToLogger(logger, logging.ERROR)
 
 app = Flask(__name__)
-timestamp = None
 
 PORT = 5000
 CACHE_TIME = 2
 PROC_CACHE = 30
+IP_INFO_URL = "https://ipleak.net/json/"
+# ipleak (default) or static (fixed local answer, for tests and offline devices)
+IP_INFO_PROVIDER = os.environ.get('AISEED_IP_INFO_PROVIDER', 'ipleak')
+# Seconds: (connect, read) timeouts of a lookup, first retry delay after a failure (doubled up to the max)
+IP_INFO_TIMEOUT = (3, 5)
+IP_INFO_RETRY = 10
+IP_INFO_MAX_BACKOFF = 30 * 60
 CACHE_FILE_DIR = os.path.join(os.path.expanduser('~'), 'last_time.txt')
+# The recorder (camera-control) is installed next to the API, its config and helper modules are shared
+CAMERA_CONTROL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'camera-control')
+CAMERA_CONFIG_FILE = os.path.join(CAMERA_CONTROL_DIR, 'config.yaml')
+sys.path.append(CAMERA_CONTROL_DIR)
+
+from status_block import StatusBlockReader  # noqa: E402
+from metrics import METRICS_PATH  # noqa: E402
+from catalog import CatalogReader, CATALOG_PATH  # noqa: E402
+
+status_reader = StatusBlockReader()
+catalog_reader = None
+CAPTURES_LIMIT = 1000
+# Resized thumbnails kept in memory (total size of the JPEGs)
+THUMB_CACHE_BYTES = 32 * 1024 * 1024
+THUMB_MAX_WIDTH = 1920
+# Requested widths are rounded up to a multiple of this, so odd sizes do not fill the cache
+THUMB_WIDTH_STEP = 16
+THUMB_QUALITY = 80
+image_sources = None
+# Seconds a camera stays open after the last viewer of its video feed left
+STREAM_LINGER = 5
+# A viewer gives up when the camera sends no frame for this long
+STREAM_FRAME_TIMEOUT = 5
+STREAM_QUALITY = 95
+# The recorder is reported down when its status block heartbeat (refreshed every few seconds, and after every
+# capture cycle) is older than this
+RECORDER_STALE_SECONDS = 120
+# Grids per second of the mosaic feed
+MOSAIC_FPS = 10
 
 
 class _Process:
@@ -176,10 +213,107 @@ class ProcessCache:
 proc_cache = ProcessCache()
 
 
-@lru_cache(None)
-def get_ip_info_cached():
-    res = requests.get("https://ipleak.net/json/", verify=False)
-    return res.json()
+class IpleakProvider:
+    def __init__(self, url=IP_INFO_URL, timeout=IP_INFO_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        res = requests.get(self.url, verify=False, timeout=self.timeout)
+        res.raise_for_status()
+        return res.json()
+
+
+class StaticProvider:
+    """
+    Fixed IP info, no network access.
+    """
+
+    def __init__(self, info=None):
+        self.info = info or {'ip': '127.0.0.1', 'region_name': 'local', 'city_name': 'local'}
+
+    def fetch(self):
+        return dict(self.info)
+
+
+IP_INFO_PROVIDERS = {'ipleak': IpleakProvider, 'static': StaticProvider}
+
+
+class IpInfoRefresher:
+    """
+    Owns the IP info of the device. A background thread looks it up every `interval` seconds through `provider`
+    (an object with a fetch() method returning a dict), retrying a failed lookup with exponential backoff. get()
+    never waits for the network: it returns the last known value and its age, even while it is being refreshed or
+    when the refreshes fail.
+    """
+
+    def __init__(self, provider, interval=CACHE_TIME * 60, retry=IP_INFO_RETRY, max_backoff=IP_INFO_MAX_BACKOFF):
+        self.provider = provider
+        self.interval = interval
+        self.retry = retry
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._info = {}
+        self._updated_at = None
+        self.failures = 0
+        self.last_error = None
+
+    def _start(self):
+        # With the lock held, on the first get(): importing the module does not touch the network
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ip-info', daemon=True)
+            self._thread.start()
+
+    def get(self):
+        """
+        (info, age in seconds or None before the first lookup succeeded, last error or None).
+        """
+        with self._lock:
+            self._start()
+            age = None if self._updated_at is None else time.monotonic() - self._updated_at
+            return dict(self._info), age, self.last_error
+
+    def refresh(self):
+        """
+        Look the info up again now, also cutting a backoff short.
+        """
+        with self._lock:
+            self._start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                info = self.provider.fetch()
+            except Exception as e:
+                # Any failure (including a bug in a provider) is retried, the thread must not die
+                with self._lock:
+                    self.failures += 1
+                    self.last_error = str(e) or repr(e)
+                    delay = min(self.max_backoff, self.retry * 2 ** (self.failures - 1)) * random.uniform(0.8, 1.2)
+                print(f"Error: IP info lookup failed ({self.failures} in a row), retrying in {delay:.0f}s: {e}")
+            else:
+                with self._lock:
+                    self._info = info
+                    self._updated_at = time.monotonic()
+                    self.failures = 0
+                    self.last_error = None
+                delay = self.interval
+            self._wake.wait(delay)
+            self._wake.clear()
+
+
+def ip_info_provider(name):
+    if name not in IP_INFO_PROVIDERS:
+        print(f"Error: unknown AISEED_IP_INFO_PROVIDER {name!r} (one of {', '.join(IP_INFO_PROVIDERS)}), "
+              f"using ipleak")
+        name = 'ipleak'
+    return IP_INFO_PROVIDERS[name]()
+
+
+ip_info_refresher = IpInfoRefresher(ip_info_provider(IP_INFO_PROVIDER))
 
 
 def get_uptime_string():
@@ -233,22 +367,8 @@ def get_usage_info(format_string=True, fahrenheit=True):
         }
 
 
-def _check_timestamp(refresh=CACHE_TIME):
-    global timestamp
-    if timestamp is None:
-        timestamp = datetime.datetime.now()
-
-    timediff = (datetime.datetime.now() - timestamp)
-    if (timediff.seconds / 60) >= refresh:
-        # Cache will clear after refresh period is exceeded
-        get_ip_info_cached.cache_clear()
-        timestamp = datetime.datetime.now()
-
-
 def get_ip_info() -> Dict[str, str]:
-    _check_timestamp()
-
-    ip_info = get_ip_info_cached()
+    ip_info, _, _ = ip_info_refresher.get()
     return ip_info
 
 
@@ -269,7 +389,7 @@ def get_service_info(
 @app.route('/api/clear-cache')
 def clear_cache():
     try:
-        get_ip_info_cached.cache_clear()
+        ip_info_refresher.refresh()
         proc_cache.reset()
         return Response(status=200)
     except Exception as e:
@@ -279,7 +399,7 @@ def clear_cache():
 @app.route('/api/info')
 def server_info():
     try:
-        ip_info = get_ip_info()
+        ip_info, ip_info_age, ip_info_error = ip_info_refresher.get()
         services = request.args \
             .get('services')
         if services is not None:
@@ -305,6 +425,9 @@ def server_info():
                 'ip': ip_info.get('ip'),
                 'state': ip_info.get('region_name'),
                 'city': ip_info.get('city_name'),
+                # seconds since the last successful lookup (None: not known yet), the refresh runs in the background
+                'age': None if ip_info_age is None else round(ip_info_age, 1),
+                'error': ip_info_error,
             },
             'service_info': service_info,
             'uptime': get_uptime_string(),
@@ -323,43 +446,662 @@ def server_info():
         return Response(str(e), status=500)
 
 
-def generate_video_stream(camera_id=0):
+def encode_jpeg(frame, width=None, quality=STREAM_QUALITY):
     import cv2
-    camera = cv2.VideoCapture(camera_id)  # Open default camera
+    from derivatives import resize_to_width
+
+    ok, buffer = cv2.imencode('.jpg', resize_to_width(frame, width), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ok else None
+
+
+class StreamClient:
+    """
+    One viewer of a video feed and its parameters, listed by /api/video_feed/clients.
+    """
+
+    def __init__(self, camera_id, width, fps, quality, remote):
+        self.camera_id = camera_id
+        self.width = width
+        self.fps = fps
+        self.quality = quality
+        self.remote = remote
+        self.started_at = time.time()
+        self.sent = 0
+        # Frames of the camera the viewer never got: its link (or its fps) is slower than the camera
+        self.dropped = 0
+
+    def info(self):
+        return {
+            'camera_id': self.camera_id,
+            'remote': self.remote,
+            'width': self.width,
+            'fps': self.fps,
+            'quality': self.quality,
+            'seconds': round(time.time() - self.started_at, 1),
+            'sent': self.sent,
+            'dropped': self.dropped,
+        }
+
+
+class CameraFeed:
+    """
+    One camera shared by all the viewers of its video feed: a single thread reads the frames and every viewer
+    gets the latest one. Each frame is JPEG-encoded once per (width, quality) asked by the viewers, whatever their
+    number. The camera is opened by the first viewer and released `linger` seconds after the last one left (a
+    reload of the page does not reopen it).
+    """
+
+    def __init__(self, camera_id, linger=STREAM_LINGER):
+        self.camera_id = camera_id
+        self.linger = linger
+        self._cond = threading.Condition()
+        self._thread = None
+        self._clients = set()
+        self._left_at = None
+        # Latest frame, its number, and its encodings by (width, quality) done or in progress
+        self._frame = None
+        self._seq = 0
+        self._encoded = {}
+        self._encoding = set()
+        # Called (with the lock held) on every new frame and when the camera stops, e.g. to wake a coroutine
+        self._listeners = set()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def add_listener(self, listener):
+        with self._cond:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        with self._cond:
+            self._listeners.discard(listener)
+
+    def _notify(self):
+        self._cond.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def subscribe(self, client):
+        with self._cond:
+            self._clients.add(client)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'feed-{self.camera_id}', daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, client):
+        with self._cond:
+            self._clients.discard(client)
+            if not self._clients:
+                self._left_at = time.monotonic()
+
+    def clients(self):
+        with self._cond:
+            return list(self._clients)
+
+    def next_frame(self, last_seq, timeout=STREAM_FRAME_TIMEOUT):
+        """
+        The latest frame if it is newer than `last_seq`, as (frame, seq). Returns (None, last_seq) when the camera
+        stopped or no frame came within `timeout` seconds.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._thread is None or (self._frame is not None and self._seq != last_seq),
+                                timeout)
+            if self._thread is None or self._frame is None or self._seq == last_seq:
+                return None, last_seq
+            return self._frame, self._seq
+
+    def encode(self, frame, seq, width, quality):
+        """
+        JPEG of frame `seq` at `width` and `quality`. A viewer asking for an encoding already in progress waits for
+        it instead of encoding the frame again.
+        """
+        key = (width, quality)
+        with self._cond:
+            self._cond.wait_for(lambda: key not in self._encoding or self._seq != seq)
+            if self._seq == seq and key in self._encoded:
+                return self._encoded[key]
+            # (a frame replaced meanwhile is encoded for this viewer only)
+            owner = self._seq == seq
+            if owner:
+                self._encoding.add(key)
+        jpeg = None
+        try:
+            jpeg = encode_jpeg(frame, width, quality)
+        finally:
+            if owner:
+                with self._cond:
+                    self._encoding.discard(key)
+                    if self._seq == seq and jpeg is not None:
+                        self._encoded[key] = jpeg
+                    self._cond.notify_all()
+        return jpeg
+
+    def _stop(self, camera):
+        # With the lock held: a viewer arriving now starts a new thread once the device is free
+        camera.release()
+        self._thread = None
+        self._frame = None
+        self._notify()
+
+    def _run(self):
+        # Same frame source as the recorder (CAMERA_SOURCE), by-id / by-path names are resolved to their device
+        from frame_source import source_factory
+        camera = source_factory(read_camera_config())(self.camera_id)
+        while True:
+            success, frame = camera.read() if camera.isOpened() else (False, None)
+            with self._cond:
+                if not success:
+                    print(f"Video feed {self.camera_id}: unable to read the camera")
+                    self._stop(camera)
+                    return
+                if not self._clients and time.monotonic() - self._left_at >= self.linger:
+                    self._stop(camera)
+                    return
+                # Nothing is encoded until a viewer asks for the frame
+                self._frame = frame
+                self._seq += 1
+                self._encoded = {}
+                self._encoding = set()
+                self._notify()
+
+
+class CameraHub:
+    """
+    The CameraFeed of each camera id, created on the first request.
+    """
+
+    def __init__(self):
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def get(self, camera_id):
+        with self._lock:
+            feed = self._feeds.get(camera_id)
+            if feed is None:
+                feed = self._feeds[camera_id] = CameraFeed(camera_id)
+            return feed
+
+    def clients(self):
+        with self._lock:
+            feeds = list(self._feeds.values())
+        return [client for feed in feeds for client in feed.clients()]
+
+
+camera_hub = CameraHub()
+
+
+def generate_video_stream(camera_id=0, width=None, fps=None, quality=STREAM_QUALITY, remote=None):
+    """
+    MJPEG stream of a camera. Frames are never queued for a viewer: after each frame is sent (the write blocks
+    while the viewer's link is busy) and after the `fps` pacing, the viewer gets the newest frame of the camera,
+    and the frames in between are counted as dropped.
+    """
+    feed = camera_hub.get(camera_id)
+    client = StreamClient(camera_id, width, fps, quality, remote)
+    feed.subscribe(client)
     try:
+        seq = 0
         while True:
-            success, frame = camera.read()
-            if not success:
+            frame, latest = feed.next_frame(seq)
+            if frame is None:
                 break
-            ret, buffer = cv2.imencode('.jpg', frame)
-            frame = buffer.tobytes()
+            if seq:
+                client.dropped += latest - seq - 1
+            seq = latest
+            jpeg = feed.encode(frame, seq, width, quality)
+            if jpeg is None:
+                continue
+            sent_at = time.monotonic()
             yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+            client.sent += 1
+            if fps:
+                time.sleep(max(0.0, sent_at + 1.0 / fps - time.monotonic()))
     finally:
-        camera.release()
+        # Also run when the viewer disconnects (the generator is closed)
+        feed.unsubscribe(client)
+
+
+def stream_params(args):
+    """
+    (width, fps, quality) from the query `args` of a video feed request: ?width= (pixels, the height keeps the
+    aspect ratio), ?fps= and ?quality= (JPEG, 10-95). Raises ValueError.
+    """
+    def arg(name, convert, default=None):
+        value = args.get(name)
+        return default if value is None or value == '' else convert(value)
+
+    width = arg('width', int)
+    fps = arg('fps', float)
+    quality = arg('quality', int, STREAM_QUALITY)
+    if width is not None:
+        if width <= 0:
+            raise ValueError("width must be a positive number of pixels")
+        # Rounded so that close widths share their encodes
+        width = -(-width // THUMB_WIDTH_STEP) * THUMB_WIDTH_STEP
+    if fps is not None and fps <= 0:
+        raise ValueError("fps must be positive")
+    if not 10 <= quality <= 95:
+        raise ValueError("quality must be between 10 and 95")
+    return width, fps, quality
+
+
+def read_camera_config():
+    import yaml
+    with open(CAMERA_CONFIG_FILE, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def get_cpu_temperature_text():
+    usage = get_usage_info(True, fahrenheit=False)
+    return f"CPU Temperature: {usage['temp']}"
+
+
+class MosaicViewer:
+    """
+    One viewer of the mosaic feed: all the cameras of CAMERA_INDEXES in one grid, built from their shared video
+    feeds (a camera also watched on its own feed is read once) with the latest frame of each camera. `wake()` is
+    called on every new frame of any camera.
+    """
+
+    def __init__(self, remote, wake):
+        from mosaic import MosaicEngine
+
+        config = read_camera_config()
+        width = config['RES_DROP'].get('WIDTH')
+        height = config['RES_DROP'].get('HEIGHT')
+        names = [os.path.basename(name) for name in config['CAMERAS_NAME']]
+        self.mosaic = MosaicEngine(names, width, height,
+                                   temperature_func=get_cpu_temperature_text,
+                                   blank_text=os.uname().nodename)
+        self.wake = wake
+        self.feeds = [camera_hub.get(camera_id) for camera_id in config['CAMERA_INDEXES']]
+        self.clients = [StreamClient(camera_id, width, MOSAIC_FPS, STREAM_QUALITY, remote)
+                        for camera_id in config['CAMERA_INDEXES']]
+        self.seqs = [0] * len(self.feeds)
+        self.frames = [None] * len(self.feeds)
+        for feed, client in zip(self.feeds, self.clients):
+            feed.add_listener(wake)
+            feed.subscribe(client)
+
+    def update(self):
+        """
+        Take the new frames of the cameras. Returns False once every camera stopped.
+        """
+        for ix, (feed, client) in enumerate(zip(self.feeds, self.clients)):
+            frame, latest = feed.next_frame(self.seqs[ix], timeout=0)
+            if frame is not None:
+                if self.seqs[ix]:
+                    client.dropped += latest - self.seqs[ix] - 1
+                self.frames[ix], self.seqs[ix] = frame, latest
+            elif not feed.running:
+                self.frames[ix] = None
+        return any(feed.running for feed in self.feeds)
+
+    def encode(self):
+        import cv2
+        ok, buffer = cv2.imencode('.jpg', self.mosaic.compose(self.frames),
+                                  [cv2.IMWRITE_JPEG_QUALITY, STREAM_QUALITY])
+        return buffer.tobytes() if ok else None
+
+    def sent(self):
+        for client in self.clients:
+            client.sent += 1
+
+    def close(self):
+        for feed, client in zip(self.feeds, self.clients):
+            feed.unsubscribe(client)
+            feed.remove_listener(self.wake)
+
+
+def generate_mosaic_stream(remote=None):
+    """
+    MJPEG stream of the mosaic, at most MOSAIC_FPS grids per second.
+    """
+    new_frame = threading.Event()
+    viewer = MosaicViewer(remote, new_frame.set)
+    try:
+        while True:
+            if not new_frame.wait(STREAM_FRAME_TIMEOUT):
+                break
+            new_frame.clear()
+            if not viewer.update():
+                break
+            jpeg = viewer.encode()
+            if jpeg is None:
+                continue
+            sent_at = time.monotonic()
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+            viewer.sent()
+            time.sleep(max(0.0, sent_at + 1.0 / MOSAIC_FPS - time.monotonic()))
+    finally:
+        viewer.close()
 
 
 @app.route('/api/video_feed/')
 def video_feed():
-    return Response(stream_with_context(generate_video_stream(camera_id=0)),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    return video_feed_camera(0)
 
 
-# request a specific camera id
+# request a specific camera id, optionally ?width=&fps=&quality= (e.g. a low bitrate preview over LTE)
 @app.route('/api/video_feed/<int:camera_id>')
 def video_feed_camera(camera_id):
-    return Response(stream_with_context(generate_video_stream(camera_id=camera_id)),
+    try:
+        width, fps, quality = stream_params(request.args)
+    except ValueError as e:
+        return Response(json.dumps({'error': str(e)}), status=400, content_type='application/json')
+    return Response(stream_with_context(generate_video_stream(camera_id, width, fps, quality, request.remote_addr)),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+# viewers of the video feeds, with the frames sent and dropped for each
+@app.route('/api/video_feed/clients')
+def video_feed_clients():
+    return Response(json.dumps([client.info() for client in camera_hub.clients()]), status=200,
+                    content_type='application/json')
+
+
+# all cameras of the device in one grid
+@app.route('/api/video_feed/mosaic')
+def video_feed_mosaic():
+    return Response(stream_with_context(generate_mosaic_stream(request.remote_addr)),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
 # request to check the last time the cache is written
 @app.route('/api/cache_time')
 def cache_time():
-    # read file CACHE_FILE_DIR
-    with open(CACHE_FILE_DIR, 'r') as f:
-        last_time = f.read()
+    status = status_reader.read()
+    if status is not None:
+        last_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(status['updated_at']))
+    else:
+        # Recorder without the status block: read file CACHE_FILE_DIR
+        with open(CACHE_FILE_DIR, 'r') as f:
+            last_time = f.read()
     return Response(last_time, status=200)
 
 
+def format_epoch(epoch):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch)) if epoch else None
+
+
+# per camera status of the recorder
+@app.route('/api/capture_status')
+def capture_status():
+    status = status_reader.read()
+    if status is None:
+        return Response(json.dumps({'error': 'recorder status not available'}), status=503,
+                        content_type='application/json')
+
+    res = {
+        'updated_at': format_epoch(status['updated_at']),
+        'age': round(time.time() - status['updated_at'], 1),
+        'cycle_duration': round(status['cycle_duration'], 3),
+        'queue_depth': status['queue_depth'],
+        'cameras': [
+            {
+                'name': camera['name'],
+                'ok': camera['ok'],
+                'last_capture': format_epoch(camera['last_capture']),
+                'last_success': format_epoch(camera['last_success']),
+                'last_failure': format_epoch(camera['last_failure']),
+                'width': camera['width'],
+                'height': camera['height'],
+            }
+            for camera in status['cameras']
+        ],
+    }
+    return Response(json.dumps(res), status=200, content_type='application/json')
+
+
+# capture pipeline metrics of the recorder (Prometheus text format)
+@app.route('/api/metrics')
+def metrics():
+    try:
+        with open(METRICS_PATH, 'r') as f:
+            body = f.read()
+    except FileNotFoundError:
+        body = ''
+    # The files outlive the recorder (a crash or a stop): it is up while it keeps refreshing its heartbeat
+    status = status_reader.read()
+    age = time.time() - status['heartbeat_at'] if status is not None and status['heartbeat_at'] else None
+    up = age is not None and age <= RECORDER_STALE_SECONDS
+    body += f'# TYPE aiseed_recorder_up gauge\naiseed_recorder_up {int(up)}\n'
+    if age is not None:
+        body += f'# TYPE aiseed_recorder_heartbeat_age_seconds gauge\naiseed_recorder_heartbeat_age_seconds {age:.1f}\n'
+    return Response(body, status=200, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def get_catalog_reader():
+    global catalog_reader
+    if catalog_reader is None:
+        catalog_config = read_camera_config().get('CATALOG') or {}
+        catalog_reader = CatalogReader(catalog_config.get('PATH', CATALOG_PATH))
+    return catalog_reader
+
+
+def parse_time_arg(value):
+    # epoch seconds, or local time as 2024-05-01, 2024-05-01T12:00:00 or "2024-05-01 12:00:00"
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for time_format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(value, time_format))
+        except ValueError:
+            continue
+    raise ValueError(f"invalid time {value!r}")
+
+
+# saved images from the capture catalog: /api/captures?camera=&from=&to=&cursor=&limit=
+# (to sync, keep passing the returned next_cursor: the rows come in insertion order)
+@app.route('/api/captures')
+def captures():
+    reader = get_catalog_reader()
+    if not reader.available():
+        return Response(json.dumps({'error': 'capture catalog not available'}), status=503,
+                        content_type='application/json')
+    try:
+        start = parse_time_arg(request.args.get('from'))
+        end = parse_time_arg(request.args.get('to'))
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 100)), 1), CAPTURES_LIMIT)
+    except ValueError as e:
+        return Response(json.dumps({'error': str(e)}), status=400, content_type='application/json')
+    # variant: '' (default) for the originals, a DERIVATIVES name, or * for all
+    variant = request.args.get('variant', '')
+    rows, more = reader.captures(camera=request.args.get('camera') or None, start=start, end=end, cursor=cursor,
+                                 limit=limit, variant=None if variant == '*' else variant)
+    for row in rows:
+        row['captured_at_text'] = format_epoch(row['captured_at'])
+    res = {
+        'captures': rows,
+        'next_cursor': rows[-1]['id'] if rows else cursor,
+        'has_more': more,
+    }
+    return Response(json.dumps(res), status=200, content_type='application/json')
+
+
+class ByteLRU:
+    """
+    Least recently used cache bounded by the total size of its values (bytes), shared by the request threads.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._items[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+
+thumb_cache = ByteLRU(THUMB_CACHE_BYTES)
+
+
+def get_image_sources():
+    """
+    Spool folder, names of the resized (not cropped) derivatives and cameras saving regions of interest (the
+    `roi` ones, which have no derivatives, and the `roi_only` ones, which have no whole image), from the recorder
+    config.
+    """
+    global image_sources
+    if image_sources is None:
+        config = read_camera_config()
+        spool_config = config.get('SPOOL') or {}
+        roi = {os.path.basename(name): roi_config
+               for name, roi_config in zip(config['CAMERAS_NAME'], config.get('ROI') or [])
+               if roi_config and (roi_config.get('REGIONS') or roi_config.get('TILES'))}
+        image_sources = {
+            'spool_dir': os.path.expanduser(spool_config.get('DIR', '~/spool')),
+            'resized': {d['NAME'] for d in config.get('DERIVATIVES') or [] if not d.get('CROP')},
+            'roi': set(roi),
+            'roi_only': {camera for camera, roi_config in roi.items() if not roi_config.get('CONTEXT_WIDTH')},
+        }
+    return image_sources
+
+
+def read_capture(row):
+    # On the share, or still in the local spool while the share is down (same path relative to the home directory)
+    spool_path = os.path.join(get_image_sources()['spool_dir'],
+                              os.path.relpath(row['path'], os.path.expanduser('~')))
+    for path in (row['path'], spool_path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            continue
+    return None
+
+
+def latest_capture(camera):
+    reader = get_catalog_reader()
+    if not reader.available():
+        return None, {}, Response(json.dumps({'error': 'capture catalog not available'}), status=503,
+                                  content_type='application/json')
+    row, derivatives = reader.latest(camera)
+    if row is None and camera in get_image_sources()['roi_only']:
+        return None, {}, Response(json.dumps({'error': f'{camera} only saves regions of interest (no ROI '
+                                                       f'CONTEXT_WIDTH), it has no whole image'}),
+                                  status=404, content_type='application/json')
+    if row is None:
+        return None, {}, Response(json.dumps({'error': f'no capture of {camera}'}), status=404,
+                                  content_type='application/json')
+    return row, derivatives, None
+
+
+def image_response(data, etag, modified):
+    res = Response(data, status=200 if data is not None else 304, content_type='image/jpeg')
+    res.set_etag(etag)
+    res.last_modified = modified
+    # Cached by the browser, but revalidated on every poll (answered with a 304 until the next capture)
+    res.cache_control.no_cache = True
+    return res
+
+
+def not_modified(etag, modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return request.if_modified_since is not None and modified <= request.if_modified_since
+
+
+# last saved image of a camera (a CAMERAS_NAME folder name)
+@app.route('/api/images/<camera>/latest')
+def latest_image(camera):
+    row, _, error = latest_capture(camera)
+    if error is not None:
+        return error
+    # The catalog row alone answers the conditional requests, the image is only read when it changed
+    etag = f"{row['id']}-full"
+    modified = datetime.datetime.fromtimestamp(int(row['captured_at']), datetime.timezone.utc)
+    if not_modified(etag, modified):
+        return image_response(None, etag, modified)
+    data = read_capture(row)
+    if data is None:
+        return Response(json.dumps({'error': f'image of {camera} not readable'}), status=404,
+                        content_type='application/json')
+    return image_response(data, etag, modified)
+
+
+def make_thumb(row, derivatives, width):
+    import cv2
+    import numpy as np
+    from derivatives import resize_to_width
+
+    # Resize from the smallest saved copy that is still wide enough, not from the 4K original. The variants of an
+    # ROI camera are regions (whatever their name), never a resized copy
+    sources = get_image_sources()
+    resized = set() if row['camera'] in sources['roi'] else sources['resized']
+    candidates = [d for name, d in derivatives.items() if name in resized and d['width'] and d['width'] >= width]
+    sources = sorted(candidates, key=lambda d: d['width']) + [row]
+    for source in sources:
+        data = read_capture(source)
+        if data is None:
+            continue
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        ok, buffer = cv2.imencode('.jpg', resize_to_width(image, width), [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+        if ok:
+            return buffer.tobytes()
+    return None
+
+
+# last saved image of a camera resized to ?w= pixels wide
+@app.route('/api/images/<camera>/thumb')
+def latest_thumb(camera):
+    try:
+        width = int(request.args.get('w', 320))
+    except ValueError:
+        return Response(json.dumps({'error': 'w must be an integer'}), status=400, content_type='application/json')
+    width = min(max(-(-width // THUMB_WIDTH_STEP) * THUMB_WIDTH_STEP, THUMB_WIDTH_STEP), THUMB_MAX_WIDTH)
+    row, derivatives, error = latest_capture(camera)
+    if error is not None:
+        return error
+    etag = f"{row['id']}-{width}"
+    modified = datetime.datetime.fromtimestamp(int(row['captured_at']), datetime.timezone.utc)
+    if not_modified(etag, modified):
+        return image_response(None, etag, modified)
+    data = thumb_cache.get(etag)
+    if data is None:
+        data = make_thumb(row, derivatives, width)
+        if data is None:
+            return Response(json.dumps({'error': f'image of {camera} not readable'}), status=404,
+                            content_type='application/json')
+        thumb_cache.put(etag, data)
+    return image_response(data, etag, modified)
+
+
 if __name__ == '__main__':
     app.run('0.0.0.0', PORT)
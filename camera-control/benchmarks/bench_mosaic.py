@@ -0,0 +1,94 @@
+"""
+Per-frame composition time of the camera grid: MosaicEngine against the hstack/vstack layout that recording.py used
+before (kept below as the baseline).
+
+    python3 benchmarks/bench_mosaic.py --cameras 2 3 4 8 --frames 200
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mosaic import MosaicEngine  # noqa: E402
+
+
+def get_cpu_temperature():
+    try:
+        temperature = os.popen("vcgencmd measure_temp").readline()
+        return f"CPU Temperature: {temperature}"
+    except Exception as e:
+        return f"Unable to retrieve CPU temperature: {e}"
+
+
+def legacy_layout(frames, names, width, height):
+    # show_camera_layout() + create_layout() as they were in recording.py
+    frames = list(frames)
+    for ix in range(len(frames)):
+        frames[ix] = cv2.resize(frames[ix], (width, height))
+        text_position = (int((frames[ix].shape[1] -
+                              cv2.getTextSize(names[ix], cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][0]) / 2), 20)
+        cv2.putText(frames[ix], names[ix], text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (0, 0, 255), 1, cv2.LINE_AA)
+
+    num_of_cams = len(frames)
+    layout_rows = np.ceil(num_of_cams / 2)
+    if num_of_cams % 2 == 1:
+        blank_frame = np.zeros_like(frames[0])
+        for offset, text in ((0, "Press `q` to close the program"),
+                             (20, time.strftime('%Y/%m/%d/%H:%M:%S', time.localtime())),
+                             (40, get_cpu_temperature())):
+            text_position = (
+                int((blank_frame.shape[1] - cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][0]) / 2),
+                int(blank_frame.shape[0] / 2) + offset
+            )
+            cv2.putText(blank_frame, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1,
+                        cv2.LINE_AA)
+        frames.append(blank_frame)
+
+    layout = None
+    for i in range(int(layout_rows)):
+        row_frame = None
+        for j in range(2):
+            fr = frames[i * 2 + j]
+            row_frame = fr if row_frame is None else np.hstack((row_frame, fr))
+        layout = row_frame if layout is None else np.vstack((layout, row_frame))
+    return layout
+
+
+def bench(func, n_frames):
+    func()  # warm-up
+    start = time.perf_counter()
+    for _ in range(n_frames):
+        func()
+    return (time.perf_counter() - start) / n_frames * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cameras', type=int, nargs='+', default=[2, 3, 4, 6, 8])
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--source', default='1280x720', help="camera frame size WIDTHxHEIGHT")
+    parser.add_argument('--tile', default='800x600', help="tile size WIDTHxHEIGHT (RES_DROP)")
+    args = parser.parse_args()
+
+    src_w, src_h = map(int, args.source.split('x'))
+    tile_w, tile_h = map(int, args.tile.split('x'))
+    rng = np.random.default_rng(0)
+
+    print(f"{'cameras':>7} {'legacy ms':>10} {'mosaic ms':>10} {'speedup':>8}")
+    for n in args.cameras:
+        frames = [rng.integers(0, 256, (src_h, src_w, 3), dtype=np.uint8) for _ in range(n)]
+        names = [f"camera_{i}" for i in range(n)]
+        engine = MosaicEngine(names, tile_w, tile_h, temperature_func=get_cpu_temperature)
+
+        legacy_ms = bench(lambda: legacy_layout(frames, names, tile_w, tile_h), args.frames)
+        mosaic_ms = bench(lambda: engine.compose(frames), args.frames)
+        print(f"{n:>7} {legacy_ms:>10.2f} {mosaic_ms:>10.2f} {legacy_ms / mosaic_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
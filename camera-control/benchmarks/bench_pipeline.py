@@ -0,0 +1,145 @@
+"""
+Hardware-free benchmark of the capture pipeline, using the synthetic frame source instead of USB cameras.
+
+For every camera count and resolution it measures:
+- cycle: end-to-end capture cycle (grab/retrieve, preprocessing, queue, JPEG encode and write, until the write
+  queue is empty)
+- encode: single-thread JPEG encode throughput
+- write: atomic file write throughput of the encoded JPEGs into --target
+
+    python3 benchmarks/bench_pipeline.py --cameras 1 2 4 8 --resolutions 720p 1080p 4k --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from camera_session import CameraSessionManager  # noqa: E402
+from frame_source import SyntheticSource  # noqa: E402
+from image_writer import ImageWriter, write_atomic  # noqa: E402
+from preprocess import Preprocessor  # noqa: E402
+from recording import capture_cycle  # noqa: E402
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+
+
+def bench_config(num_cameras, width, height, fps, workers):
+    return {
+        'CAMERA_INDEXES': list(range(num_cameras)),
+        'CAMERAS_NAME': [f"cam{ix}" for ix in range(num_cameras)],
+        'RESOLUTION': {'CAP_PROP_FRAME_WIDTH': width, 'CAP_PROP_FRAME_HEIGHT': height},
+        'CAMERA_SOURCE': {'TYPE': 'synthetic', 'FPS': fps},
+        'CAMERA_SESSION': {'MODE': 'always_open', 'WARMUP_FRAMES': 0},
+        'IMAGE_WRITER': {'WORKERS': workers, 'QUEUE_SIZE': max(num_cameras * 2, 8)},
+    }
+
+
+def summary(samples):
+    return {
+        'mean': statistics.mean(samples),
+        'p50': statistics.median(samples),
+        'max': max(samples),
+    }
+
+
+def bench_cycle(config, cycles, target):
+    for name in config['CAMERAS_NAME']:
+        os.makedirs(os.path.join(target, name), exist_ok=True)
+    sessions = CameraSessionManager(config['CAMERA_INDEXES'], config)
+    preprocessor = Preprocessor.from_config(config)
+    writer = ImageWriter.from_config(config)
+    try:
+        samples = []
+        for _ in range(cycles):
+            start = time.perf_counter()
+            capture_cycle(sessions, preprocessor, None, writer, config, current_dir=target)
+            writer.queue.join()
+            # (cycles within the same second overwrite the same files, which still costs a full write)
+            samples.append(time.perf_counter() - start)
+        return summary(samples)
+    finally:
+        writer.close()
+        sessions.close()
+
+
+def bench_encode(frame, count):
+    start = time.perf_counter()
+    size = 0
+    for _ in range(count):
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        size += len(buffer)
+    elapsed = time.perf_counter() - start
+    return {'frames_per_s': count / elapsed, 'mb_per_s': size / elapsed / 1e6, 'jpeg_bytes': size // count}, buffer
+
+
+def bench_write(buffer, count, target):
+    start = time.perf_counter()
+    for ix in range(count):
+        write_atomic(os.path.join(target, f"write_{ix}.jpg"), buffer)
+    elapsed = time.perf_counter() - start
+    for ix in range(count):
+        os.remove(os.path.join(target, f"write_{ix}.jpg"))
+    return {'files_per_s': count / elapsed, 'mb_per_s': len(buffer) * count / elapsed / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cameras', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--resolutions', nargs='+', default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--encodes', type=int, default=10)
+    parser.add_argument('--fps', type=float, default=30, help="frame rate of the synthetic cameras (0: unpaced)")
+    parser.add_argument('--workers', type=int, default=2, help="IMAGE_WRITER.WORKERS")
+    parser.add_argument('--target', default=None, help="directory the images are written to (default: a temp dir)")
+    parser.add_argument('--output', default='bench_pipeline.json')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.target) as target:
+        for resolution in args.resolutions:
+            width, height = RESOLUTIONS[resolution]
+            source = SyntheticSource(width, height, fps=0)
+            encode, buffer = bench_encode(source.read()[1], args.encodes)
+            write = bench_write(buffer, args.encodes, target)
+            for num_cameras in args.cameras:
+                config = bench_config(num_cameras, width, height, args.fps, args.workers)
+                cycle = bench_cycle(config, args.cycles, target)
+                result = {
+                    'resolution': resolution,
+                    'cameras': num_cameras,
+                    'cycle_s': cycle,
+                    'encode': encode,
+                    'write': write,
+                }
+                results.append(result)
+                print(f"{resolution:>5} x{num_cameras}: cycle {cycle['mean']:.3f}s (max {cycle['max']:.3f}s), "
+                      f"encode {encode['frames_per_s']:.1f} fps, write {write['mb_per_s']:.1f} MB/s")
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'cpu_count': os.cpu_count(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from metrics import registry as metrics
+from frame_source import source_factory
+
+# Session modes (config.yaml -> CAMERA_SESSION.MODE)
+MODE_ALWAYS_OPEN = 'always_open'  # keep the capture handles open forever
+MODE_PER_CYCLE = 'per_cycle'  # open/close the cameras on every capture cycle (legacy behaviour)
+MODE_IDLE_CLOSE = 'idle_close'  # keep open, release when idle for IDLE_CLOSE_MINUTES or more
+SESSION_MODES = (MODE_ALWAYS_OPEN, MODE_PER_CYCLE, MODE_IDLE_CLOSE)
+# The API video feeds open the same devices: they only work while the recorder does not hold them
+DEFAULT_MODE = MODE_PER_CYCLE
+
+
+class CameraSession:
+    """
+    Owns the cv2.VideoCapture handle of one camera across capture cycles.
+
+    Opening a 3840x2160 V4L2 stream and setting its resolution takes seconds on a USB hub, so the handle is
+    kept open and only reopened after a failure or when the session manager releases it.
+    """
+
+    def __init__(self, camera_index, width, height, warmup_frames=0, name=None, open_source=cv2.VideoCapture):
+        self.camera_index = camera_index
+        # cv2.VideoCapture or a frame_source backend
+        self.open_source = open_source
+        # Label of the camera in the metrics
+        self.name = name if name is not None else str(camera_index)
+        self.width = width
+        self.height = height
+        self.warmup_frames = warmup_frames
+        self.cap = None
+        self.last_used = None
+        # Latency of the last open / grab / retrieve in seconds (open is 0 when the handle was reused)
+        self.open_latency = 0.0
+        self.grab_latency = 0.0
+        self.retrieve_latency = 0.0
+        # time.monotonic() at which the last frame was grabbed (None if the grab failed)
+        self.grab_time = None
+
+    @property
+    def is_open(self):
+        return self.cap is not None
+
+    def open(self):
+        self.open_latency = 0.0
+        if self.cap is not None:
+            return True
+
+        start = time.monotonic()
+        cap = self.open_source(self.camera_index)
+        if not cap.isOpened():
+            cap.release()
+            print("Error: Unable to open camera number :", self.camera_index)
+            metrics.inc('aiseed_capture_failures_total', camera=self.name, stage='open')
+            return False
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.cap = cap
+        self.open_latency = time.monotonic() - start
+        metrics.observe('aiseed_capture_stage_seconds', self.open_latency, camera=self.name, stage='open')
+        print(f"Camera number {self.camera_index} is ON")
+        return True
+
+    def prepare(self):
+        """
+        Open the camera if needed and drop the frames buffered by the driver while the handle was idle
+        (or while the sensor was settling). Returns False if the camera could not be opened.
+        """
+        if not self.open():
+            return False
+        for _ in range(self.warmup_frames):
+            self.cap.grab()
+        return True
+
+    def grab(self):
+        """
+        Latch the next frame on the device without decoding it, so several cameras can be grabbed at the same time.
+        """
+        self.grab_latency = 0.0
+        self.grab_time = None
+        if self.cap is None:
+            return False
+
+        start = time.monotonic()
+        ok = self.cap.grab()
+        self.grab_latency = time.monotonic() - start
+        if not ok:
+            # Most likely an unplugged camera: drop the handle so it is reopened on the next cycle
+            print(f"Error: Unable to grab camera number : {self.camera_index}")
+            metrics.inc('aiseed_capture_failures_total', camera=self.name, stage='grab')
+            self.release()
+            return False
+        metrics.observe('aiseed_capture_stage_seconds', self.grab_latency, camera=self.name, stage='grab')
+        self.grab_time = time.monotonic()
+        self.last_used = self.grab_time
+        return True
+
+    def retrieve(self):
+        """
+        Decode the frame latched by grab(). Returns None if there is no frame.
+        """
+        self.retrieve_latency = 0.0
+        if self.cap is None or self.grab_time is None:
+            return None
+
+        start = time.monotonic()
+        ret, frame = self.cap.retrieve()
+        self.retrieve_latency = time.monotonic() - start
+        if not ret:
+            print(f"Error: Unable to retrieve camera number : {self.camera_index}")
+            metrics.inc('aiseed_capture_failures_total', camera=self.name, stage='retrieve')
+            self.release()
+            return None
+        metrics.observe('aiseed_capture_stage_seconds', self.retrieve_latency, camera=self.name, stage='retrieve')
+        metrics.inc('aiseed_frames_captured_total', camera=self.name)
+        return frame
+
+    def read(self):
+        """
+        Read one fresh frame, opening the camera if needed. Returns None if the camera failed.
+        """
+        if not self.prepare():
+            return None
+        self.grab()
+        return self.retrieve()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def idle_seconds(self):
+        if self.last_used is None:
+            return 0.0
+        return time.monotonic() - self.last_used
+
+
+class CameraSessionManager:
+    """
+    Keeps one CameraSession per configured camera and decides when the handles are released.
+
+    Frames are captured in three stages, each run on all cameras at once from a thread pool (OpenCV releases the
+    GIL while waiting on the device): open/warm-up, grab() and retrieve(). Splitting grab from the (slow) MJPEG
+    decode in retrieve() keeps the grab instants of all cameras close together and the cycle time flat when
+    cameras are added.
+    """
+
+    def __init__(self, camera_indexes, config):
+        session_config = config.get('CAMERA_SESSION') or {}
+        self.mode = session_config.get('MODE', DEFAULT_MODE)
+        self.idle_close_seconds = session_config.get('IDLE_CLOSE_MINUTES', 10) * 60
+        warmup_frames = session_config.get('WARMUP_FRAMES', 0)
+        open_source = source_factory(config)
+        self.sessions = [
+            CameraSession(camera_index,
+                          config['RESOLUTION'].get('CAP_PROP_FRAME_WIDTH'),
+                          config['RESOLUTION'].get('CAP_PROP_FRAME_HEIGHT'),
+                          warmup_frames,
+                          name=os.path.basename(name),
+                          open_source=open_source)
+            for camera_index, name in zip(camera_indexes, config['CAMERAS_NAME'])
+        ]
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.sessions), 1),
+                                           thread_name_prefix='camera')
+        # Per camera time.monotonic() of the last grab (None for a failed camera), and the same as wall-clock time
+        self.capture_times = [None] * len(self.sessions)
+        self.capture_wall_times = [None] * len(self.sessions)
+        # Spread in seconds between the first and the last grab of the last cycle
+        self.capture_skew = 0.0
+        self.capture_duration = 0.0
+
+    def reconfigure(self, camera_indexes, config):
+        """
+        Apply a reloaded config. Only the cameras whose device or resolution changed are released (and reopened on
+        the next capture), the other handles stay open.
+        """
+        session_config = config.get('CAMERA_SESSION') or {}
+        mode = session_config.get('MODE', DEFAULT_MODE)
+        idle_close_seconds = session_config.get('IDLE_CLOSE_MINUTES', 10) * 60
+        warmup_frames = session_config.get('WARMUP_FRAMES', 0)
+        width = config['RESOLUTION'].get('CAP_PROP_FRAME_WIDTH')
+        height = config['RESOLUTION'].get('CAP_PROP_FRAME_HEIGHT')
+        self.mode = mode
+        self.idle_close_seconds = idle_close_seconds
+        for session, camera_index in zip(self.sessions, camera_indexes):
+            session.warmup_frames = warmup_frames
+            if (session.camera_index, session.width, session.height) == (camera_index, width, height):
+                continue
+            print(f"Camera {session.name}: {session.camera_index} {session.width}x{session.height} -> "
+                  f"{camera_index} {width}x{height}, reopening")
+            session.release()
+            session.camera_index = camera_index
+            session.width = width
+            session.height = height
+
+    def _run_all(self, func, sessions=None):
+        return list(self.executor.map(func, self.sessions if sessions is None else sessions))
+
+    def read_all(self, only=None):
+        """
+        One frame per camera (None for a failed camera). With `only` (camera indexes), the other cameras are not
+        read and their frame is None.
+        """
+        indexes = list(range(len(self.sessions))) if only is None else list(only)
+        selected = [self.sessions[ix] for ix in indexes]
+        start = time.monotonic()
+        self._run_all(CameraSession.prepare, selected)
+        self._run_all(CameraSession.grab, selected)
+        frames = [None] * len(self.sessions)
+        for ix, frame in zip(indexes, self._run_all(CameraSession.retrieve, selected)):
+            frames[ix] = frame
+        self.capture_duration = time.monotonic() - start
+
+        self.capture_times = [None] * len(self.sessions)
+        for ix in indexes:
+            self.capture_times[ix] = self.sessions[ix].grab_time
+        wall_offset = time.time() - time.monotonic()
+        self.capture_wall_times = [None if t is None else t + wall_offset for t in self.capture_times]
+        grabbed = [t for t in self.capture_times if t is not None]
+        self.capture_skew = (max(grabbed) - min(grabbed)) if grabbed else 0.0
+        self.report_latency()
+        return frames
+
+    def report_latency(self):
+        # One line per cycle so the modes can be compared from ~/camera-control.log
+        parts = [
+            f"{session.camera_index}: open {session.open_latency:.3f}s grab {session.grab_latency:.3f}s "
+            f"retrieve {session.retrieve_latency:.3f}s"
+            for session in self.sessions
+        ]
+        print(f"Capture latency [{self.mode}] total {self.capture_duration:.3f}s "
+              f"skew {self.capture_skew * 1000:.1f}ms | " + ", ".join(parts))
+
+    def release_idle(self, expected_idle_seconds=0):
+        """
+        Called before the recorder goes to sleep for `expected_idle_seconds`.
+        """
+        for session in self.sessions:
+            if self.mode == MODE_PER_CYCLE:
+                session.release()
+            elif self.mode == MODE_IDLE_CLOSE:
+                if session.idle_seconds() + expected_idle_seconds >= self.idle_close_seconds:
+                    session.release()
+
+    def release_all(self):
+        for session in self.sessions:
+            session.release()
+
+    def close(self):
+        self.release_all()
+        self.executor.shutdown(wait=True)
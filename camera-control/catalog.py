@@ -0,0 +1,199 @@
+"""
+Local SQLite catalog of the captured images, on the SD card next to the recorder (not on the share).
+
+The recorder appends one row per written image (originals and derivatives) through a background thread that
+commits in batches, and the API answers range queries from it (/api/captures) instead of listing the share.
+The row id is a cursor: a server syncing the device asks for everything after the last id it has seen.
+The database is in WAL mode, so the API reads while the recorder writes.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+CATALOG_PATH = os.path.join(os.path.expanduser('~'), '.aiseed-catalog.db')
+
+# Sink status of an image
+STATUS_WRITING = 'writing'  # encoded, being handed to the sink
+STATUS_FAILED = 'failed'  # the write failed, the image is lost
+STATUS_WRITTEN = 'written'  # on the share
+STATUS_SPOOLED = 'spooled'  # in the local spool, waiting for the share
+STATUS_QUEUED = 'queued'  # waiting for the HTTP upload
+STATUS_UPLOADED = 'uploaded'
+STATUS_OUTBOX = 'outbox'  # HTTP upload failed, kept on the SD card
+STATUS_EVICTED = 'evicted'  # dropped from a full spool
+STATUS_REJECTED = 'rejected'  # refused by the ingestion server
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    camera TEXT NOT NULL,
+    captured_at REAL NOT NULL,
+    path TEXT NOT NULL,
+    variant TEXT NOT NULL DEFAULT '',
+    bytes INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS captures_camera_time ON captures (camera, captured_at);
+CREATE INDEX IF NOT EXISTS captures_path ON captures (path);
+"""
+
+COLUMNS = ('id', 'camera', 'captured_at', 'path', 'variant', 'bytes', 'width', 'height', 'status', 'updated_at')
+
+
+def connect(path=CATALOG_PATH):
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # WAL + NORMAL: a commit is one append to the WAL, fsync only at checkpoints
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class Catalog:
+    """
+    Writer side. add() and update_status() only queue the change; the catalog thread applies the queued changes
+    in one transaction every `flush_interval` seconds (or every `batch_size` changes).
+    """
+
+    def __init__(self, path=CATALOG_PATH, batch_size=200, flush_interval=1.0):
+        self.path = os.path.expanduser(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.conn = connect(self.path)
+        self.conn.executescript(SCHEMA)
+        self.rows = 0
+        self._thread = threading.Thread(target=self._run, name='catalog', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config):
+        catalog_config = config.get('CATALOG') or {}
+        if not catalog_config.get('ENABLED', True):
+            return None
+        return cls(catalog_config.get('PATH', CATALOG_PATH))
+
+    def add(self, camera, captured_at, path, size, width, height, status, variant=''):
+        self.queue.put(('add', (camera, captured_at, path, variant, size, width, height, status, time.time())))
+
+    def update_status(self, path, status, only_from=None):
+        """
+        Set the status of the rows of `path`. With `only_from`, only if their status is still `only_from` (a later
+        status already reported by the sink thread is kept).
+        """
+        self.queue.put(('status', (status, time.time(), path, only_from, only_from)))
+
+    def _next_batch(self):
+        try:
+            change = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [change]
+        deadline = time.monotonic() + self.flush_interval
+        while change is not None and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                change = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(change)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = None in batch
+            changes = [change for change in batch if change is not None]
+            if changes:
+                self._apply(changes)
+            if stop:
+                return
+
+    def _apply(self, changes):
+        try:
+            with self.conn:
+                for kind, values in changes:
+                    if kind == 'add':
+                        self.conn.execute('INSERT INTO captures (camera, captured_at, path, variant, bytes, width, '
+                                          'height, status, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', values)
+                        self.rows += 1
+                    else:
+                        self.conn.execute('UPDATE captures SET status = ?, updated_at = ? '
+                                          'WHERE path = ? AND (? IS NULL OR status = ?)', values)
+        except sqlite3.Error as e:
+            print(f"Error: unable to write {len(changes)} changes to the catalog: {e}")
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+        self.conn.close()
+
+
+class CatalogReader:
+    """
+    Read side, for the API. One read-only connection per thread.
+    """
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = os.path.expanduser(path)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    def captures(self, camera=None, start=None, end=None, cursor=0, limit=100, variant=''):
+        """
+        Rows with an id above `cursor`, in id order, optionally of one camera and captured in [start, end)
+        (epoch seconds). Returns (rows, True if there are more rows after them).
+        """
+        conditions, params = ['id > ?'], [cursor]
+        if camera is not None:
+            conditions.append('camera = ?')
+            params.append(camera)
+        if start is not None:
+            conditions.append('captured_at >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('captured_at < ?')
+            params.append(end)
+        if variant is not None:
+            conditions.append('variant = ?')
+            params.append(variant)
+        # One more row than asked tells whether there is a next page
+        rows = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM captures WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+            params + [limit + 1]).fetchall()
+        rows = [dict(row) for row in rows]
+        return rows[:limit], len(rows) > limit
+
+    def latest(self, camera, statuses=(STATUS_WRITTEN, STATUS_SPOOLED)):
+        """
+        Row of the last original image of `camera` with one of `statuses`, and the rows of its derivatives.
+        Returns (row, {variant: row}) or (None, {}).
+        """
+        conn = self._conn()
+        row = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM captures WHERE camera = ? AND variant = '' "
+            f"AND status IN ({', '.join('?' * len(statuses))}) ORDER BY captured_at DESC, id DESC LIMIT 1",
+            (camera,) + tuple(statuses)).fetchone()
+        if row is None:
+            return None, {}
+        derivatives = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM captures WHERE camera = ? AND captured_at = ? AND variant != '' "
+            f"AND status IN ({', '.join('?' * len(statuses))})",
+            (camera, row['captured_at']) + tuple(statuses)).fetchall()
+        return dict(row), {derivative['variant']: dict(derivative) for derivative in derivatives}
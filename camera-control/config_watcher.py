@@ -0,0 +1,157 @@
+"""
+Hot reload of config.yaml.
+
+The recorder polls the watcher between captures and while it sleeps. A poll is a single os.stat() of the file, the
+YAML is only parsed when its mtime, size or inode changed (editors that save by renaming a new file are covered).
+A new config is validated before it is used: when it does not parse or does not validate, the errors are logged
+and the running config is kept, so a bad edit never stops the service.
+
+The type checks shared by the validation functions (recording.validate_config, preprocess_errors) are here too.
+"""
+import os
+
+import yaml
+
+# Sections that can not be applied to a running recorder (threads, shared memory and folders are sized from
+# them). Their edits are logged and only used after the next restart.
+RESTART_KEYS = ('CAMERAS_NAME', 'PATH_TEMPLATE', 'CACHE_LATEST_UPDATE_PATH', 'RES_DROP', 'SPOOL', 'SINK',
+                'CAMERA_SOURCE', 'PACK', 'CATALOG')
+# Keys of a section that are restart-only when the rest of the section is applied live
+RESTART_SUBKEYS = {'IMAGE_WRITER': ('WORKERS', 'QUEUE_SIZE')}
+
+
+def is_number(value):
+    # bool is a subclass of int, `true` is not a number
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_number(errors, name, value, low=None, high=None, above=None, integer=False):
+    """
+    Append an error to `errors` unless `value` is a number (an integer with `integer`) in [low, high] and
+    greater than `above`.
+    """
+    valid = is_number(value) and (not integer or isinstance(value, int))
+    if valid:
+        valid = (low is None or value >= low) and (high is None or value <= high) and (above is None or value > above)
+    if valid:
+        return
+    bounds = []
+    if above is not None:
+        bounds.append(f"above {above}")
+    if low is not None:
+        bounds.append(f"at least {low}")
+    if high is not None:
+        bounds.append(f"at most {high}")
+    errors.append(f"Check the config {name}, must be {'an integer' if integer else 'a number'}"
+                  + (f" {' and '.join(bounds)}" if bounds else ""))
+
+
+def check_section(errors, config, key):
+    """
+    The `key` mapping of the config ({} when it is missing), appending an error when it is not a mapping.
+    """
+    section = config.get(key)
+    if section is None:
+        return {}
+    if not isinstance(section, dict):
+        errors.append(f"Check the config {key}, must be a mapping")
+        return {}
+    return section
+
+
+def changed_keys(old, new):
+    """
+    Top-level keys whose value differs between two configs.
+    """
+    return sorted(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+
+
+class ConfigWatcher:
+    def __init__(self, path, config, validate):
+        """
+        `config` is the running config, `validate(config)` returns the list of errors of a candidate config.
+        """
+        self.path = path
+        self.config = config
+        self.validate = validate
+        self._stat = self._file_stat()
+        # Stat of the last rejected version, so the same error is not logged on every poll
+        self._rejected_stat = None
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def changed(self):
+        """
+        True when the file changed since the running config was loaded (and the change was not already rejected).
+        """
+        stat = self._file_stat()
+        return stat is not None and stat != self._stat and stat != self._rejected_stat
+
+    def poll(self):
+        """
+        Load the file if it changed. Returns (config, changed keys) for a valid new config, None otherwise.
+        Restart-only sections keep their running value in the returned config.
+        """
+        if not self.changed():
+            return None
+        stat = self._file_stat()
+        try:
+            with open(self.path, 'r') as f:
+                config = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError) as e:
+            return self._reject(stat, [f"unable to read the file: {e}"])
+        if not isinstance(config, dict):
+            return self._reject(stat, ["the file is not a mapping of config keys"])
+        try:
+            errors = self.validate(config)
+        except Exception as e:
+            # A config shape the validation did not expect is rejected like an invalid one
+            errors = [f"unable to validate the file: {e!r}"]
+        if errors:
+            return self._reject(stat, errors)
+
+        for key in RESTART_KEYS:
+            if config.get(key) != self.config.get(key):
+                print(f"Config: {key} changed, it is applied after a restart of the recorder")
+                if key in self.config:
+                    config[key] = self.config[key]
+                else:
+                    config.pop(key, None)
+        for key, subkeys in RESTART_SUBKEYS.items():
+            section, running = config.get(key) or {}, self.config.get(key) or {}
+            for subkey in subkeys:
+                if section.get(subkey) != running.get(subkey):
+                    print(f"Config: {key}.{subkey} changed, it is applied after a restart of the recorder")
+                    if subkey in running:
+                        section[subkey] = running[subkey]
+                    else:
+                        section.pop(subkey, None)
+            if section:
+                config[key] = section
+        if len(config['CAMERA_INDEXES']) != len(self.config['CAMERA_INDEXES']):
+            print("Config: the number of cameras changed, it is applied after a restart of the recorder")
+            config['CAMERA_INDEXES'] = self.config['CAMERA_INDEXES']
+        keys = changed_keys(self.config, config)
+        self._stat = stat
+        self._rejected_stat = None
+        self.config = config
+        return config, keys
+
+    def rollback(self, config):
+        """
+        Go back to the running `config` when a config returned by poll() could not be applied. The file is read
+        again on its next change.
+        """
+        self.config = config
+
+    def _reject(self, stat, errors):
+        self._rejected_stat = stat
+        print(f"Config: {self.path} changed but is invalid, keeping the running config:")
+        for error in errors:
+            print(f"  - {error}")
+        return None
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+METHOD_MAD = 'mad'  # mean absolute difference of a 64x36 grayscale copy, 0..255
+METHOD_DHASH = 'dhash'  # difference hash, number of different bits out of 64
+METHODS = (METHOD_MAD, METHOD_DHASH)
+
+MAD_SIZE = (64, 36)
+DHASH_SIZE = (9, 8)
+
+
+def signature(frame, method):
+    if method == METHOD_DHASH:
+        small = cv2.resize(frame, DHASH_SIZE, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # 8x8 bits: is each pixel brighter than its right neighbour
+        return gray[:, 1:] > gray[:, :-1]
+    small = cv2.resize(frame, MAD_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+def distance(a, b, method):
+    if method == METHOD_DHASH:
+        return int(np.count_nonzero(a != b))
+    return float(np.mean(np.abs(a - b)))
+
+
+class ChangeDetector:
+    """
+    Skips frames that are nearly identical to the last saved frame of the same camera (dawn, dusk, static scenes).
+
+    Each frame is reduced to a small grayscale signature and compared with the signature of the last frame that
+    was kept; frames closer than `threshold` are skipped. A frame is always kept after `keep_every` - 1 skips in a
+    row, so a camera never goes silent.
+    """
+
+    def __init__(self, num_cameras, method=METHOD_MAD, threshold=2.0, keep_every=6):
+        self.method = method
+        self.threshold = threshold
+        self.keep_every = keep_every
+        self._last = [None] * num_cameras
+        self._skipped_in_row = [0] * num_cameras
+        # Counters
+        self.kept = [0] * num_cameras
+        self.skipped = [0] * num_cameras
+        self.last_distance = [None] * num_cameras
+
+    @classmethod
+    def from_config(cls, config):
+        detection_config = config.get('CHANGE_DETECTION') or {}
+        if not detection_config.get('ENABLED', False):
+            return None
+        method = detection_config.get('METHOD', METHOD_MAD)
+        return cls(len(config['CAMERA_INDEXES']),
+                   method=method,
+                   threshold=detection_config.get('THRESHOLD', 4 if method == METHOD_DHASH else 2.0),
+                   keep_every=detection_config.get('KEEP_EVERY', 6))
+
+    def should_save(self, ix, frame):
+        current = signature(frame, self.method)
+        last = self._last[ix]
+        keep = True
+        if last is not None:
+            self.last_distance[ix] = distance(current, last, self.method)
+            forced = self._skipped_in_row[ix] + 1 >= self.keep_every
+            keep = forced or self.last_distance[ix] >= self.threshold
+
+        if keep:
+            self._last[ix] = current
+            self._skipped_in_row[ix] = 0
+            self.kept[ix] += 1
+        else:
+            self._skipped_in_row[ix] += 1
+            self.skipped[ix] += 1
+        return keep
+
+    def filter(self, frames):
+        """
+        Replace the frames that do not need to be saved by None.
+        """
+        return [
+            frame if frame is not None and self.should_save(ix, frame) else None
+            for ix, frame in enumerate(frames)
+        ]
+
+    def report(self, names):
+        parts = [
+            f"{name}: kept {kept} skipped {skipped}"
+            + (f" (diff {d:.2f})" if d is not None else "")
+            for name, kept, skipped, d in zip(names, self.kept, self.skipped, self.last_distance)
+        ]
+        print("Change detection: " + ", ".join(parts))
@@ -0,0 +1,74 @@
+import os
+
+import cv2
+
+
+class Derivative:
+    def __init__(self, name, width=None, quality=85, crop=None):
+        self.name = name
+        # Target width in pixels (height keeps the aspect ratio), None keeps the size
+        self.width = width
+        self.quality = quality
+        # Center crop as a fraction of the full frame, None for a resized copy of the whole frame
+        self.crop = crop
+
+    @classmethod
+    def from_config(cls, derivative_config):
+        return cls(name=derivative_config['NAME'],
+                   width=derivative_config.get('WIDTH'),
+                   quality=derivative_config.get('QUALITY', 85),
+                   crop=derivative_config.get('CROP'))
+
+
+def resize_to_width(image, width):
+    height, current_width = image.shape[:2]
+    if width is None or width >= current_width:
+        return image
+    return cv2.resize(image, (width, round(height * width / current_width)), interpolation=cv2.INTER_AREA)
+
+
+def center_crop(image, fraction):
+    # A view into `image`, nothing is copied
+    height, width = image.shape[:2]
+    crop_w, crop_h = round(width * fraction), round(height * fraction)
+    x, y = (width - crop_w) // 2, (height - crop_h) // 2
+    return image[y:y + crop_h, x:x + crop_w]
+
+
+def derivative_path(path, name):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{name}{ext}"
+
+
+class DerivativeSet:
+    """
+    Smaller copies of each captured frame (DERIVATIVES in config.yaml), written next to the original as
+    `<timestamp>_<NAME>.jpg`, so dashboards and labelling tools do not have to fetch and downscale the 4K image.
+
+    Resized derivatives are built as a pyramid: largest first, each one resized from the previous level instead
+    of the full frame. Crops are cut from the full frame.
+    """
+
+    def __init__(self, derivatives):
+        resized = [d for d in derivatives if d.crop is None]
+        self.pyramid = sorted(resized, key=lambda d: d.width or 0, reverse=True)
+        self.crops = [d for d in derivatives if d.crop is not None]
+
+    @classmethod
+    def from_config(cls, config):
+        derivatives = [Derivative.from_config(d) for d in config.get('DERIVATIVES') or []]
+        return cls(derivatives) if derivatives else None
+
+    def build(self, path, frame):
+        """
+        Returns a list of (name, path, image, quality) for every derivative of `frame` saved at `path`.
+        """
+        outputs = []
+        level = frame
+        for derivative in self.pyramid:
+            level = resize_to_width(level, derivative.width)
+            outputs.append((derivative.name, derivative_path(path, derivative.name), level, derivative.quality))
+        for derivative in self.crops:
+            image = resize_to_width(center_crop(frame, derivative.crop), derivative.width)
+            outputs.append((derivative.name, derivative_path(path, derivative.name), image, derivative.quality))
+        return outputs
@@ -0,0 +1,225 @@
+"""
+Fast camera discovery with stable device identities.
+
+Cameras are enumerated from sysfs (/sys/class/video4linux) and the udev links in /dev/v4l/by-id and
+/dev/v4l/by-path instead of opening indexes one by one with cv2.VideoCapture. Each node is probed with the
+VIDIOC_QUERYCAP / VIDIOC_ENUM_FMT ioctls (no stream is started), in parallel, and the metadata nodes UVC cameras
+expose next to the capture node are filtered out. The result is cached in ~/.cache and reused as long as the
+/dev/video* nodes did not change, so resolving a camera at startup takes milliseconds.
+
+In config.yaml, CAMERA_INDEXES entries can then be a stable ID instead of a raw index:
+    - "usb-046d_HD_Pro_Webcam_C920_A1B2C3D4-video-index0"   (a /dev/v4l/by-id name: follows the camera)
+    - "platform-fd500000.pcie-pci-0000:01:00.0-usb-0:1.2:1.0-video-index0"   (by-path: follows the USB port)
+
+    python3 discovery.py   lists the cameras and their IDs
+"""
+import fcntl
+import glob
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+SYSFS_DIR = '/sys/class/video4linux'
+BY_ID_DIR = '/dev/v4l/by-id'
+BY_PATH_DIR = '/dev/v4l/by-path'
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'aiseed-cameras.json')
+
+# linux/videodev2.h
+VIDIOC_QUERYCAP = 0x80685600  # _IOR('V', 0, struct v4l2_capability)
+VIDIOC_ENUM_FMT = 0xc0405602  # _IOWR('V', 2, struct v4l2_fmtdesc)
+VIDIOC_ENUM_FRAMESIZES = 0xc02c564a  # _IOWR('V', 74, struct v4l2_frmsizeenum)
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_META_CAPTURE = 0x00800000
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+
+CAPABILITY = struct.Struct('<16s32s32sIII12x')
+FMTDESC = struct.Struct('<III32sII12x')
+FRMSIZE = struct.Struct('<IIIII16x8x')
+
+
+def _links(directory):
+    # /dev/videoN -> [link names]
+    links = {}
+    for path in glob.glob(os.path.join(directory, '*')):
+        links.setdefault(os.path.realpath(path), []).append(os.path.basename(path))
+    return links
+
+
+def _read_sysfs(node, attribute):
+    try:
+        with open(os.path.join(SYSFS_DIR, node, attribute), 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _usb_path(node):
+    # /sys/devices/.../usb1/1-1/1-1.2/1-1.2:1.0 -> 1-1.2:1.0
+    device = os.path.realpath(os.path.join(SYSFS_DIR, node, 'device'))
+    return os.path.basename(device) if ':' in os.path.basename(device) else None
+
+
+def _fourcc(value):
+    return struct.pack('<I', value).decode('ascii', errors='replace').strip()
+
+
+def query_device(devnode):
+    """
+    Capabilities and capture formats of a V4L2 node. Returns None if the node can not be opened.
+    """
+    try:
+        fd = os.open(devnode, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        buf = bytearray(CAPABILITY.size)
+        fcntl.ioctl(fd, VIDIOC_QUERYCAP, buf)
+        driver, card, bus_info, _, capabilities, device_caps = CAPABILITY.unpack(buf)
+        caps = device_caps if capabilities & V4L2_CAP_DEVICE_CAPS else capabilities
+        info = {
+            'driver': driver.rstrip(b'\0').decode(errors='replace'),
+            'card': card.rstrip(b'\0').decode(errors='replace'),
+            'bus_info': bus_info.rstrip(b'\0').decode(errors='replace'),
+            'capture': bool(caps & V4L2_CAP_VIDEO_CAPTURE) and not caps & V4L2_CAP_META_CAPTURE,
+            'formats': {},
+        }
+        if info['capture']:
+            info['formats'] = _enum_formats(fd)
+        return info
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def _enum_formats(fd):
+    formats = {}
+    for index in range(64):
+        buf = bytearray(FMTDESC.pack(index, V4L2_BUF_TYPE_VIDEO_CAPTURE, 0, b'', 0, 0))
+        try:
+            fcntl.ioctl(fd, VIDIOC_ENUM_FMT, buf)
+        except OSError:
+            break
+        pixelformat = FMTDESC.unpack(buf)[4]
+        sizes = []
+        for size_index in range(64):
+            size_buf = bytearray(FRMSIZE.pack(size_index, pixelformat, 0, 0, 0))
+            try:
+                fcntl.ioctl(fd, VIDIOC_ENUM_FRAMESIZES, size_buf)
+            except OSError:
+                break
+            _, _, size_type, width, height = FRMSIZE.unpack(size_buf)
+            if size_type != V4L2_FRMSIZE_TYPE_DISCRETE:
+                break
+            sizes.append(f"{width}x{height}")
+        formats[_fourcc(pixelformat)] = sizes
+    return formats
+
+
+def _video_nodes():
+    # videoN entries of sysfs (the /dev nodes when sysfs is not mounted), in index order
+    try:
+        names = os.listdir(SYSFS_DIR)
+    except OSError:
+        names = [os.path.basename(path) for path in glob.glob('/dev/video*')]
+    names = [name for name in names if name.startswith('video') and name[len('video'):].isdigit()]
+    return [f"/dev/{name}" for name in sorted(names, key=lambda name: int(name[len('video'):]))]
+
+
+def _fingerprint(nodes):
+    # Changes whenever a /dev/video* node or a /dev/v4l link is added, removed or re-created
+    parts = []
+    for path in sorted(nodes + glob.glob(os.path.join(BY_ID_DIR, '*')) + glob.glob(os.path.join(BY_PATH_DIR, '*'))):
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        parts.append(f"{path}:{st.st_rdev}:{st.st_ctime_ns}")
+    return '|'.join(parts)
+
+
+def discover_cameras(use_cache=True, cache_file=CACHE_FILE):
+    """
+    List of the capture cameras: dicts with devnode, name, index, usb_path, by_id, by_path, card, formats.
+    """
+    nodes = _video_nodes()
+    fingerprint = _fingerprint(nodes)
+    if use_cache:
+        try:
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+            if cache.get('fingerprint') == fingerprint:
+                return cache['cameras']
+        except (OSError, ValueError):
+            pass
+
+    by_id = _links(BY_ID_DIR)
+    by_path = _links(BY_PATH_DIR)
+    with ThreadPoolExecutor(max_workers=max(len(nodes), 1)) as executor:
+        infos = list(executor.map(query_device, nodes))
+
+    cameras = []
+    for devnode, info in zip(nodes, infos):
+        if info is None or not info['capture']:
+            continue
+        node = os.path.basename(devnode)
+        cameras.append({
+            'devnode': devnode,
+            'index': int(node[len('video'):]),
+            'name': _read_sysfs(node, 'name'),
+            'usb_path': _usb_path(node),
+            'by_id': by_id.get(devnode, []),
+            'by_path': by_path.get(devnode, []),
+            'card': info['card'],
+            'bus_info': info['bus_info'],
+            'formats': info['formats'],
+        })
+
+    if use_cache:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp_file = f"{cache_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({'fingerprint': fingerprint, 'cameras': cameras}, f)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"Unable to write the camera cache {cache_file}: {e}")
+    return cameras
+
+
+def resolve_camera(camera_id, cameras=None):
+    """
+    Device node of a CAMERA_INDEXES entry: a raw index (returned as is), a /dev path or a by-id / by-path name.
+    Returns None when no connected camera matches the ID.
+    """
+    if isinstance(camera_id, int):
+        return camera_id
+    if camera_id.startswith('/dev/'):
+        return os.path.realpath(camera_id) if os.path.exists(camera_id) else None
+    if cameras is None:
+        cameras = discover_cameras()
+    for camera in cameras:
+        if camera_id in camera['by_id'] or camera_id in camera['by_path']:
+            return camera['devnode']
+    return None
+
+
+def main():
+    cameras = discover_cameras(use_cache=False)
+    if not cameras:
+        print("No cameras detected.")
+    for camera in cameras:
+        print(f"{camera['devnode']}  {camera['card']}  (usb {camera['usb_path']})")
+        for link in camera['by_id']:
+            print(f"    by-id:   {link}")
+        for link in camera['by_path']:
+            print(f"    by-path: {link}")
+        for fourcc, sizes in camera['formats'].items():
+            print(f"    {fourcc}: {', '.join(sizes)}")
+
+
+if __name__ == '__main__':
+    main()
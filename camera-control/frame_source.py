@@ -0,0 +1,178 @@
+"""
+Frame sources behind CameraSession. They all follow the part of the cv2.VideoCapture interface the recorder uses
+(isOpened, set, get, grab, retrieve, read, release), so the capture pipeline can run without USB cameras:
+
+- v4l2: the real camera (cv2.VideoCapture), by index or by stable ID (see discovery.py)
+- synthetic: generated frames of the configured resolution at a target rate
+- replay: the JPEGs of a directory, in name order, looped
+"""
+import glob
+import os
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+from discovery import resolve_camera
+
+SOURCE_V4L2 = 'v4l2'
+SOURCE_SYNTHETIC = 'synthetic'
+SOURCE_REPLAY = 'replay'
+SOURCE_TYPES = (SOURCE_V4L2, SOURCE_SYNTHETIC, SOURCE_REPLAY)
+
+
+class FrameSource:
+    def __init__(self, width=1280, height=720, fps=30):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._opened = True
+        self._next_frame_at = None
+        self._grabbed = False
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self.width = int(value)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self.height = int(value)
+        elif prop == cv2.CAP_PROP_FPS:
+            self.fps = value
+        else:
+            return False
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def _wait_for_frame(self):
+        # Pace the frames like a camera running at `fps`
+        now = time.monotonic()
+        if self.fps and self._next_frame_at is not None and now < self._next_frame_at:
+            time.sleep(self._next_frame_at - now)
+            now = self._next_frame_at
+        self._next_frame_at = now + (1.0 / self.fps if self.fps else 0)
+
+    def grab(self):
+        if not self._opened:
+            return False
+        self._wait_for_frame()
+        self._grabbed = self._advance()
+        return self._grabbed
+
+    def retrieve(self):
+        if not self._grabbed:
+            return False, None
+        frame = self._frame()
+        return frame is not None, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self._opened = False
+
+    def _advance(self):
+        raise NotImplementedError
+
+    def _frame(self):
+        raise NotImplementedError
+
+
+class SyntheticSource(FrameSource):
+    """
+    A fixed noise pattern with a bright bar moving across it, so consecutive frames differ and do not compress to
+    nothing.
+    """
+
+    def __init__(self, width=1280, height=720, fps=30, seed=0):
+        super().__init__(width, height, fps)
+        self.seed = seed
+        self.frame_number = 0
+        self._base = None
+
+    def _advance(self):
+        self.frame_number += 1
+        return True
+
+    def _frame(self):
+        if self._base is None or self._base.shape[:2] != (self.height, self.width):
+            rng = np.random.default_rng(self.seed)
+            gradient = np.linspace(0, 200, self.width, dtype=np.float32)[None, :, None]
+            noise = rng.integers(0, 56, (self.height, self.width, 3), dtype=np.uint8)
+            self._base = (gradient + noise).astype(np.uint8)
+        frame = self._base.copy()
+        bar = max(self.width // 32, 1)
+        x = (self.frame_number * bar) % self.width
+        frame[:, x:x + bar] = 255
+        return frame
+
+
+class ReplaySource(FrameSource):
+    """
+    Plays the JPEG/PNG files of `directory` in name order, looping at the end. Frames are resized to the
+    requested resolution when it differs.
+    """
+
+    def __init__(self, directory, width=None, height=None, fps=0):
+        super().__init__(width, height, fps)
+        self.files = sorted(
+            path for pattern in ('*.jpg', '*.jpeg', '*.png')
+            for path in glob.glob(os.path.join(os.path.expanduser(directory), pattern))
+        )
+        self._opened = bool(self.files)
+        self._position = -1
+
+    def _advance(self):
+        self._position = (self._position + 1) % len(self.files)
+        return True
+
+    def _frame(self):
+        frame = cv2.imread(self.files[self._position])
+        if frame is not None and self.width and self.height and frame.shape[:2] != (self.height, self.width):
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        return frame
+
+
+def open_v4l2(camera_id):
+    """
+    cv2.VideoCapture of a CAMERA_INDEXES entry. Stable IDs are resolved again on every open, so a camera that was
+    re-plugged under another /dev/videoN is found on the next cycle.
+    """
+    device = resolve_camera(camera_id)
+    if device is None:
+        print(f"Error: no connected camera matches {camera_id}")
+        return cv2.VideoCapture()
+    if isinstance(device, str):
+        return cv2.VideoCapture(device, cv2.CAP_V4L2)
+    return cv2.VideoCapture(device)
+
+
+def source_factory(config):
+    """
+    Callable opening the frame source of a camera index, from CAMERA_SOURCE in config.yaml (v4l2 by default).
+    """
+    source_config = config.get('CAMERA_SOURCE') or {}
+    source_type = source_config.get('TYPE', SOURCE_V4L2)
+    if source_type == SOURCE_SYNTHETIC:
+        return lambda camera_index: SyntheticSource(fps=source_config.get('FPS', 30),
+                                                    seed=zlib.crc32(str(camera_index).encode()))
+    if source_type == SOURCE_REPLAY:
+        directory = source_config['DIRECTORY']
+        # One sub-directory per camera index when they exist, otherwise all cameras replay the same files
+        return lambda camera_index: ReplaySource(
+            os.path.join(directory, str(camera_index))
+            if os.path.isdir(os.path.join(os.path.expanduser(directory), str(camera_index))) else directory,
+            fps=source_config.get('FPS', 0))
+    return open_v4l2
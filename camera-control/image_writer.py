@@ -0,0 +1,218 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from metrics import registry as metrics
+from catalog import STATUS_WRITING, STATUS_WRITTEN, STATUS_FAILED
+
+
+class WriteJob:
+    def __init__(self, path, frame, quality, camera='', captured_at=None):
+        self.path = path
+        self.frame = frame
+        self.quality = quality
+        # Label of the camera in the metrics and the catalog
+        self.camera = camera
+        # Epoch seconds
+        self.captured_at = captured_at if captured_at is not None else time.time()
+
+
+class ImageWriter:
+    """
+    Write-behind JPEG writer.
+
+    The capture loop only puts frames on a bounded queue; dedicated threads do the JPEG encode and the (slow) write
+    to the CIFS share. Each image is written to a hidden temp file and renamed in place, so the host never sees a
+    half-written JPEG. With a `sink` (sinks.py) the encoded images are handed to it instead: the share through the
+    spool, or an HTTP upload. With `derivatives` the smaller copies of each frame are built and written by the same
+    threads. With `regions` (roi.py) only the regions of interest of the cameras that have some are written. With a
+    `catalog` every written image is recorded in it.
+    """
+
+    def __init__(self, num_workers=2, queue_size=8, jpeg_quality=95, put_timeout=30, sink=None, derivatives=None,
+                 catalog=None, regions=None):
+        self.jpeg_quality = jpeg_quality
+        self.sink = sink
+        self.catalog = catalog
+        self.derivatives = derivatives
+        self.regions = regions
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Counters
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.last_write_latency = 0.0
+        self.max_write_latency = 0.0
+        self.total_write_latency = 0.0
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f'image-writer-{i}', daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @classmethod
+    def from_config(cls, config, sink=None, derivatives=None, catalog=None, regions=None):
+        writer_config = config.get('IMAGE_WRITER') or {}
+        return cls(num_workers=writer_config.get('WORKERS', 2),
+                   queue_size=writer_config.get('QUEUE_SIZE', 8),
+                   jpeg_quality=writer_config.get('JPEG_QUALITY', 95),
+                   put_timeout=writer_config.get('PUT_TIMEOUT', 30),
+                   sink=sink,
+                   derivatives=derivatives,
+                   catalog=catalog,
+                   regions=regions)
+
+    def submit(self, path, frame, quality=None, camera='', captured_at=None):
+        """
+        Queue a frame to be written to `path`. Blocks up to `put_timeout` seconds when the queue is full, then drops
+        the frame. Returns False if the frame was dropped.
+        """
+        if self._closed:
+            raise RuntimeError("ImageWriter is closed")
+        job = WriteJob(path, frame, self.jpeg_quality if quality is None else quality, camera, captured_at)
+        try:
+            self.queue.put(job, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            metrics.inc('aiseed_capture_failures_total', camera=camera, stage='queue')
+            print(f"Error: write queue full, dropped {path}")
+            return False
+        return True
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(job)
+            finally:
+                self.queue.task_done()
+
+    def _write(self, job):
+        camera_regions = self.regions.get(job.camera) if self.regions is not None else None
+        if camera_regions is not None:
+            # The regions and the small context frame replace the full frame and its derivatives
+            for name, path, image, quality in camera_regions.build(job.path, job.frame, job.quality):
+                self._write_image(path, image, quality, job, variant=name)
+            return
+        self._write_image(job.path, job.frame, job.quality, job)
+        if self.derivatives is not None:
+            try:
+                outputs = self.derivatives.build(job.path, job.frame)
+            except cv2.error as e:
+                print(f"Error: unable to build the derivatives of {job.path}: {e}")
+                return
+            for name, path, image, quality in outputs:
+                self._write_image(path, image, quality, job, variant=name)
+
+    def _write_image(self, path, image, quality, job, variant=''):
+        camera = job.camera
+        start = time.monotonic()
+        stage = 'encode'
+        try:
+            ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                raise ValueError("JPEG encoding failed")
+            encoded = time.monotonic()
+            metrics.observe('aiseed_capture_stage_seconds', encoded - start, camera=camera, stage='encode')
+            stage = 'write'
+            if self.catalog is not None:
+                # Recorded before the write, so the status changes reported later by the sink find the row
+                height, width = image.shape[:2]
+                self.catalog.add(camera, job.captured_at, path, len(buffer), width, height, STATUS_WRITING, variant)
+            if self.sink is not None:
+                status = self.sink.write(path, buffer)
+            else:
+                write_atomic(path, buffer)
+                status = STATUS_WRITTEN
+            metrics.observe('aiseed_capture_stage_seconds', time.monotonic() - encoded, camera=camera, stage='write')
+        except (OSError, ValueError, cv2.error) as e:
+            with self._lock:
+                self.failed += 1
+            metrics.inc('aiseed_capture_failures_total', camera=camera, stage=stage)
+            if self.catalog is not None and stage == 'write':
+                self.catalog.update_status(path, STATUS_FAILED)
+            print(f"Error: unable to write {path}: {e}")
+            return
+
+        metrics.inc('aiseed_bytes_written_total', len(buffer), camera=camera)
+        if self.catalog is not None:
+            self.catalog.update_status(path, status, only_from=STATUS_WRITING)
+        latency = time.monotonic() - start
+        with self._lock:
+            self.written += 1
+            self.bytes_written += len(buffer)
+            self.last_write_latency = latency
+            self.max_write_latency = max(self.max_write_latency, latency)
+            self.total_write_latency += latency
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'written': self.written,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'bytes_written': self.bytes_written,
+                'last_write_latency': self.last_write_latency,
+                'avg_write_latency': self.total_write_latency / self.written if self.written else 0.0,
+                'max_write_latency': self.max_write_latency,
+            }
+
+    def report(self):
+        s = self.stats()
+        print(f"Image writer: queue {s['queue_depth']}, written {s['written']}, failed {s['failed']}, "
+              f"dropped {s['dropped']}, write latency last {s['last_write_latency']:.3f}s "
+              f"avg {s['avg_write_latency']:.3f}s max {s['max_write_latency']:.3f}s")
+
+    def close(self):
+        """
+        Flush every queued frame to disk and stop the writer threads.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        pending = self.queue.qsize()
+        if pending:
+            print(f"Image writer: flushing {pending} queued frames")
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self.report()
+
+
+def write_atomic(path, data):
+    """
+    Write `data` to a hidden temp file next to `path` and rename it into place. The directory is created the first
+    time a write into it fails, so the usual write costs no extra stat/mkdir round trip to the share.
+    """
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    try:
+        try:
+            f = open(tmp_path, 'wb')
+        except FileNotFoundError:
+            os.makedirs(directory, exist_ok=True)
+            f = open(tmp_path, 'wb')
+        with f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,100 @@
+"""
+Reference ingestion server for the HTTP sink (SINK.TYPE: http), to run on the host PC or to test locally.
+
+Each POST to /ingest is a multipart batch: the images as file parts (the file name is the path relative to the
+camera folders root) and a `manifest` form field listing the key, path, size and sha256 of each image. The images
+are checked against the manifest and written atomically under --root. The keys already stored are answered as
+duplicates without writing anything, so a retried batch is harmless.
+
+    python3 ingest_server.py --root ~/ingest --port 8090 [--token SECRET]
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+app.config['ROOT'] = os.path.expanduser('~/ingest')
+app.config['TOKEN'] = None
+# Idempotency keys already stored (the files on disk cover the restarts of the server)
+stored_keys = set()
+
+
+def target_path(rel_path):
+    # Refuse absolute paths and paths escaping the root
+    root = os.path.realpath(app.config['ROOT'])
+    path = os.path.realpath(os.path.join(root, rel_path))
+    if os.path.isabs(rel_path) or not path.startswith(root + os.sep):
+        return None
+    return path
+
+
+def write_atomic(path, data):
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@app.route('/ingest', methods=['POST'])
+def ingest():
+    if app.config['TOKEN'] and request.headers.get('Authorization') != f"Bearer {app.config['TOKEN']}":
+        return jsonify(error="unauthorized"), 401
+    try:
+        manifest = json.loads(request.form['manifest'])
+    except (KeyError, ValueError):
+        return jsonify(error="missing or invalid manifest"), 400
+    files = {part.filename: part for part in request.files.values()}
+
+    stored, duplicates, rejected, corrupted = [], [], [], []
+    for entry in manifest:
+        key, rel_path = entry.get('key'), entry.get('path')
+        path = target_path(rel_path or '')
+        if not key or path is None:
+            rejected.append(key)
+            continue
+        data = files[rel_path].read() if rel_path in files else b''
+        if len(data) != entry.get('size') or hashlib.sha256(data).hexdigest() != entry.get('sha256'):
+            corrupted.append(key)
+            continue
+        if key in stored_keys or (os.path.exists(path) and os.path.getsize(path) == len(data)):
+            stored_keys.add(key)
+            duplicates.append(key)
+            continue
+        write_atomic(path, data)
+        stored_keys.add(key)
+        stored.append(key)
+
+    if rejected:
+        # Invalid paths: the sink drops the batch
+        return jsonify(stored=stored, duplicates=duplicates, rejected=rejected), 422
+    if corrupted:
+        # Damaged in transit: the sink sends the whole batch again (the stored images are then duplicates)
+        return jsonify(stored=stored, duplicates=duplicates, corrupted=corrupted), 409
+    return jsonify(stored=stored, duplicates=duplicates)
+
+
+@app.route('/health')
+def health():
+    return jsonify(status="ok", images=len(stored_keys))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default='~/ingest', help="directory the images are written to")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--token', default=None, help="required Bearer token")
+    args = parser.parse_args()
+    app.config['ROOT'] = os.path.expanduser(args.root)
+    app.config['TOKEN'] = args.token
+    os.makedirs(app.config['ROOT'], exist_ok=True)
+    app.run(args.host, args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
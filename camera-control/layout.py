@@ -0,0 +1,163 @@
+"""
+Storage layout of the captured images: PATH_TEMPLATE in config.yaml, relative to the home directory.
+
+    {camera}/{timestamp}.jpg                    flat, the original layout (<camera>/2024-05-01-12-00-00.jpg)
+    {camera}/{YYYY}/{MM}/{DD}/{HHMMSS}.jpg      one folder per day (<camera>/2024/05/01/120000.jpg)
+
+Fields: {camera} (a CAMERAS_NAME entry, must come first), {YYYY} {MM} {DD} {HH} {MIN} {SS} {HHMMSS} {date}
+(2024-05-01) and {timestamp} (2024-05-01-12-00-00). Derivatives are saved next to the image as
+`<stem>_<NAME>.jpg` whatever the template.
+"""
+import datetime
+import os
+import re
+import string
+from functools import lru_cache
+
+DEFAULT_TEMPLATE = '{camera}/{timestamp}.jpg'
+CAMERA_PREFIX = '{camera}/'
+
+# field -> (strftime format, regex of its value, datetime components it holds)
+FIELDS = {
+    'YYYY': ('%Y', r'\d{4}', ('year',)),
+    'MM': ('%m', r'\d{2}', ('month',)),
+    'DD': ('%d', r'\d{2}', ('day',)),
+    'HH': ('%H', r'\d{2}', ('hour',)),
+    'MIN': ('%M', r'\d{2}', ('minute',)),
+    'SS': ('%S', r'\d{2}', ('second',)),
+    'HHMMSS': ('%H%M%S', r'\d{6}', ('hour', 'minute', 'second')),
+    'date': ('%Y-%m-%d', r'\d{4}-\d{2}-\d{2}', ('year', 'month', 'day')),
+    'timestamp': ('%Y-%m-%d-%H-%M-%S', r'\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2}',
+                  ('year', 'month', 'day', 'hour', 'minute', 'second')),
+}
+TIME_FIELDS = ('HH', 'MIN', 'SS', 'HHMMSS', 'timestamp')
+
+
+def template_errors(template):
+    """
+    List of the errors of a PATH_TEMPLATE (empty when it is valid).
+    """
+    if not template.startswith(CAMERA_PREFIX):
+        return [f"Check the config PATH_TEMPLATE, must start with {CAMERA_PREFIX}"]
+    try:
+        names = [name for _, name, _, _ in string.Formatter().parse(template[len(CAMERA_PREFIX):]) if name]
+    except ValueError as e:
+        return [f"Check the config PATH_TEMPLATE: {e}"]
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        return [f"Check the config PATH_TEMPLATE, unknown fields {unknown}, must be in {list(FIELDS)}"]
+    if len(names) != len(set(names)):
+        return ["Check the config PATH_TEMPLATE, a field is used twice"]
+    if not {'date', 'timestamp'} & set(names) and not {'YYYY', 'MM', 'DD'} <= set(names):
+        return ["Check the config PATH_TEMPLATE, the path must hold the date ({YYYY}/{MM}/{DD}, {date} or {timestamp})"]
+    if not {'timestamp', 'HHMMSS'} & set(names) and not {'HH', 'MIN', 'SS'} <= set(names):
+        return ["Check the config PATH_TEMPLATE, the path must hold the time ({HHMMSS}, {HH}{MIN}{SS} or {timestamp})"]
+    return []
+
+
+class StorageLayout:
+    def __init__(self, template=DEFAULT_TEMPLATE):
+        self.template = template
+        # Part relative to the camera folder
+        self.camera_template = template[len(CAMERA_PREFIX):]
+        self._fields = [name for _, name, _, _ in string.Formatter().parse(self.camera_template) if name]
+        self._regex = self._build_regex()
+
+    @classmethod
+    def from_config(cls, config):
+        return get_layout(config.get('PATH_TEMPLATE') or DEFAULT_TEMPLATE)
+
+    def _build_regex(self):
+        stem, ext = os.path.splitext(self.camera_template)
+        pattern = ''
+        for literal, name, _, _ in string.Formatter().parse(stem):
+            pattern += re.escape(literal)
+            if name:
+                pattern += f"(?P<{name}>{FIELDS[name][1]})"
+        return re.compile(f"^{pattern}(?P<derivative>_[^/]+)?{re.escape(ext)}$")
+
+    def _format(self, moment, wildcard_time=False):
+        values = {name: moment.strftime(FIELDS[name][0]) for name in self._fields}
+        if wildcard_time:
+            # Glob of any time of the day
+            values.update({name: '*' for name in self._fields if name in TIME_FIELDS})
+            if 'timestamp' in values:
+                values['timestamp'] = moment.strftime('%Y-%m-%d-*')
+        return self.camera_template.format(**values)
+
+    def relative_path(self, moment):
+        """
+        Path of an image captured at `moment`, relative to its camera folder.
+        """
+        return self._format(moment)
+
+    def path(self, current_dir, camera, moment):
+        return os.path.join(current_dir, camera, self.relative_path(moment))
+
+    def day_pattern(self, camera_dir, date):
+        """
+        Glob pattern of the images (and derivatives) of one day in a camera folder.
+        """
+        stem, ext = os.path.splitext(self._format(datetime.datetime.combine(date, datetime.time()), True))
+        return os.path.join(camera_dir, f"{stem}*{ext}")
+
+    def parse(self, rel_path):
+        """
+        Capture time of a path relative to the camera folder, None when it does not follow the layout.
+        """
+        match = self._regex.match(rel_path.replace(os.sep, '/'))
+        if match is None:
+            return None
+        components = {}
+        for name, value in match.groupdict().items():
+            if name == 'derivative' or value is None:
+                continue
+            fmt, _, fields = FIELDS[name]
+            try:
+                parsed = datetime.datetime.strptime(value, fmt)
+            except ValueError:
+                return None
+            components.update({field: getattr(parsed, field) for field in fields})
+        try:
+            return datetime.datetime(**components)
+        except (TypeError, ValueError):
+            return None
+
+    def derivative_suffix(self, rel_path):
+        # `_<NAME>` of a derivative `<stem>_<NAME>.jpg`, None for an image
+        match = self._regex.match(rel_path.replace(os.sep, '/'))
+        return None if match is None else match.group('derivative')
+
+    def is_derivative(self, rel_path):
+        return self.derivative_suffix(rel_path) is not None
+
+    def rehome(self, rel_path, moment, source):
+        """
+        Path in this layout of an image (or derivative) at `rel_path` in the `source` layout.
+        """
+        stem, ext = os.path.splitext(self.relative_path(moment))
+        return f"{stem}{source.derivative_suffix(rel_path) or ''}{ext}"
+
+    def walk(self, camera_dir):
+        """
+        (relative path, capture time) of the images and derivatives following the layout in a camera folder.
+        """
+        depth = self.camera_template.count('/')
+        for root, dirs, files in os.walk(camera_dir):
+            rel_root = os.path.relpath(root, camera_dir)
+            level = 0 if rel_root == '.' else rel_root.count(os.sep) + 1
+            if level >= depth:
+                # No deeper folders in the layout (e.g. packs/)
+                dirs[:] = []
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                rel_path = name if rel_root == '.' else os.path.join(rel_root, name)
+                moment = self.parse(rel_path)
+                if moment is not None:
+                    yield rel_path, moment
+
+
+@lru_cache(maxsize=8)
+def get_layout(template):
+    return StorageLayout(template)
@@ -0,0 +1,115 @@
+"""
+Capture pipeline metrics (latency histograms, counters, gauges) in the Prometheus text format.
+
+The recorder records into the module-level `registry` from the hot path and writes the rendered text to
+METRICS_PATH (tmpfs) once per cycle; the API serves that file on /api/metrics.
+"""
+import os
+import threading
+from bisect import bisect_left
+
+METRICS_PATH = '/dev/shm/aiseed-recorder.prom' if os.path.isdir('/dev/shm') \
+    else os.path.join(os.path.expanduser('~'), '.aiseed-recorder.prom')
+
+# Seconds, from a reused camera grab to a stalled SMB write
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+DESCRIPTIONS = {
+    'aiseed_capture_stage_seconds': 'Latency of each capture pipeline stage per camera',
+    'aiseed_frames_captured_total': 'Frames read from the camera',
+    'aiseed_bytes_written_total': 'JPEG bytes written (originals and derivatives)',
+    'aiseed_capture_failures_total': 'Failures per camera and stage',
+    'aiseed_write_queue_depth': 'Frames waiting in the write-behind queue',
+    'aiseed_cycle_duration_seconds': 'Duration of the last capture cycle',
+    'aiseed_upload_seconds': 'Latency of the HTTP sink batch uploads',
+    'aiseed_bytes_uploaded_total': 'JPEG bytes uploaded by the HTTP sink',
+    'aiseed_upload_failures_total': 'Failed HTTP sink uploads (error: retried or kept, rejected: dropped)',
+    'aiseed_outbox_files': 'Images waiting in the HTTP sink outbox',
+    'aiseed_motion_score': 'Last motion score per camera (fraction of the watched pixels that changed)',
+    'aiseed_motion_events_total': 'Motion-triggered captures per camera',
+    'aiseed_missed_ticks': 'Capture ticks missed because a cycle overran, since the recorder started',
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, ((label, value), ...)) -> Histogram / float
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for kind, series in (('histogram', self._histograms), ('counter', self._counters),
+                                 ('gauge', self._gauges)):
+                seen = set()
+                for (name, labels), value in sorted(series.items()):
+                    if name not in seen:
+                        seen.add(name)
+                        lines.append(f'# HELP {name} {DESCRIPTIONS.get(name, name)}')
+                        lines.append(f'# TYPE {name} {kind}')
+                    if kind != 'histogram':
+                        lines.append(f'{name}{_labels(labels)} {value}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels, ("le", bound))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {value.sum}')
+                    lines.append(f'{name}_count{_labels(labels)} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path=METRICS_PATH):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,96 @@
+"""
+One-shot move of the images already saved to another storage layout (PATH_TEMPLATE, see layout.py), e.g. from the
+flat camera folders to one folder per day:
+
+    python3 migrate_layout.py --to "{camera}/{YYYY}/{MM}/{DD}/{HHMMSS}.jpg" --dry-run
+    python3 migrate_layout.py --to "{camera}/{YYYY}/{MM}/{DD}/{HHMMSS}.jpg"
+
+Stop the recorder first, and set the same PATH_TEMPLATE in config.yaml afterwards. The images are renamed in place
+(a rename on the share, nothing is copied), each target folder is created once, and the source folders left empty
+are removed. Files not following the source layout (and the packs/ folder) are left alone.
+"""
+import argparse
+import os
+import sys
+
+import yaml
+
+from layout import StorageLayout, DEFAULT_TEMPLATE, template_errors
+
+
+def migrate_camera(camera_dir, source, target, dry_run=False):
+    """
+    Move the images of one camera folder from the `source` to the `target` layout. Returns (moved, skipped).
+    """
+    moved = skipped = 0
+    created = set()
+    source_dirs = set()
+    for rel_path, moment in list(source.walk(camera_dir)):
+        new_rel_path = target.rehome(rel_path, moment, source)
+        if new_rel_path == rel_path:
+            continue
+        path = os.path.join(camera_dir, rel_path)
+        new_path = os.path.join(camera_dir, new_rel_path)
+        directory = os.path.dirname(new_path)
+        if dry_run:
+            if moved < 5:
+                print(f"  {rel_path} -> {new_rel_path}")
+            moved += 1
+            continue
+        if directory not in created:
+            os.makedirs(directory, exist_ok=True)
+            created.add(directory)
+        if os.path.exists(new_path):
+            print(f"  {new_rel_path} already exists, {rel_path} is left in place")
+            skipped += 1
+            continue
+        os.rename(path, new_path)
+        source_dirs.add(os.path.dirname(path))
+        moved += 1
+        if moved % 1000 == 0:
+            print(f"  {moved} images moved")
+
+    for directory in sorted(source_dirs, reverse=True):
+        if directory != camera_dir and directory not in created:
+            try:
+                os.removedirs(directory)
+            except OSError:
+                pass
+    return moved, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='config.yaml', help="config.yaml with CAMERAS_NAME")
+    parser.add_argument('--from', dest='source', default=DEFAULT_TEMPLATE, help="current PATH_TEMPLATE")
+    parser.add_argument('--to', dest='target', default=None, help="new PATH_TEMPLATE (default: the one of --config)")
+    parser.add_argument('--home', default='~', help="folder the camera folders are relative to")
+    parser.add_argument('--dry-run', action='store_true', help="only count the images to move")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    target_template = args.target or config.get('PATH_TEMPLATE') or DEFAULT_TEMPLATE
+    errors = template_errors(args.source) + template_errors(target_template)
+    if errors:
+        for error in errors:
+            print(error)
+        sys.exit(1)
+    source, target = StorageLayout(args.source), StorageLayout(target_template)
+    if source.template == target.template:
+        print("The source and target layouts are the same, nothing to do")
+        return
+
+    home = os.path.expanduser(args.home)
+    for name in config['CAMERAS_NAME']:
+        camera_dir = os.path.join(home, name)
+        if not os.path.isdir(camera_dir):
+            print(f"{camera_dir}: not found, skipped")
+            continue
+        print(f"{camera_dir}: {source.template} -> {target.template}")
+        moved, skipped = migrate_camera(camera_dir, source, target, args.dry_run)
+        print(f"{camera_dir}: {moved} images {'to move' if args.dry_run else 'moved'}, {skipped} skipped")
+
+
+if __name__ == '__main__':
+    main()
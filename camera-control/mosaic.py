@@ -0,0 +1,120 @@
+import math
+import time
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+TEXT_WHITE = (255, 255, 255)
+TEXT_RED = (0, 0, 255)
+
+
+def _centered_x(width, text):
+    return int((width - cv2.getTextSize(text, FONT, FONT_SCALE, 1)[0][0]) / 2)
+
+
+class MosaicEngine:
+    """
+    Composes the frames of several cameras into one `columns`-wide grid.
+
+    The grid is one preallocated canvas and every tile is a view into it, so frames are resized straight into
+    place (no hstack/vstack copies of the growing mosaic). Static overlays (camera names, error tiles, the blank
+    filler tile) are rendered once and cached; only the clock and the CPU temperature on the filler tile are
+    redrawn, and only when their text changes.
+    """
+
+    def __init__(self, names, tile_width, tile_height, columns=2, temperature_func=None, temperature_interval=30,
+                 blank_text="Press `q` to close the program"):
+        self.names = names
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.columns = columns
+        self.rows = max(math.ceil(len(names) / columns), 1)
+        self.temperature_func = temperature_func
+        self.temperature_interval = temperature_interval
+
+        self.canvas = np.zeros((self.rows * tile_height, columns * tile_width, 3), np.uint8)
+        self.tiles = [
+            self.canvas[r * tile_height:(r + 1) * tile_height, c * tile_width:(c + 1) * tile_width]
+            for r in range(self.rows) for c in range(columns)
+        ]
+
+        # Camera name labels: a pixel mask of the text in the top strip of the tile
+        self._label_height = 30
+        self._label_masks = [self._render_mask(name, 20) for name in names]
+
+        # Filler tiles (odd number of cameras): static text rendered once, clock/temperature on change
+        self._blank = np.zeros((tile_height, tile_width, 3), np.uint8)
+        cv2.putText(self._blank, blank_text, (_centered_x(tile_width, blank_text), int(tile_height / 2)),
+                    FONT, FONT_SCALE, TEXT_WHITE, 1, cv2.LINE_AA)
+        self._blank_text = [None] * len(self.tiles)
+        self._temperature = ''
+        self._temperature_at = None
+
+        # Error tiles keyed by message
+        self._error_tiles = {}
+        self._tile_state = [None] * len(self.tiles)
+
+    def _render_mask(self, text, y):
+        strip = np.zeros((self._label_height, self.tile_width), np.uint8)
+        cv2.putText(strip, text, (_centered_x(self.tile_width, text), y), FONT, FONT_SCALE, 255, 1, cv2.LINE_AA)
+        return strip > 0
+
+    def _error_tile(self, message):
+        tile = self._error_tiles.get(message)
+        if tile is None:
+            tile = np.zeros((self.tile_height, self.tile_width, 3), np.uint8)
+            tile[:] = TEXT_RED
+            size = cv2.getTextSize(message, FONT, FONT_SCALE, 1)[0]
+            cv2.putText(tile, message, (int((self.tile_width - size[0]) / 2), int((self.tile_height - size[1]) / 2)),
+                        FONT, FONT_SCALE, TEXT_WHITE, 1, cv2.LINE_AA)
+            self._error_tiles[message] = tile
+        return tile
+
+    def _temperature_text(self):
+        if self.temperature_func is None:
+            return ''
+        now = time.monotonic()
+        if self._temperature_at is None or now - self._temperature_at >= self.temperature_interval:
+            self._temperature = self.temperature_func().strip()
+            self._temperature_at = now
+        return self._temperature
+
+    def _draw_blank(self, ix):
+        lines = (time.strftime('%Y/%m/%d/%H:%M:%S', time.localtime()), self._temperature_text())
+        if self._blank_text[ix] == lines:
+            return
+        tile = self.tiles[ix]
+        tile[:] = self._blank
+        for offset, text in zip((20, 40), lines):
+            cv2.putText(tile, text, (_centered_x(self.tile_width, text), int(self.tile_height / 2) + offset),
+                        FONT, FONT_SCALE, TEXT_WHITE, 1, cv2.LINE_AA)
+        self._blank_text[ix] = lines
+
+    def compose(self, frames, messages=None):
+        """
+        Draw `frames` (one per camera, None for a failed camera) into the canvas and return it. `messages` gives the
+        error text shown for the failed cameras. The returned array is reused by the next call.
+        """
+        for ix, tile in enumerate(self.tiles):
+            if ix >= len(self.names):
+                self._draw_blank(ix)
+                continue
+
+            frame = frames[ix] if ix < len(frames) else None
+            if frame is None:
+                message = (messages[ix] if messages and messages[ix] else f"{self.names[ix]} is OFF")
+                if self._tile_state[ix] != message:
+                    tile[:] = self._error_tile(message)
+                    self._tile_state[ix] = message
+                continue
+
+            self._tile_state[ix] = None
+            if frame.shape[1] == self.tile_width and frame.shape[0] == self.tile_height:
+                tile[:] = frame
+            else:
+                cv2.resize(frame, (self.tile_width, self.tile_height), dst=tile, interpolation=cv2.INTER_AREA)
+            tile[:self._label_height][self._label_masks[ix]] = TEXT_RED
+
+        return self.canvas
@@ -0,0 +1,180 @@
+"""
+Motion-triggered captures between the interval ticks (MOTION in config.yaml).
+
+While the recorder sleeps, a watcher thread reads every camera at a preview resolution and a few frames per second
+and scores motion by differencing consecutive 160x90 grayscale copies: the score is the fraction of the watched
+pixels (outside the camera masks) that changed by more than PIXEL_THRESHOLD gray levels. A camera whose score
+reaches THRESHOLD interrupts the sleep and is captured at full resolution, then is not watched for COOLDOWN_SECONDS.
+
+A V4L2 device streams at one resolution at a time: the capture sessions are released while the watcher runs and the
+preview handles are released before the full resolution capture.
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from camera_session import CameraSession
+from frame_source import source_factory
+from metrics import registry as metrics
+
+MOTION_SIZE = (160, 90)
+# Seconds between two checks of the watcher while the scheduler sleeps
+POLL_INTERVAL = 0.25
+
+
+def motion_mask(rectangles, size=MOTION_SIZE):
+    """
+    Pixels of a `size` image that are watched: all but the `rectangles` ([x, y, width, height] as fractions of the
+    frame).
+    """
+    width, height = size
+    mask = np.ones((height, width), dtype=bool)
+    for x, y, w, h in rectangles or []:
+        mask[round(y * height):round((y + h) * height), round(x * width):round((x + w) * width)] = False
+    return mask
+
+
+def small_gray(frame, size=MOTION_SIZE):
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+def motion_score(previous, current, mask, pixel_threshold):
+    # Fraction of the watched pixels that changed, 0..1
+    watched = np.count_nonzero(mask)
+    if not watched:
+        return 0.0
+    changed = (np.abs(current - previous) > pixel_threshold) & mask
+    return np.count_nonzero(changed) / watched
+
+
+class MotionWatcher:
+    def __init__(self, camera_indexes, names, open_source, width=640, height=360, fps=2, threshold=0.02,
+                 pixel_threshold=25, cooldown=60, masks=None, settle_frames=3):
+        self.names = names
+        self.sessions = [
+            CameraSession(camera_index, width, height, name=f"{name}:motion", open_source=open_source)
+            for camera_index, name in zip(camera_indexes, names)
+        ]
+        masks = masks or []
+        self.masks = [motion_mask(masks[ix] if ix < len(masks) else None) for ix in range(len(self.sessions))]
+        self.fps = fps
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.cooldown = cooldown
+        # Frames skipped after a preview is opened, while exposure and white balance settle
+        self.settle_frames = settle_frames
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._triggered = []
+        # time.monotonic() of the last event per camera
+        self._last_event = [None] * len(self.sessions)
+
+        # Counters
+        self.events = [0] * len(self.sessions)
+        self.last_score = [None] * len(self.sessions)
+
+    @classmethod
+    def from_config(cls, config):
+        motion_config = config.get('MOTION') or {}
+        if not motion_config.get('ENABLED', False):
+            return None
+        return cls(config['CAMERA_INDEXES'],
+                   [os.path.basename(name) for name in config['CAMERAS_NAME']],
+                   source_factory(config),
+                   width=motion_config.get('PREVIEW_WIDTH', 640),
+                   height=motion_config.get('PREVIEW_HEIGHT', 360),
+                   fps=motion_config.get('FPS', 2),
+                   threshold=motion_config.get('THRESHOLD', 0.02),
+                   pixel_threshold=motion_config.get('PIXEL_THRESHOLD', 25),
+                   cooldown=motion_config.get('COOLDOWN_SECONDS', 60),
+                   masks=motion_config.get('MASKS'),
+                   settle_frames=motion_config.get('SETTLE_FRAMES', 3))
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='motion', daemon=True)
+        self._thread.start()
+
+    def triggered(self):
+        with self._lock:
+            return bool(self._triggered)
+
+    def stop(self):
+        """
+        Stop watching and release the preview handles. Returns the indexes of the cameras that saw motion.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            triggered, self._triggered = self._triggered, []
+        return triggered
+
+    def _cooling_down(self, ix, now):
+        return self._last_event[ix] is not None and now - self._last_event[ix] < self.cooldown
+
+    def _open(self, session):
+        if session.is_open:
+            return True
+        if not session.open():
+            return False
+        # Few buffered frames at a low rate, so each read is recent (not supported by every backend)
+        session.cap.set(cv2.CAP_PROP_FPS, self.fps)
+        session.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return True
+
+    def _run(self):
+        previous = [None] * len(self.sessions)
+        seen = [0] * len(self.sessions)
+        # A camera that fails is left alone until the next watch, instead of being reopened at every frame
+        failed = [False] * len(self.sessions)
+        try:
+            while not self._stop.is_set():
+                start = time.monotonic()
+                for ix, session in enumerate(self.sessions):
+                    if failed[ix] or self._cooling_down(ix, start):
+                        continue
+                    frame = session.read() if self._open(session) else None
+                    if frame is None:
+                        failed[ix] = True
+                        continue
+                    current = small_gray(frame)
+                    seen[ix] += 1
+                    if previous[ix] is not None and seen[ix] > self.settle_frames:
+                        score = motion_score(previous[ix], current, self.masks[ix], self.pixel_threshold)
+                        self.last_score[ix] = score
+                        metrics.set('aiseed_motion_score', score, camera=self.names[ix])
+                        if score >= self.threshold:
+                            self._trigger(ix, score)
+                    previous[ix] = current
+                if self.triggered():
+                    # Free the devices for the full resolution capture
+                    return
+                self._stop.wait(max(0.0, 1.0 / self.fps - (time.monotonic() - start)))
+        finally:
+            for session in self.sessions:
+                session.release()
+
+    def _trigger(self, ix, score):
+        print(f"Motion on {self.names[ix]}: score {score:.3f} >= {self.threshold}")
+        metrics.inc('aiseed_motion_events_total', camera=self.names[ix])
+        self._last_event[ix] = time.monotonic()
+        self.events[ix] += 1
+        with self._lock:
+            self._triggered.append(ix)
+
+    def report(self):
+        parts = [
+            f"{name}: events {events}" + (f" (score {score:.3f})" if score is not None else "")
+            for name, events, score in zip(self.names, self.events, self.last_score)
+        ]
+        print("Motion: " + ", ".join(parts))
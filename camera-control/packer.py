@@ -0,0 +1,278 @@
+"""
+Daily packing of the captured images.
+
+After the capture window of a day closes, the images of that day are bundled per camera into one uncompressed tar
+(`<camera folder>/packs/<YYYY-MM-DD>.tar`) and the loose files are removed. Next to the tar, a JSON index holds the
+offset and size of every member, so PackReader fetches a single image with one seek and one read, without
+unpacking anything. The tar stays readable by any tar tool, and the index can be rebuilt from it.
+
+    python3 packer.py pack ~/shared_folder/jukhyang_close_door 2024-05-01
+    python3 packer.py list ~/shared_folder/jukhyang_close_door/packs/2024-05-01.tar
+    python3 packer.py get ~/shared_folder/jukhyang_close_door/packs/2024-05-01.tar 2024-05-01-12-00-00 -o frame.jpg
+"""
+import argparse
+import bisect
+import datetime
+import glob
+import json
+import os
+import tarfile
+import threading
+
+from layout import StorageLayout, DEFAULT_TEMPLATE, get_layout
+
+PACK_DIR = 'packs'
+# Capture time given on the command line
+TIMESTAMP_FORMAT = '%Y-%m-%d-%H-%M-%S'
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def index_path(tar_path):
+    return f"{os.path.splitext(tar_path)[0]}.idx.json"
+
+
+def day_files(camera_dir, date, layout):
+    # Loose images of one day (relative to the camera folder), in capture order
+    files = []
+    for path in glob.glob(layout.day_pattern(camera_dir, date)):
+        rel_path = os.path.relpath(path, camera_dir)
+        moment = layout.parse(rel_path)
+        if moment is not None and moment.date() == date:
+            files.append((moment, rel_path))
+    return [rel_path for _, rel_path in sorted(files)]
+
+
+def _write_index(tar_path, members, template):
+    path = index_path(tar_path)
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({'tar': os.path.basename(tar_path), 'template': template, 'members': members}, f)
+    os.replace(tmp_path, path)
+
+
+def read_index(tar_path, template=DEFAULT_TEMPLATE):
+    """
+    Index of a pack: {'template': PATH_TEMPLATE of the member names, 'members': {name: [data offset, size, mtime]}}.
+    Rebuilt from the tar headers (with `template`) when the index file is missing.
+    """
+    try:
+        with open(index_path(tar_path), 'r') as f:
+            index = json.load(f)
+        if 'members' in index:
+            index.setdefault('template', DEFAULT_TEMPLATE)
+            return index
+    except (OSError, ValueError):
+        pass
+    with tarfile.open(tar_path, 'r:') as tar:
+        members = {member.name: [member.offset_data, member.size, member.mtime]
+                   for member in tar if member.isfile()}
+    _write_index(tar_path, members, template)
+    return {'template': template, 'members': members}
+
+
+def _remove_empty_dirs(camera_dir, rel_paths):
+    # Day folders of a sharded layout left empty by the packing
+    for directory in sorted({os.path.dirname(rel_path) for rel_path in rel_paths if os.path.dirname(rel_path)},
+                            reverse=True):
+        try:
+            os.removedirs(os.path.join(camera_dir, directory))
+        except OSError:
+            # Not empty, or the camera folder itself
+            pass
+
+
+def pack_day(camera_dir, date, layout=None, remove=True):
+    """
+    Append the loose images of `date` in `camera_dir` to its daily pack and remove them once the pack and its
+    index are on disk. A pack that already exists (images drained late from the spool) is extended.
+    Members are named by their path relative to the camera folder. Returns the number of images packed.
+    """
+    if layout is None:
+        layout = StorageLayout()
+    pack_dir = os.path.join(camera_dir, PACK_DIR)
+    tar_path = os.path.join(pack_dir, f"{date.strftime('%Y-%m-%d')}.tar")
+    members = read_index(tar_path, layout.template)['members'] if os.path.exists(tar_path) else {}
+    # (images kept after an earlier packing are not added twice)
+    files = [rel_path for rel_path in day_files(camera_dir, date, layout)
+             if rel_path.replace(os.sep, '/') not in members]
+    if not files:
+        return 0
+    os.makedirs(pack_dir, exist_ok=True)
+
+    # One sequential write of the whole day instead of a file create per image
+    with tarfile.open(tar_path, 'a:' if members else 'w:', format=tarfile.USTAR_FORMAT) as tar:
+        for rel_path in files:
+            path = os.path.join(camera_dir, rel_path)
+            info = tar.gettarinfo(path, arcname=rel_path.replace(os.sep, '/'))
+            with open(path, 'rb') as f:
+                tar.addfile(info, f)
+            # The data ends at tar.offset, padded to the tar block size
+            padded_size = (info.size + BLOCK_SIZE - 1) // BLOCK_SIZE * BLOCK_SIZE
+            members[info.name] = [tar.offset - padded_size, info.size, int(info.mtime)]
+        tar.fileobj.flush()
+        os.fsync(tar.fileobj.fileno())
+    _write_index(tar_path, members, layout.template)
+
+    if remove:
+        for rel_path in files:
+            try:
+                os.remove(os.path.join(camera_dir, rel_path))
+            except OSError as e:
+                print(f"Packer: unable to remove {rel_path}: {e}")
+        _remove_empty_dirs(camera_dir, files)
+    return len(files)
+
+
+class PackReader:
+    """
+    Random access to the images of a pack, by name or by capture time.
+    """
+
+    def __init__(self, tar_path, template=DEFAULT_TEMPLATE):
+        self.tar_path = tar_path
+        # (`template` is only used when the index has to be rebuilt, the index records the template of the pack)
+        index = read_index(tar_path, template)
+        self.members = index['members']
+        self.layout = get_layout(index['template'])
+        # Originals only (not the derivatives), by capture time
+        originals = sorted((self.layout.parse(name), name) for name in self.members
+                           if self.layout.parse(name) is not None and not self.layout.is_derivative(name))
+        self._times = [t for t, _ in originals]
+        self._names = [name for _, name in originals]
+
+    def names(self):
+        return sorted(self.members)
+
+    def read(self, name):
+        offset, size, _ = self.members[name]
+        with open(self.tar_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def name_at(self, moment):
+        """
+        Name of the original image captured at `moment`, or the last one before it. None if there is none.
+        """
+        ix = bisect.bisect_right(self._times, moment)
+        return self._names[ix - 1] if ix else None
+
+    def read_at(self, moment):
+        name = self.name_at(moment)
+        return None if name is None else self.read(name)
+
+
+class Packer:
+    """
+    Packs the finished days of every camera folder in a background thread, so the capture loop is not held up by
+    the share.
+    """
+
+    def __init__(self, camera_dirs, layout=None, remove=True):
+        self.camera_dirs = camera_dirs
+        self.layout = layout if layout is not None else StorageLayout()
+        self.remove = remove
+        self._thread = None
+        # Last `until` packed: the days up to it are only walked again on the next day
+        self.packed_until = None
+        # Loose images left of a packed day (REMOVE_PACKED off) by (camera folder, date): the day is not packed
+        # again while the count stays the same
+        self._packed = {}
+
+    @classmethod
+    def from_config(cls, config, current_dir=None):
+        pack_config = config.get('PACK') or {}
+        if not pack_config.get('ENABLED', False):
+            return None
+        if current_dir is None:
+            current_dir = os.path.expanduser('~')
+        return cls([os.path.join(current_dir, name) for name in config['CAMERAS_NAME']],
+                   layout=StorageLayout.from_config(config),
+                   remove=pack_config.get('REMOVE_PACKED', True))
+
+    @property
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def pending_days(self, camera_dir, until):
+        """
+        {date: number of loose files} of the days up to `until` (included) that still have loose images, without
+        the days already packed whose files did not change.
+        """
+        counts = {}
+        for _, moment in self.layout.walk(camera_dir):
+            if moment.date() <= until:
+                counts[moment.date()] = counts.get(moment.date(), 0) + 1
+        return {date: count for date, count in sorted(counts.items())
+                if self._packed.get((camera_dir, date)) != count}
+
+    def pack_pending(self, until):
+        for camera_dir in self.camera_dirs:
+            for date, loose in self.pending_days(camera_dir, until).items():
+                try:
+                    count = pack_day(camera_dir, date, self.layout, remove=self.remove)
+                except (OSError, tarfile.TarError) as e:
+                    print(f"Packer: unable to pack {camera_dir} {date}: {e}")
+                    continue
+                if not self.remove:
+                    # Every loose file of the day is in the pack now
+                    self._packed[(camera_dir, date)] = loose
+                if count:
+                    print(f"Packer: packed {count} images of {date} in {camera_dir}")
+        self.packed_until = until
+
+    def start(self, until):
+        """
+        Pack the days up to `until` in the background, once per `until`. Does nothing while a previous run is
+        still going.
+        """
+        if self.busy or (self.packed_until is not None and until <= self.packed_until):
+            return
+        self._thread = threading.Thread(target=self.pack_pending, args=(until,), name='packer', daemon=True)
+        self._thread.start()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help="pack the images of a day")
+    pack.add_argument('camera_dir')
+    pack.add_argument('date', help="YYYY-MM-DD")
+    pack.add_argument('--keep', action='store_true', help="keep the loose images")
+    pack.add_argument('--template', default=DEFAULT_TEMPLATE, help="PATH_TEMPLATE of the images")
+    listing = commands.add_parser('list', help="list the images of a pack")
+    listing.add_argument('tar_path')
+    get = commands.add_parser('get', help="extract the image captured at (or last before) a timestamp")
+    get.add_argument('tar_path')
+    get.add_argument('timestamp', help=TIMESTAMP_FORMAT.replace('%', ''))
+    get.add_argument('-o', '--output', required=True)
+    for command in (listing, get):
+        command.add_argument('--template', default=DEFAULT_TEMPLATE, help="PATH_TEMPLATE of the images "
+                             "(only needed when the index file is lost)")
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        date = datetime.datetime.strptime(args.date, '%Y-%m-%d').date()
+        count = pack_day(os.path.expanduser(args.camera_dir), date, get_layout(args.template), remove=not args.keep)
+        print(f"Packed {count} images")
+    elif args.command == 'list':
+        reader = PackReader(os.path.expanduser(args.tar_path), args.template)
+        for name in reader.names():
+            offset, size, _ = reader.members[name]
+            print(f"{name}  {size} bytes @ {offset}")
+    else:
+        reader = PackReader(os.path.expanduser(args.tar_path), args.template)
+        name = reader.name_at(datetime.datetime.strptime(args.timestamp, TIMESTAMP_FORMAT))
+        if name is None:
+            print("No image at or before this time")
+            return
+        with open(args.output, 'wb') as f:
+            f.write(reader.read(name))
+        print(f"{name} written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
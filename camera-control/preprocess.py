@@ -0,0 +1,144 @@
+import os
+import time
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from config_watcher import is_number
+from metrics import registry as metrics
+
+# Auto-gamma is rounded to this step so the LUT cache keeps hitting between cycles
+AUTO_GAMMA_STEP = 0.05
+# Size of the downsampled frame the auto-gamma histogram is computed on
+AUTO_GAMMA_SAMPLE = (64, 36)
+
+
+@lru_cache(maxsize=64)
+def build_lut(gamma=1.0, gains=(1.0, 1.0, 1.0)):
+    """
+    One (256, 1, 3) lookup table applying `gamma` then the per-channel (B, G, R) white balance `gains`.
+    The table is shared between calls, do not modify it.
+    """
+    levels = np.arange(256, dtype=np.float64) / 255.0
+    curve = np.power(levels, 1.0 / gamma) * 255.0
+    lut = np.clip(curve[:, None] * np.asarray(gains, dtype=np.float64)[None, :], 0, 255)
+    return np.round(lut).astype(np.uint8).reshape(256, 1, 3)
+
+
+def preprocess_errors(step_config, ix):
+    """
+    List of the errors of the PREPROCESS entry of camera `ix` (empty when it is valid).
+    """
+    errors = []
+    gamma = step_config.get('GAMMA', 1.0)
+    if not is_number(gamma) or gamma <= 0:
+        errors.append(f"Check the config PREPROCESS.GAMMA of camera {ix}, must be a number above 0")
+    gains = step_config.get('WHITE_BALANCE', [1.0, 1.0, 1.0])
+    if not isinstance(gains, list) or len(gains) != 3 or not all(is_number(g) and g >= 0 for g in gains):
+        errors.append(f"Check the config PREPROCESS.WHITE_BALANCE of camera {ix}, must be the [B, G, R] gains")
+    auto_gamma = step_config.get('AUTO_GAMMA')
+    if isinstance(auto_gamma, dict):
+        target = auto_gamma.get('TARGET', 0.45)
+        low, high = auto_gamma.get('MIN', 0.4), auto_gamma.get('MAX', 2.5)
+        if not is_number(target) or not 0 < target < 1:
+            errors.append(f"Check the config PREPROCESS.AUTO_GAMMA.TARGET of camera {ix}, must be between 0 and 1")
+        if not is_number(low) or not is_number(high) or not 0 < low <= high:
+            errors.append(f"Check the config PREPROCESS.AUTO_GAMMA.MIN and MAX of camera {ix}, "
+                          f"must be gammas with 0 < MIN <= MAX")
+    elif auto_gamma is not None and not isinstance(auto_gamma, bool):
+        errors.append(f"Check the config PREPROCESS.AUTO_GAMMA of camera {ix}, must be true, false or a mapping")
+    return errors
+
+
+def estimate_gamma(frame, target=0.45, min_gamma=0.4, max_gamma=2.5):
+    """
+    Gamma that brings the mean brightness of `frame` to `target` (0..1), from the histogram of a downsampled
+    grayscale copy.
+    """
+    small = cv2.resize(frame, AUTO_GAMMA_SAMPLE, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    hist = np.bincount(gray.ravel(), minlength=256)
+    mean = float(np.dot(hist, np.arange(256))) / gray.size / 255.0
+    mean = min(max(mean, 1e-3), 1 - 1e-3)
+    # mean ** (1 / gamma) == target
+    gamma = np.log(mean) / np.log(target)
+    gamma = min(max(gamma, min_gamma), max_gamma)
+    return round(round(gamma / AUTO_GAMMA_STEP) * AUTO_GAMMA_STEP, 2)
+
+
+class CameraPreprocessor:
+    """
+    Corrections of one camera: fixed GAMMA, WHITE_BALANCE gains (B, G, R) and/or AUTO_GAMMA. All the steps are
+    folded into one cached lookup table, so the frame is corrected with a single cv2.LUT pass.
+    """
+
+    def __init__(self, gamma=1.0, white_balance=(1.0, 1.0, 1.0), auto_gamma=None):
+        self.gamma = gamma
+        self.gains = tuple(float(g) for g in white_balance)
+        # AUTO_GAMMA settings (TARGET, MIN, MAX) or None
+        self.auto_gamma = auto_gamma
+        self.last_gamma = gamma
+
+    @classmethod
+    def from_config(cls, step_config):
+        auto_gamma = step_config.get('AUTO_GAMMA')
+        if auto_gamma is True:
+            auto_gamma = {}
+        elif auto_gamma is False:
+            auto_gamma = None
+        return cls(gamma=step_config.get('GAMMA', 1.0),
+                   white_balance=step_config.get('WHITE_BALANCE', (1.0, 1.0, 1.0)),
+                   auto_gamma=auto_gamma)
+
+    @property
+    def is_identity(self):
+        return self.gamma == 1.0 and self.gains == (1.0, 1.0, 1.0) and self.auto_gamma is None
+
+    def __call__(self, frame):
+        gamma = self.gamma
+        if self.auto_gamma is not None:
+            gamma *= estimate_gamma(frame,
+                                    self.auto_gamma.get('TARGET', 0.45),
+                                    self.auto_gamma.get('MIN', 0.4),
+                                    self.auto_gamma.get('MAX', 2.5))
+        self.last_gamma = gamma
+        if gamma == 1.0 and self.gains == (1.0, 1.0, 1.0):
+            return frame
+        return cv2.LUT(frame, build_lut(round(gamma, 2), self.gains))
+
+
+class Preprocessor:
+    """
+    Preprocessing stage of the recorder: one CameraPreprocessor per camera, from the PREPROCESS list in
+    config.yaml (same order as CAMERA_INDEXES, an empty entry means no correction).
+    """
+
+    def __init__(self, camera_steps, names=None):
+        self.camera_steps = camera_steps
+        self.names = names or [str(ix) for ix in range(len(camera_steps))]
+
+    @classmethod
+    def from_config(cls, config):
+        steps = config.get('PREPROCESS') or []
+        camera_steps = []
+        for ix in range(len(config['CAMERA_INDEXES'])):
+            step_config = steps[ix] if ix < len(steps) and steps[ix] else {}
+            step = CameraPreprocessor.from_config(step_config)
+            camera_steps.append(None if step.is_identity else step)
+        return cls(camera_steps, [os.path.basename(name) for name in config['CAMERAS_NAME']])
+
+    @property
+    def enabled(self):
+        return any(step is not None for step in self.camera_steps)
+
+    def apply(self, frames):
+        corrected = []
+        for frame, step, name in zip(frames, self.camera_steps, self.names):
+            if frame is None or step is None:
+                corrected.append(frame)
+                continue
+            start = time.monotonic()
+            corrected.append(step(frame))
+            metrics.observe('aiseed_capture_stage_seconds', time.monotonic() - start, camera=name, stage='preprocess')
+        return corrected
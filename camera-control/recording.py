@@ -1,10 +1,32 @@
 import cv2
 import yaml
-import numpy as np
 import time
 import os
 import pytz
 import datetime
+import atexit
+import re
+import signal
+
+from camera_session import CameraSessionManager, SESSION_MODES, DEFAULT_MODE as DEFAULT_SESSION_MODE
+from frame_source import SOURCE_TYPES, SOURCE_REPLAY, SOURCE_V4L2
+from discovery import discover_cameras, resolve_camera
+from image_writer import ImageWriter, write_atomic
+from derivatives import DerivativeSet
+from spool import Spool
+from sinks import sink_from_config, SINK_TYPES, SINK_CIFS, SINK_HTTP
+from catalog import Catalog
+from mosaic import MosaicEngine
+from preprocess import Preprocessor, preprocess_errors
+from dedup import ChangeDetector, METHODS as CHANGE_DETECTION_METHODS
+from status_block import StatusBlockWriter
+from metrics import registry as metrics
+from scheduler import CaptureScheduler, MISSED_POLICIES, WINDOW_MODES, WINDOW_SOLAR, POLL_INTERVAL
+from config_watcher import ConfigWatcher, is_number, check_number, check_section
+from packer import Packer
+from layout import StorageLayout, DEFAULT_TEMPLATE, template_errors
+from motion import MotionWatcher, POLL_INTERVAL as MOTION_POLL_INTERVAL
+from roi import RegionSet, roi_errors
 
 TIMEZONE = pytz.timezone('Asia/Seoul')
 
@@ -15,30 +37,6 @@ log_file = '~/camera-control.log'
 # export all terminal output in this file to log file
 import logging
 import sys
-import os
-
-# Define the log file path. Expand the user home directory symbol (~).
-log_file = os.path.expanduser(log_file)
-# Create a logger object.
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-# Create a file handler which logs even debug messages.
-fh = logging.FileHandler(log_file)
-fh.setLevel(logging.DEBUG)
-
-# Create a console handler with a higher log level.
-ch = logging.StreamHandler()
-ch.setLevel(logging.ERROR)
-
-# Create formatter and add it to the handlers.
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-fh.setFormatter(formatter)
-ch.setFormatter(formatter)
-
-# Add the handlers to the logger.
-logger.addHandler(fh)
-logger.addHandler(ch)
 
 
 # Create a class to replace stdout and stderr
@@ -55,9 +53,33 @@ class StreamToLogger:
         pass
 
 
-# Replace the standard output and standard error streams with the logging equivalents.
-sys.stdout = StreamToLogger(logger, logging.INFO)
-sys.stderr = StreamToLogger(logger, logging.ERROR)
+def setup_logging(log_file):
+    # Define the log file path. Expand the user home directory symbol (~).
+    log_file = os.path.expanduser(log_file)
+    # Create a logger object.
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    # Create a file handler which logs even debug messages.
+    fh = logging.FileHandler(log_file)
+    fh.setLevel(logging.DEBUG)
+
+    # Create a console handler with a higher log level.
+    ch = logging.StreamHandler()
+    ch.setLevel(logging.ERROR)
+
+    # Create formatter and add it to the handlers.
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    fh.setFormatter(formatter)
+    ch.setFormatter(formatter)
+
+    # Add the handlers to the logger.
+    logger.addHandler(fh)
+    logger.addHandler(ch)
+
+    # Replace the standard output and standard error streams with the logging equivalents.
+    sys.stdout = StreamToLogger(logger, logging.INFO)
+    sys.stderr = StreamToLogger(logger, logging.ERROR)
 
 
 # Functions
@@ -77,9 +99,175 @@ def read_config(config_file):
     return config
 
 
+def validate_config(config):
+    """
+    List of the errors of a config (empty when it is valid). Everything the recorder applies on a hot reload is
+    checked here: a config that passes must not fail once applied.
+    """
+    errors = []
+    for key in ("CAMERA_INDEXES", "CAMERAS_NAME", "RESOLUTION", "RES_DROP", "INTERVAL_TIME", "LIGHT_START_HOUR",
+                "LIGHT_END_HOUR"):
+        if key not in config:
+            errors.append(f"Check the config {key}, it is missing")
+    if errors:
+        return errors
+    if not isinstance(config["CAMERA_INDEXES"], list) or not isinstance(config["CAMERAS_NAME"], list) \
+            or len(config["CAMERA_INDEXES"]) != len(config["CAMERAS_NAME"]):
+        errors.append("Check the config number of cameras and names of cameras")
+    elif not all(isinstance(camera_id, (int, str)) for camera_id in config["CAMERA_INDEXES"]):
+        errors.append("Check the config CAMERA_INDEXES, must be camera indexes or IDs")
+    elif not all(isinstance(name, str) for name in config["CAMERAS_NAME"]):
+        errors.append("Check the config CAMERAS_NAME, must be folder names")
+    resolution = check_section(errors, config, "RESOLUTION")
+    for key in ("CAP_PROP_FRAME_WIDTH", "CAP_PROP_FRAME_HEIGHT"):
+        check_number(errors, f"RESOLUTION.{key}", resolution.get(key), above=0, integer=True)
+    res_drop = check_section(errors, config, "RES_DROP")
+    for key in ("WIDTH", "HEIGHT"):
+        check_number(errors, f"RES_DROP.{key}", res_drop.get(key), above=0, integer=True)
+    check_number(errors, "INTERVAL_TIME (minutes)", config["INTERVAL_TIME"], above=0)
+    # Whole hours: the window runs from LIGHT_START_HOUR:00 to LIGHT_END_HOUR:59 of the same day
+    for key in ("LIGHT_START_HOUR", "LIGHT_END_HOUR"):
+        check_number(errors, f"{key} (hour)", config[key], low=0, high=23, integer=True)
+    if is_number(config["LIGHT_START_HOUR"]) and is_number(config["LIGHT_END_HOUR"]) \
+            and config["LIGHT_START_HOUR"] > config["LIGHT_END_HOUR"]:
+        errors.append("Check the config LIGHT_START_HOUR and LIGHT_END_HOUR, the window must start before it ends")
+    camera_source = check_section(errors, config, "CAMERA_SOURCE")
+    source_type = camera_source.get("TYPE", SOURCE_TYPES[0])
+    if source_type not in SOURCE_TYPES:
+        errors.append(f"Check the config CAMERA_SOURCE.TYPE, must be one of {SOURCE_TYPES}")
+    if source_type == SOURCE_REPLAY and not isinstance(camera_source.get("DIRECTORY"), str):
+        errors.append("Check the config CAMERA_SOURCE.DIRECTORY, required by the replay source")
+    session = check_section(errors, config, "CAMERA_SESSION")
+    if session.get("MODE", DEFAULT_SESSION_MODE) not in SESSION_MODES:
+        errors.append(f"Check the config CAMERA_SESSION.MODE, must be one of {SESSION_MODES}")
+    if "IDLE_CLOSE_MINUTES" in session:
+        check_number(errors, "CAMERA_SESSION.IDLE_CLOSE_MINUTES", session["IDLE_CLOSE_MINUTES"], low=0)
+    if "WARMUP_FRAMES" in session:
+        check_number(errors, "CAMERA_SESSION.WARMUP_FRAMES", session["WARMUP_FRAMES"], low=0, integer=True)
+    image_writer = check_section(errors, config, "IMAGE_WRITER")
+    for key in ("WORKERS", "QUEUE_SIZE"):
+        if key in image_writer:
+            check_number(errors, f"IMAGE_WRITER.{key}", image_writer[key], low=1, integer=True)
+    if "JPEG_QUALITY" in image_writer:
+        check_number(errors, "IMAGE_WRITER.JPEG_QUALITY", image_writer["JPEG_QUALITY"], low=1, high=100, integer=True)
+    if "PUT_TIMEOUT" in image_writer:
+        check_number(errors, "IMAGE_WRITER.PUT_TIMEOUT", image_writer["PUT_TIMEOUT"], low=0)
+    schedule = check_section(errors, config, "SCHEDULE")
+    if schedule.get("MISSED_TICKS", MISSED_POLICIES[0]) not in MISSED_POLICIES:
+        errors.append(f"Check the config SCHEDULE.MISSED_TICKS, must be one of {MISSED_POLICIES}")
+    if schedule.get("WINDOW", WINDOW_MODES[0]) not in WINDOW_MODES:
+        errors.append(f"Check the config SCHEDULE.WINDOW, must be one of {WINDOW_MODES}")
+    if schedule.get("WINDOW") == WINDOW_SOLAR and ("LATITUDE" not in schedule or "LONGITUDE" not in schedule):
+        errors.append("Check the config SCHEDULE.LATITUDE and SCHEDULE.LONGITUDE, required by the solar window")
+    if "LATITUDE" in schedule:
+        check_number(errors, "SCHEDULE.LATITUDE", schedule["LATITUDE"], low=-90, high=90)
+    if "LONGITUDE" in schedule:
+        check_number(errors, "SCHEDULE.LONGITUDE", schedule["LONGITUDE"], low=-180, high=180)
+    for key in ("SUNRISE_OFFSET_MINUTES", "SUNSET_OFFSET_MINUTES"):
+        if key in schedule:
+            check_number(errors, f"SCHEDULE.{key}", schedule[key], low=-720, high=720)
+    template = config.get("PATH_TEMPLATE") or DEFAULT_TEMPLATE
+    if isinstance(template, str):
+        errors.extend(template_errors(template))
+    else:
+        errors.append("Check the config PATH_TEMPLATE, must be a string")
+    sink = check_section(errors, config, "SINK")
+    if sink.get("TYPE", SINK_CIFS) not in SINK_TYPES:
+        errors.append(f"Check the config SINK.TYPE, must be one of {SINK_TYPES}")
+    if sink.get("TYPE") == SINK_HTTP and not isinstance(sink.get("URL"), str):
+        errors.append("Check the config SINK.URL, required by the http sink")
+    spool = check_section(errors, config, "SPOOL")
+    share_root = os.path.abspath(os.path.expanduser(str(spool.get("SHARE_ROOT", "~/shared_folder"))))
+    if sink.get("TYPE", SINK_CIFS) == SINK_CIFS and spool.get("ENABLED", True) \
+            and not share_root.startswith(os.path.expanduser("~") + os.sep):
+        # The spool (and the API reading it) keep the images by their path relative to the home directory
+        errors.append("Check the config SPOOL.SHARE_ROOT, must be inside the home directory to spool the images")
+    for key in ("SPOOL", "PACK", "CATALOG"):
+        if not isinstance(check_section(errors, config, key).get("ENABLED", False), bool):
+            errors.append(f"Check the config {key}.ENABLED, must be true or false")
+    preprocess = config.get("PREPROCESS") or []
+    if not isinstance(preprocess, list):
+        errors.append("Check the config PREPROCESS, must be a list per camera")
+    else:
+        for ix, step_config in enumerate(preprocess):
+            if step_config and not isinstance(step_config, dict):
+                errors.append(f"Check the config PREPROCESS of camera {ix}, must be a mapping")
+            elif step_config:
+                errors.extend(preprocess_errors(step_config, ix))
+    derivatives = config.get("DERIVATIVES") or []
+    if not isinstance(derivatives, list):
+        errors.append("Check the config DERIVATIVES, must be a list")
+        derivatives = []
+    names = []
+    for ix, derivative in enumerate(derivatives):
+        if not isinstance(derivative, dict):
+            errors.append(f"Check the config DERIVATIVES entry {ix}, must be a mapping")
+            continue
+        if not isinstance(derivative.get("NAME"), str) or not re.match(r"^[A-Za-z0-9-]+$", derivative["NAME"]):
+            errors.append(f"Check the config DERIVATIVES entry {ix}, NAME is required (letters, digits and -)")
+        names.append(derivative.get("NAME"))
+        if derivative.get("WIDTH") is not None:
+            check_number(errors, f"DERIVATIVES entry {ix} WIDTH", derivative["WIDTH"], above=0, integer=True)
+        if "QUALITY" in derivative:
+            check_number(errors, f"DERIVATIVES entry {ix} QUALITY", derivative["QUALITY"], low=1, high=100,
+                         integer=True)
+        if derivative.get("CROP") is not None:
+            check_number(errors, f"DERIVATIVES entry {ix} CROP", derivative["CROP"], above=0, high=1)
+    if len(names) != len(set(names)):
+        errors.append("Check the config DERIVATIVES, a NAME is used twice")
+    change_detection = check_section(errors, config, "CHANGE_DETECTION")
+    if not isinstance(change_detection.get("ENABLED", False), bool):
+        errors.append("Check the config CHANGE_DETECTION.ENABLED, must be true or false")
+    if change_detection.get("METHOD", CHANGE_DETECTION_METHODS[0]) not in CHANGE_DETECTION_METHODS:
+        errors.append(f"Check the config CHANGE_DETECTION.METHOD, must be one of {CHANGE_DETECTION_METHODS}")
+    if "THRESHOLD" in change_detection:
+        check_number(errors, "CHANGE_DETECTION.THRESHOLD", change_detection["THRESHOLD"], low=0)
+    if "KEEP_EVERY" in change_detection:
+        check_number(errors, "CHANGE_DETECTION.KEEP_EVERY", change_detection["KEEP_EVERY"], low=1, integer=True)
+    motion = check_section(errors, config, "MOTION")
+    if not isinstance(motion.get("ENABLED", False), bool):
+        errors.append("Check the config MOTION.ENABLED, must be true or false")
+    check_number(errors, "MOTION.THRESHOLD (fraction of the pixels)", motion.get("THRESHOLD", 0.02), above=0, high=1)
+    check_number(errors, "MOTION.FPS", motion.get("FPS", 2), above=0)
+    for key in ("PREVIEW_WIDTH", "PREVIEW_HEIGHT"):
+        if key in motion:
+            check_number(errors, f"MOTION.{key}", motion[key], above=0, integer=True)
+    if "PIXEL_THRESHOLD" in motion:
+        check_number(errors, "MOTION.PIXEL_THRESHOLD", motion["PIXEL_THRESHOLD"], low=0, high=255)
+    if "COOLDOWN_SECONDS" in motion:
+        check_number(errors, "MOTION.COOLDOWN_SECONDS", motion["COOLDOWN_SECONDS"], low=0)
+    if "SETTLE_FRAMES" in motion:
+        check_number(errors, "MOTION.SETTLE_FRAMES", motion["SETTLE_FRAMES"], low=0, integer=True)
+    masks = motion.get("MASKS") or []
+    if not isinstance(masks, list):
+        errors.append("Check the config MOTION.MASKS, must be a list per camera")
+    else:
+        for ix, mask in enumerate(masks):
+            if mask and not isinstance(mask, list):
+                errors.append(f"Check the config MOTION.MASKS of camera {ix}, must be a list of rectangles")
+                continue
+            for rectangle in mask or []:
+                if not isinstance(rectangle, list) or len(rectangle) != 4 \
+                        or not all(is_number(v) and 0 <= v <= 1 for v in rectangle):
+                    errors.append(f"Check the config MOTION.MASKS of camera {ix}, rectangles are "
+                                  f"[x, y, width, height] fractions of the frame")
+    roi = config.get("ROI") or []
+    if not isinstance(roi, list):
+        errors.append("Check the config ROI, must be a list per camera")
+    else:
+        for ix, roi_config in enumerate(roi):
+            if roi_config and not isinstance(roi_config, dict):
+                errors.append(f"Check the config ROI of camera {ix}, must be a mapping")
+            elif roi_config:
+                errors.extend(roi_errors(roi_config, ix))
+    return errors
+
+
 def verified_config(config):
-    if len(config["CAMERA_INDEXES"]) != len(config["CAMERAS_NAME"]):
-        print("Check the config number of cameras and names of cameras")
+    errors = validate_config(config)
+    if errors:
+        for error in errors:
+            print(error)
         exit()
 
 
@@ -94,75 +282,24 @@ def create_camera_folder(config):
             os.mkdir(current_dir + "/" + name)
 
 
-def save_image(frames, config):
-    current_dir = os.path.expanduser('~')
-    # saving each frame into each camera folder and the name of frame is timestamp: year-month-day-hour-minute-second-millisecond
+def save_image(frames, config, writer, current_dir=None):
+    if current_dir is None:
+        current_dir = os.path.expanduser('~')
+    # saving each frame into each camera folder, the path follows PATH_TEMPLATE (layout.py), by default the name of
+    # frame is timestamp: year-month-day-hour-minute-second
+    layout = StorageLayout.from_config(config)
     for ix, frame in enumerate(frames):
         if frame is not None:
             # Get the current time
             # now = datetime.datetime.now(TIMEZONE)
-            timestamp = time.strftime('%Y-%m-%d-%H-%M-%S', time.localtime())
-            # Save the image
-            cv2.imwrite(f"{current_dir}/{config['CAMERAS_NAME'][ix]}/{timestamp}.jpg", frame)
-            print(f"Saved frame {ix} into {config['CAMERAS_NAME'][ix]}")
-
-
-def generate_error_error_frame(config, message):
-    # Generate a Black frame with error message
-    error_frame = np.zeros((config['RES_DROP'].get('HEIGHT'), config['RES_DROP'].get('WIDTH'), 3), np.uint8)
-    error_frame[:] = (0, 0, 255)
-    text_size = cv2.getTextSize(message, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
-    text_position = (int((error_frame.shape[1] - text_size[0]) / 2), int((error_frame.shape[0] - text_size[1]) / 2))
-    cv2.putText(error_frame, message, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-    return error_frame
-
-
-def create_layout(frames, config):
-    """
-    Create a nx2 frame with two cameras for each row. If number of camera is odd then create a blank frame
-    """
-    num_of_cams = len(config["CAMERA_INDEXES"])
-    layout_rows = np.ceil(num_of_cams / 2)
-    if num_of_cams % 2 == 1:
-        blank_frame = np.zeros_like(frames[0])  # Blank frame
-        text = "Press `q` to close the program"
-        text_position = (
-            int((blank_frame.shape[1] - cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][0]) / 2),
-            int(blank_frame.shape[0] / 2)
-        )
-        cv2.putText(blank_frame, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-        # adding the time: yyyy/mm/dd/hh/mm/ss into the bottom right corner of the frame
-        text = time.strftime('%Y/%m/%d/%H:%M:%S', time.localtime())
-        text_position = (
-            int((blank_frame.shape[1] - cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][0]) / 2),
-            int(blank_frame.shape[0] / 2) + 20
-        )
-        cv2.putText(blank_frame, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-        # Print the CPU temperature
-        text = get_cpu_temperature()
-        text_position = (
-            int((blank_frame.shape[1] - cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][0]) / 2),
-            int(blank_frame.shape[0] / 2) + 40
-        )
-        cv2.putText(blank_frame, text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-
-        frames.append(blank_frame)
-
-    # Combine frames for the layout
-    layout = None
-
-    for i in range(int(layout_rows)):
-        row_frame = None
-        for j in range(2):
-            idx = i * 2 + j
-            fr = frames[idx]
-            row_frame = fr if row_frame is None else np.hstack((row_frame, fr))
-        layout = row_frame if layout is None else np.vstack((layout, row_frame))
-
-    return layout
+            now = datetime.datetime.now()
+            # Queue the image, the writer threads encode and write it to the shared folder (creating the folders)
+            if writer.submit(layout.path(current_dir, config['CAMERAS_NAME'][ix], now), frame,
+                             camera=os.path.basename(config['CAMERAS_NAME'][ix]), captured_at=now.timestamp()):
+                print(f"Queued frame {ix} for {config['CAMERAS_NAME'][ix]}")
 
 
-def check_camera_status(frames):
+def check_camera_status(frames, config, camera_indexes, list_camera_error):
     for ix, frame in enumerate(frames):
         if frame is None and list_camera_error[ix] is None and list_camera_error[ix] is None:
             camera_error_text = f"Camera {ix + 1} ({config['CAMERAS_NAME'][ix]}) is OFF"
@@ -191,26 +328,9 @@ def check_camera_status(frames):
     return camera_error_text
 
 
-def show_camera_layout(frames, config, camera_error_text):
-    for ix in range(len(frames)):
-        if frames[ix] is not None:
-            frames[ix] = cv2.resize(frames[ix], (config['RES_DROP'].get('WIDTH'), config['RES_DROP'].get('HEIGHT')))
-            text_position = (int((frames[ix].shape[1] -
-                                  cv2.getTextSize(config["CAMERAS_NAME"][ix], cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][
-                                      0]) / 2), 20)
-            cv2.putText(frames[ix], config["CAMERAS_NAME"][ix], text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                        (0, 0, 255), 1, cv2.LINE_AA)
-        else:
-            frames[ix] = generate_error_error_frame(config, list_camera_error[ix])
-            text_position = (
-                int((frames[ix].shape[1] - cv2.getTextSize(camera_error_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0][
-                    0]) / 2),
-                20)
-            cv2.putText(frames[ix], camera_error_text, text_position, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1,
-                        cv2.LINE_AA)
-
+def show_camera_layout(frames, config, camera_error_text, mosaic):
     # Create a nx2 layout with two cameras for each row. If number of camera is odd then create a blank frame
-    combined_frame = create_layout(frames, config)
+    combined_frame = mosaic.compose(frames, [camera_error_text] * len(frames))
 
     # Display the combined frame
     cv2.imshow("Camera", combined_frame)
@@ -218,96 +338,221 @@ def show_camera_layout(frames, config, camera_error_text):
     cv2.moveWindow("Camera", 20, 20)
 
 
+def capture_cycle(sessions, preprocessor, change_detector, writer, config, current_dir=None):
+    """
+    One capture: read all cameras, correct, drop the unchanged frames and queue the rest for writing.
+    Returns the frames as read (after preprocessing).
+    """
+    # Read frames from all cameras (handles stay open across cycles depending on CAMERA_SESSION.MODE)
+    frames = sessions.read_all()
+    # Per camera gamma / white balance correction before encoding
+    if preprocessor.enabled:
+        frames = preprocessor.apply(frames)
+
+    # Skip the frames nearly identical to the last saved one of the same camera
+    if change_detector is not None:
+        save_image(change_detector.filter(frames), config, writer, current_dir)
+        change_detector.report(config["CAMERAS_NAME"])
+    else:
+        save_image(frames, config, writer, current_dir)
+    return frames
+
+
+def event_cycle(sessions, preprocessor, writer, config, cameras, current_dir=None):
+    """
+    Full resolution capture of the cameras that saw motion (indexes in `cameras`) between two ticks.
+    """
+    print(f"Motion capture of {', '.join(config['CAMERAS_NAME'][ix] for ix in cameras)}")
+    frames = sessions.read_all(only=cameras)
+    if preprocessor.enabled:
+        frames = preprocessor.apply(frames)
+    # No change detection: the motion score already tells the frame differs
+    save_image(frames, config, writer, current_dir)
+    return frames
+
+
 # Main Code
-config = read_config(config_file)
-print(config)
-verified_config(config)
-create_camera_folder(config)
-
-interval_time = config['INTERVAL_TIME'] * 60
-last_time = time.time() - interval_time
-
-camera_indexes = config['CAMERA_INDEXES']
-list_cap = []
-list_camera_error = []
-
-
-def open_cameras(camera_indexes, config):
-    camera_caps = []
-    for camera_index in camera_indexes:
-        cap = cv2.VideoCapture(camera_index)
-        if not cap.isOpened():
-            print("Error: Unable to open camera number :", camera_index)
-            exit()
-        print(f"Camera number {camera_index} is ON")
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, config['RESOLUTION'].get('CAP_PROP_FRAME_WIDTH'))
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config['RESOLUTION'].get('CAP_PROP_FRAME_HEIGHT'))
-        camera_caps.append(cap)
-    return camera_caps
-
-
-def close_cameras(list_cap):
-    for cap in list_cap:
-        if cap is not None:
-            cap.release()
-
-
-while True:
-    # Measure the time of the main loop to sleep for the remaining time
-    mainLoopStartTime = time.time()
-
-    # Schedule the camera to work only in the day time
-    now = datetime.datetime.now(TIMEZONE)
-    # if now is not in between target hours then sleep for 1 hour
-    if not (config['LIGHT_START_HOUR'] <= now.hour <= config['LIGHT_END_HOUR']):
-        print("Sleeping for 1 hour")
-        time.sleep(3600)
-        continue
-
-    # Usage
-    list_cap = open_cameras(camera_indexes, config)
-    list_camera_error = [None] * len(list_cap)
-    # Read frames from all cameras
-    frames = []
-    for cap in list_cap:
-        if cap is not None:
-            frames.append(cap.read()[1])
-        else:
-            frames.append(None)
-    # (Uncomment for display) Checking the camera status
-    # camera_error_text = check_camera_status(frames)
-
-    # Close all cameras
-    close_cameras(list_cap)
-
-    # saving images every interval_time
-    if time.time() - last_time > interval_time:
+def main():
+    setup_logging(log_file)
+    config = read_config(config_file)
+    print(config)
+    verified_config(config)
+    create_camera_folder(config)
+
+    scheduler = CaptureScheduler.from_config(config, TIMEZONE)
+    print(f"Capturing every {scheduler.interval} seconds in the window {scheduler.window}")
+
+    camera_indexes = config['CAMERA_INDEXES']
+    if (config.get('CAMERA_SOURCE') or {}).get('TYPE', SOURCE_V4L2) == SOURCE_V4L2:
+        # Stable IDs (/dev/v4l/by-id, by-path names) are resolved from the cached discovery
+        cameras = discover_cameras()
+        for camera_id in camera_indexes:
+            print(f"Camera {camera_id} -> {resolve_camera(camera_id, cameras)}")
+    list_camera_error = []
+    mosaic = MosaicEngine(config["CAMERAS_NAME"], config['RES_DROP'].get('WIDTH'), config['RES_DROP'].get('HEIGHT'),
+                          temperature_func=get_cpu_temperature)
+
+    sessions = CameraSessionManager(camera_indexes, config)
+    preprocessor = Preprocessor.from_config(config)
+    change_detector = ChangeDetector.from_config(config)
+    # The share (through the spool) or an HTTP ingestion server, SINK in config.yaml
+    sink_type = (config.get('SINK') or {}).get('TYPE', SINK_CIFS)
+    spool = Spool.from_config(config) \
+        if sink_type == SINK_CIFS and (config.get('SPOOL') or {}).get('ENABLED', True) else None
+    sink = sink_from_config(config, spool)
+    # Every written image is recorded in the local catalog (/api/captures)
+    catalog = Catalog.from_config(config)
+    if catalog is not None:
+        sink.on_status = catalog.update_status
+        if spool is not None:
+            spool.on_status = catalog.update_status
+    writer = ImageWriter.from_config(config, sink=sink, derivatives=DerivativeSet.from_config(config),
+                                     catalog=catalog, regions=RegionSet.from_config(config))
+    if spool is not None:
+        # The backlog is only drained while no live capture is waiting to be written
+        spool.start(is_busy=lambda: writer.queue.qsize() > 0)
+    # Heartbeat and per camera status read by the API (/api/capture_status, /api/cache_time)
+    status_block = StatusBlockWriter(config["CAMERAS_NAME"])
+    status_block.heartbeat()
+    # Bundles the images of the finished days into one tar per camera and day
+    packer = Packer.from_config(config)
+    # Captures on motion between the ticks, MOTION in config.yaml
+    motion = MotionWatcher.from_config(config)
+
+    def before_sleep(seconds):
+        sessions.release_idle(seconds)
+        if motion is not None and scheduler.in_window(scheduler.now()):
+            # The preview handles need the devices
+            sessions.release_all()
+            motion.start()
+        if packer is not None:
+            # The day is packed once its last capture is done (the next tick is on another day), the packer only
+            # runs once per finished day
+            now = scheduler.now()
+            done = now.date() if (now + datetime.timedelta(seconds=seconds)).date() > now.date() \
+                else now.date() - datetime.timedelta(days=1)
+            packer.start(done)
+
+    def shutdown():
+        # Flush the queued frames before exiting (systemd stop/restart sends SIGTERM)
+        if motion is not None:
+            motion.stop()
+        writer.close()
+        sink.close()
+        if catalog is not None:
+            catalog.close()
+        sessions.close()
+
+    def handle_sigterm(signum, frame):
+        sys.exit(0)
+
+    atexit.register(shutdown)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    # config.yaml is re-read when it changes, only the changed parts are applied
+    watcher = ConfigWatcher(config_file, config, validate_config)
+
+    def sleep_interrupted():
+        # (called every few seconds of a sleep)
+        status_block.heartbeat()
+        return watcher.changed() or (motion is not None and motion.triggered())
+
+    def reload_config():
+        nonlocal config, preprocessor, change_detector, motion
+        reloaded = watcher.poll()
+        if reloaded is None:
+            return
+        new_config, keys = reloaded
+        changed = set(keys)
+        try:
+            # Everything is built before anything is applied: a config that fails leaves the recorder as it was
+            new_scheduler = CaptureScheduler.from_config(new_config, TIMEZONE) \
+                if {'INTERVAL_TIME', 'LIGHT_START_HOUR', 'LIGHT_END_HOUR', 'SCHEDULE'} & changed else None
+            schedule_text = None if new_scheduler is None else \
+                f"Capturing every {new_scheduler.interval} seconds in the window {new_scheduler.window}"
+            new_preprocessor = Preprocessor.from_config(new_config) if 'PREPROCESS' in changed else preprocessor
+            new_change_detector = ChangeDetector.from_config(new_config) \
+                if 'CHANGE_DETECTION' in changed else change_detector
+            # The number of writer threads and the queue size are kept until the next restart
+            writer_config = new_config.get('IMAGE_WRITER') or {}
+            derivatives = DerivativeSet.from_config(new_config) if 'DERIVATIVES' in changed else writer.derivatives
+            regions = RegionSet.from_config(new_config) if 'ROI' in changed else writer.regions
+            # (stopped: the config is only reloaded while the watcher is not running)
+            new_motion = MotionWatcher.from_config(new_config) if {'MOTION', 'CAMERA_INDEXES'} & changed else motion
+            if {'CAMERA_INDEXES', 'RESOLUTION', 'CAMERA_SESSION'} & changed:
+                sessions.reconfigure(new_config['CAMERA_INDEXES'], new_config)
+        except Exception as e:
+            print(f"Error: unable to apply the reloaded config, keeping the running config: {e!r}")
+            watcher.rollback(config)
+            return
+
+        config = new_config
+        print(f"Config reloaded, changed: {', '.join(keys) or 'nothing'}")
+        if new_scheduler is not None:
+            scheduler.reconfigure(new_scheduler)
+            print(schedule_text)
+        preprocessor = new_preprocessor
+        change_detector = new_change_detector
+        writer.jpeg_quality = writer_config.get('JPEG_QUALITY', 95)
+        writer.put_timeout = writer_config.get('PUT_TIMEOUT', 30)
+        writer.derivatives = derivatives
+        writer.regions = regions
+        motion = new_motion
+
+    while True:
+        # Sleep until the next wall-clock aligned tick inside the capture window (day time), a config change
+        # interrupts the sleep so a new interval or window takes effect right away, and so does motion
+        tick = scheduler.wait(on_sleep=before_sleep, interrupt=sleep_interrupted,
+                              poll_interval=POLL_INTERVAL if motion is None else MOTION_POLL_INTERVAL)
+        moved = motion.stop() if motion is not None else []
+        if tick is None:
+            if moved:
+                # The tick is not consumed: the interval captures go on as scheduled
+                event_cycle(sessions, preprocessor, writer, config, moved)
+                writer.report()
+            reload_config()
+            continue
+        # Measure the time of the main loop
+        mainLoopStartTime = time.time()
+
         # print the time and log
         print(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
-        last_time = time.time()
-        save_image(frames, config)
+        frames = capture_cycle(sessions, preprocessor, change_detector, writer, config)
+        list_camera_error = [None] * len(frames)
+        # (Uncomment for display) Checking the camera status
+        # camera_error_text = check_camera_status(frames, config, camera_indexes, list_camera_error)
+        writer.report()
+        sink.report()
+        if motion is not None:
+            motion.report()
         # Print the CPU temperature
         print(get_cpu_temperature())
 
-    # write to log file the last time the image was saved (overwriting the previous time, if file not exists then create it)
-    current_dir = os.path.expanduser('~')
-    with open(current_dir + "/last_time.txt", "w") as f:
-        f.write(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
-
-    # (Uncomment for display) Add titles to identify each camera (central top with red color)
-    # show_camera_layout(frames, config, camera_error_text)
-
-    # Break the loop if 'q' is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-    # Measure the time of the main loop to sleep for the remaining time
-    mainLoopEndTime = time.time()
-    consumptionTime = mainLoopEndTime - mainLoopStartTime
-    sleepTime = interval_time - consumptionTime
-    
-    # (For saving power consumption) Sleep for interval_time seconds
-    print(f"Sleeping for {sleepTime} seconds")
-    time.sleep(sleepTime)
-
-cv2.destroyAllWindows()
+        # write to log file the last time the image was saved (overwriting the previous time, if file not exists then create it)
+        # [Note] the API reads the status block, the file is kept for other tools and replaced atomically
+        current_dir = os.path.expanduser('~')
+        write_atomic(current_dir + "/last_time.txt", time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()).encode())
+
+        # (Uncomment for display) Add titles to identify each camera (central top with red color)
+        # show_camera_layout(frames, config, camera_error_text, mosaic)
+
+        # Break the loop if 'q' is pressed
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+        # Measure the time of the main loop
+        mainLoopEndTime = time.time()
+        consumptionTime = mainLoopEndTime - mainLoopStartTime
+        status_block.update(frames, sessions.capture_wall_times, consumptionTime, writer.queue.qsize())
+        metrics.set('aiseed_cycle_duration_seconds', consumptionTime)
+        metrics.set('aiseed_write_queue_depth', writer.queue.qsize())
+        metrics.set('aiseed_missed_ticks', scheduler.missed_ticks)
+        metrics.write_textfile()
+        print(f"Cycle took {consumptionTime:.3f} seconds (missed ticks {scheduler.missed_ticks})")
+        reload_config()
+
+    cv2.destroyAllWindows()
+
+
+if __name__ == '__main__':
+    main()
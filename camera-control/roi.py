@@ -0,0 +1,119 @@
+"""
+Regions of interest (ROI in config.yaml): per camera, only the listed regions of the frame are saved, as
+`<timestamp>_<NAME>.jpg` next to where the full frame would be, instead of the whole 4K frame.
+
+    REGIONS: [{NAME: "bed1", RECT: [0.0, 0.25, 0.5, 0.5]}]   rectangles, [x, y, width, height] fractions
+    TILES: [2, 3]                                           a rows x columns grid, tiles r0c0 .. r1c2
+    CONTEXT_WIDTH: 960                                      also save the whole frame resized to this width
+
+The regions are views into the captured frame (nothing is copied before the JPEG encode). The resized frame, when
+there is one, is saved as the image itself, so the catalog and the latest image endpoints keep working. Without
+CONTEXT_WIDTH only the regions are saved: the camera has no latest image (the endpoints answer 404).
+"""
+import os
+import re
+
+from derivatives import resize_to_width, derivative_path
+
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9-]+$')
+
+
+def tile_rects(rows, cols):
+    return [
+        (f"r{row}c{col}", (col / cols, row / rows, 1 / cols, 1 / rows))
+        for row in range(rows) for col in range(cols)
+    ]
+
+
+def roi_errors(roi_config, ix):
+    """
+    List of the errors of the ROI entry of camera `ix` (empty when it is valid).
+    """
+    errors = []
+    regions = roi_config.get('REGIONS') or []
+    if not isinstance(regions, list):
+        return [f"Check the config ROI.REGIONS of camera {ix}, must be a list"]
+    names = []
+    for region in regions:
+        rect = region.get('RECT') if isinstance(region, dict) else None
+        if not isinstance(rect, list) or len(rect) != 4 \
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) and 0 <= v <= 1 for v in rect) \
+                or rect[2] <= 0 or rect[3] <= 0 or rect[0] + rect[2] > 1 or rect[1] + rect[3] > 1:
+            errors.append(f"Check the config ROI of camera {ix}, RECT is [x, y, width, height] fractions of the frame")
+            continue
+        names.append(region.get('NAME'))
+    tiles = roi_config.get('TILES')
+    if tiles is not None:
+        if not isinstance(tiles, list) or len(tiles) != 2 \
+                or not all(isinstance(v, int) and not isinstance(v, bool) and v > 0 for v in tiles):
+            errors.append(f"Check the config ROI.TILES of camera {ix}, must be [rows, columns]")
+        else:
+            names.extend(name for name, _ in tile_rects(*tiles))
+    if not all(isinstance(name, str) and NAME_PATTERN.match(name) for name in names):
+        errors.append(f"Check the config ROI of camera {ix}, region names are letters, digits and -")
+    elif len(names) != len(set(names)):
+        errors.append(f"Check the config ROI of camera {ix}, a region name is used twice")
+    context_width = roi_config.get('CONTEXT_WIDTH')
+    if context_width is not None and (not isinstance(context_width, int) or isinstance(context_width, bool)
+                                      or context_width <= 0):
+        errors.append(f"Check the config ROI.CONTEXT_WIDTH of camera {ix}, must be a positive number of pixels")
+    return errors
+
+
+class CameraRegions:
+    def __init__(self, regions, context_width=None, context_quality=80):
+        # [(name, (x, y, width, height) fractions of the frame)]
+        self.regions = regions
+        # Width of the resized whole frame saved for context, None for the regions only
+        self.context_width = context_width
+        self.context_quality = context_quality
+
+    @classmethod
+    def from_config(cls, roi_config):
+        regions = [(region['NAME'], tuple(region['RECT'])) for region in roi_config.get('REGIONS') or []]
+        if roi_config.get('TILES'):
+            regions.extend(tile_rects(*roi_config['TILES']))
+        return cls(regions, roi_config.get('CONTEXT_WIDTH'), roi_config.get('CONTEXT_QUALITY', 80))
+
+    def crop(self, frame):
+        """
+        (name, view into `frame`) of every region.
+        """
+        height, width = frame.shape[:2]
+        crops = []
+        for name, (x, y, w, h) in self.regions:
+            x0, y0 = round(x * width), round(y * height)
+            x1, y1 = min(round((x + w) * width), width), min(round((y + h) * height), height)
+            crops.append((name, frame[y0:y1, x0:x1]))
+        return crops
+
+    def build(self, path, frame, quality):
+        """
+        Returns a list of (name, path, image, quality) for the regions and the context frame of `frame` saved at
+        `path` (name '' for the context frame, written at `path` itself).
+        """
+        outputs = [(name, derivative_path(path, name), image, quality) for name, image in self.crop(frame)]
+        if self.context_width:
+            outputs.append(('', path, resize_to_width(frame, self.context_width), self.context_quality))
+        return outputs
+
+
+class RegionSet:
+    """
+    CameraRegions of the cameras with an ROI entry, by camera name (the folder name, as in the catalog).
+    """
+
+    def __init__(self, cameras):
+        self.cameras = cameras
+
+    @classmethod
+    def from_config(cls, config):
+        entries = config.get('ROI') or []
+        cameras = {}
+        for name, roi_config in zip(config['CAMERAS_NAME'], entries):
+            if roi_config and (roi_config.get('REGIONS') or roi_config.get('TILES')):
+                cameras[os.path.basename(name)] = CameraRegions.from_config(roi_config)
+        return cls(cameras) if cameras else None
+
+    def get(self, camera):
+        return self.cameras.get(camera)
@@ -0,0 +1,235 @@
+import datetime
+import math
+import time
+
+MISSED_SKIP = 'skip'  # drop the missed ticks and wait for the next aligned tick
+MISSED_COALESCE = 'coalesce'  # fire once right away for all the missed ticks
+MISSED_POLICIES = (MISSED_SKIP, MISSED_COALESCE)
+
+WINDOW_HOURS = 'hours'  # LIGHT_START_HOUR..LIGHT_END_HOUR
+WINDOW_SOLAR = 'solar'  # sunrise..sunset at LATITUDE/LONGITUDE
+WINDOW_MODES = (WINDOW_HOURS, WINDOW_SOLAR)
+
+# Longest single sleep, the wall clock is re-checked after it (NTP steps, suspend)
+MAX_SLEEP = 60
+# Seconds between two interrupt() checks of a sleep
+POLL_INTERVAL = 2
+
+
+def _localize(tz, naive):
+    # pytz timezones need localize(), datetime.tzinfo implementations take replace()
+    if hasattr(tz, 'localize'):
+        return tz.localize(naive)
+    return naive.replace(tzinfo=tz)
+
+
+def _midnight(tz, date):
+    return _localize(tz, datetime.datetime.combine(date, datetime.time()))
+
+
+def sun_times(date, latitude, longitude, tz):
+    """
+    Sunrise and sunset of `date` at `latitude`/`longitude` (degrees, east positive) in `tz`, using the NOAA
+    approximation (about one minute of accuracy). Returns (None, None) during polar night and the whole day during
+    polar day.
+    """
+    g = 2 * math.pi / 365 * (date.timetuple().tm_yday - 1)
+    # Equation of time (minutes) and solar declination (radians)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(g) - 0.032077 * math.sin(g)
+                       - 0.014615 * math.cos(2 * g) - 0.040849 * math.sin(2 * g))
+    decl = (0.006918 - 0.399912 * math.cos(g) + 0.070257 * math.sin(g) - 0.006758 * math.cos(2 * g)
+            + 0.000907 * math.sin(2 * g) - 0.002697 * math.cos(3 * g) + 0.00148 * math.sin(3 * g))
+
+    lat = math.radians(latitude)
+    cos_ha = (math.cos(math.radians(90.833)) / (math.cos(lat) * math.cos(decl))
+              - math.tan(lat) * math.tan(decl))
+    if cos_ha > 1:
+        return None, None
+    if cos_ha < -1:
+        start = _midnight(tz, date)
+        return start, _midnight(tz, date + datetime.timedelta(days=1))
+
+    ha = math.degrees(math.acos(cos_ha))
+    utc_midnight = datetime.datetime.combine(date, datetime.time(), tzinfo=datetime.timezone.utc)
+    sunrise = utc_midnight + datetime.timedelta(minutes=720 - 4 * (longitude + ha) - eqtime)
+    sunset = utc_midnight + datetime.timedelta(minutes=720 - 4 * (longitude - ha) - eqtime)
+    return sunrise.astimezone(tz), sunset.astimezone(tz)
+
+
+class HourWindow:
+    """
+    Capture window from LIGHT_START_HOUR:00 to LIGHT_END_HOUR:59 every day.
+    """
+
+    def __init__(self, start_hour, end_hour, tz):
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.tz = tz
+
+    def bounds(self, date):
+        start = _midnight(self.tz, date) + datetime.timedelta(hours=self.start_hour)
+        end = _midnight(self.tz, date) + datetime.timedelta(hours=self.end_hour + 1)
+        return start, end
+
+    def __str__(self):
+        return f"{self.start_hour:02d}:00-{self.end_hour:02d}:59"
+
+
+class SolarWindow:
+    """
+    Capture window from sunrise to sunset (plus offsets) at the configured location.
+    """
+
+    def __init__(self, latitude, longitude, tz, sunrise_offset=0, sunset_offset=0):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.tz = tz
+        self.sunrise_offset = datetime.timedelta(minutes=sunrise_offset)
+        self.sunset_offset = datetime.timedelta(minutes=sunset_offset)
+
+    def bounds(self, date):
+        sunrise, sunset = sun_times(date, self.latitude, self.longitude, self.tz)
+        if sunrise is None:
+            return None, None
+        return sunrise + self.sunrise_offset, sunset + self.sunset_offset
+
+    def __str__(self):
+        return f"sunrise-sunset at {self.latitude:.4f},{self.longitude:.4f}"
+
+
+class CaptureScheduler:
+    """
+    Fires capture ticks aligned to the wall clock (e.g. exactly :00, :10, :20 for a 10 minute interval, counted
+    from local midnight) inside the daily capture window.
+
+    A cycle that overruns one or more ticks does not shift the schedule: the missed ticks are either skipped or
+    coalesced into one immediate capture (`missed_policy`), and counted in `missed_ticks`. Outside the window the
+    scheduler sleeps exactly until the first tick of the next window instead of polling.
+    """
+
+    def __init__(self, interval, window, tz, missed_policy=MISSED_SKIP):
+        self.interval = interval
+        self.window = window
+        self.tz = tz
+        self.missed_policy = missed_policy
+        self.last_tick = None
+        self.missed_ticks = 0
+
+    @classmethod
+    def from_config(cls, config, tz):
+        schedule_config = config.get('SCHEDULE') or {}
+        if schedule_config.get('WINDOW', WINDOW_HOURS) == WINDOW_SOLAR:
+            window = SolarWindow(schedule_config['LATITUDE'], schedule_config['LONGITUDE'], tz,
+                                 schedule_config.get('SUNRISE_OFFSET_MINUTES', 0),
+                                 schedule_config.get('SUNSET_OFFSET_MINUTES', 0))
+        else:
+            window = HourWindow(config['LIGHT_START_HOUR'], config['LIGHT_END_HOUR'], tz)
+        return cls(config['INTERVAL_TIME'] * 60, window, tz,
+                   schedule_config.get('MISSED_TICKS', MISSED_SKIP))
+
+    def now(self):
+        return datetime.datetime.now(self.tz)
+
+    def _align(self, moment):
+        # First grid tick at or after `moment`
+        midnight = _midnight(self.tz, moment.date())
+        elapsed = (moment - midnight).total_seconds()
+        return midnight + datetime.timedelta(seconds=math.ceil(elapsed / self.interval) * self.interval)
+
+    def next_tick(self, after):
+        """
+        First aligned tick at or after `after` that is inside the capture window.
+        """
+        tick = self._align(after)
+        # Look a few days ahead at most (polar night in solar mode)
+        for _ in range(8):
+            start, end = self.window.bounds(tick.date())
+            if start is not None:
+                if tick < start:
+                    tick = self._align(start)
+                if tick < end:
+                    return tick
+            tick = self._align(_midnight(self.tz, tick.date() + datetime.timedelta(days=1)))
+        raise RuntimeError(f"No capture window in the next week ({self.window})")
+
+    def in_window(self, moment):
+        start, end = self.window.bounds(moment.date())
+        return start is not None and start <= moment < end
+
+    def _count_ticks(self, start, end):
+        # Window ticks in [start, end)
+        count = 0
+        tick = self.next_tick(start)
+        while tick < end:
+            count += 1
+            tick = self.next_tick(tick + datetime.timedelta(seconds=self.interval))
+        return count
+
+    def plan(self, now):
+        """
+        Decide the next tick to fire. Returns (tick, fire_at): `fire_at` is when to wake up, which is `now` for a
+        coalesced capture of missed ticks.
+        """
+        if self.last_tick is None:
+            tick = self.next_tick(now)
+            return tick, tick
+
+        expected = self.next_tick(self.last_tick + datetime.timedelta(seconds=self.interval))
+        if expected >= now:
+            return expected, expected
+
+        missed = self._count_ticks(expected, now)
+        if self.missed_policy == MISSED_COALESCE:
+            # Fire once now, standing for the latest missed tick
+            latest = expected
+            tick = expected
+            while tick < now:
+                latest = tick
+                tick = self.next_tick(tick + datetime.timedelta(seconds=self.interval))
+            self.missed_ticks += missed - 1
+            print(f"Scheduler: cycle overran, coalesced {missed} missed ticks into one capture "
+                  f"(missed total {self.missed_ticks})")
+            return latest, now
+
+        self.missed_ticks += missed
+        tick = self.next_tick(now)
+        print(f"Scheduler: cycle overran, skipped {missed} ticks (missed total {self.missed_ticks})")
+        return tick, tick
+
+    def reconfigure(self, other):
+        """
+        Take the interval, window and missed tick policy of `other` (a scheduler built from a reloaded config).
+        The last tick and the missed tick count are kept, the next tick is aligned on the new interval.
+        """
+        self.interval = other.interval
+        self.window = other.window
+        self.missed_policy = other.missed_policy
+
+    def wait(self, on_sleep=None, interrupt=None, poll_interval=POLL_INTERVAL):
+        """
+        Sleep until the next tick and return it. `on_sleep(seconds)` is called before a sleep, so the caller can
+        release resources it will not need until then. `interrupt()` is checked every `poll_interval` seconds of
+        the sleep: when it returns True the wait is abandoned and None is returned (the tick is not consumed).
+        """
+        now = self.now()
+        tick, fire_at = self.plan(now)
+        delay = (fire_at - now).total_seconds()
+        if delay > 0:
+            print(f"Sleeping for {delay:.1f} seconds until {tick.strftime('%Y-%m-%d %H:%M:%S')}")
+            if on_sleep is not None:
+                on_sleep(delay)
+            if not self._sleep_until(fire_at, interrupt, poll_interval):
+                return None
+        self.last_tick = tick
+        return tick
+
+    def _sleep_until(self, moment, interrupt=None, poll_interval=POLL_INTERVAL):
+        target = moment.timestamp()
+        step = MAX_SLEEP if interrupt is None else poll_interval
+        while True:
+            remaining = target - time.time()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, step))
+            if interrupt is not None and interrupt():
+                return False
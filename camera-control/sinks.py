@@ -0,0 +1,336 @@
+"""
+Destinations of the encoded images, selected with SINK.TYPE in config.yaml.
+
+- cifs: files on the mounted shared folder (through the spool when it is enabled), the original behaviour
+- http: batched multipart uploads to an ingestion server (see ingest_server.py), no SMB mount needed
+"""
+import hashlib
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from image_writer import write_atomic
+from metrics import registry as metrics
+from catalog import STATUS_WRITTEN, STATUS_QUEUED, STATUS_UPLOADED, STATUS_OUTBOX, STATUS_REJECTED
+
+SINK_CIFS = 'cifs'
+SINK_HTTP = 'http'
+SINK_TYPES = (SINK_CIFS, SINK_HTTP)
+
+# 4xx answers worth retrying (timeout, batch damaged in transit, rate limited), the other 4xx drop the batch
+RETRY_STATUS = (408, 409, 429)
+
+
+class FileSink:
+    """
+    Writes the images in place, on the shared folder. With a `spool` the images are kept locally while the share
+    is down.
+    """
+
+    def __init__(self, spool=None):
+        self.spool = spool
+        # (the spool reports the status changes itself)
+        self.on_status = lambda path, status: None
+
+    def write(self, path, data):
+        """
+        Returns the catalog status of the image.
+        """
+        if self.spool is not None:
+            return self.spool.write(path, data)
+        write_atomic(path, data)
+        return STATUS_WRITTEN
+
+    def report(self):
+        if self.spool is not None:
+            self.spool.report()
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.stop()
+
+
+class UploadItem:
+    __slots__ = ('path', 'rel_path', 'data', 'key')
+
+    def __init__(self, path, rel_path, data, key):
+        # Local path the image would have on the share (the catalog key), and its path on the server
+        self.path = path
+        self.rel_path = rel_path
+        self.data = data
+        # Idempotency key: the server stores an image once, however many times the upload is retried
+        self.key = key
+
+
+class PermanentUploadError(Exception):
+    pass
+
+
+class HttpSink:
+    """
+    Uploads the images to an ingestion server.
+
+    write() only queues the image. A sender thread groups the queued images into multipart batches (up to
+    `batch_size` images or `batch_bytes`, waiting at most `flush_interval` seconds for a batch to fill) and posts
+    them over one keep-alive session, retrying with exponential backoff. A batch that still fails is saved in
+    `outbox_dir` on the SD card and uploaded again once the server answers, oldest first.
+    """
+
+    def __init__(self, url, share_root='~/shared_folder', token=None, batch_size=8, batch_bytes=8 * 1024 * 1024,
+                 flush_interval=2, timeout=30, retries=5, backoff=1, max_backoff=60, outbox_dir='~/outbox',
+                 queue_size=64):
+        self.url = url
+        self.home = os.path.expanduser('~')
+        self.share_root = os.path.expanduser(share_root)
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.outbox_dir = os.path.expanduser(outbox_dir)
+        self.device = socket.gethostname()
+        # on_status(path, status): called when an upload succeeds or fails (see catalog.py)
+        self.on_status = lambda path, status: None
+
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # The outbox is retried on its own schedule (time.monotonic()), with a backoff while the server is down,
+        # so the live uploads are never held up behind it
+        self._outbox_retry_at = 0.0
+        self._outbox_failures = 0
+
+        # Counters
+        self.uploaded = 0
+        self.duplicates = 0
+        self.failed_batches = 0
+        self.outboxed = 0
+        self.last_upload_latency = 0.0
+
+        os.makedirs(self.outbox_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._send_loop, name='http-sink', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, config):
+        sink_config = config.get('SINK') or {}
+        return cls(url=sink_config['URL'],
+                   share_root=(config.get('SPOOL') or {}).get('SHARE_ROOT', '~/shared_folder'),
+                   token=sink_config.get('TOKEN'),
+                   batch_size=sink_config.get('BATCH_SIZE', 8),
+                   batch_bytes=sink_config.get('BATCH_KB', 8192) * 1024,
+                   flush_interval=sink_config.get('FLUSH_SECONDS', 2),
+                   timeout=sink_config.get('TIMEOUT', 30),
+                   retries=sink_config.get('RETRIES', 5),
+                   outbox_dir=sink_config.get('OUTBOX_DIR', '~/outbox'))
+
+    def relative_path(self, path):
+        # Path of the image on the server: relative to the shared folder (or to the home directory)
+        path = os.path.abspath(path)
+        root = self.share_root if path.startswith(self.share_root + os.sep) else self.home
+        return os.path.relpath(path, root)
+
+    def write(self, path, data):
+        rel_path = self.relative_path(path)
+        data = bytes(data)
+        key = f"{self.device}:{rel_path}:{hashlib.sha256(data).hexdigest()[:16]}"
+        item = UploadItem(path, rel_path, data, key)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # The server is slower than the captures: keep the image on disk for later
+            self._save_outbox([item])
+            return STATUS_OUTBOX
+        return STATUS_QUEUED
+
+    def _next_batch(self):
+        try:
+            item = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [item]
+        size = len(item.data)
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and size < self.batch_bytes:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item.data)
+        return batch
+
+    def _send_loop(self):
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                if not self._send(batch, retries=0 if self._stop.is_set() else self.retries):
+                    self._save_outbox(batch)
+            elif not self._stop.is_set() and time.monotonic() >= self._outbox_retry_at:
+                # Idle: resend the outbox
+                self._drain_outbox()
+
+    def _post(self, batch):
+        manifest = [{'key': item.key, 'path': item.rel_path, 'size': len(item.data),
+                     'sha256': hashlib.sha256(item.data).hexdigest()} for item in batch]
+        files = [(f"image{ix}", (item.rel_path, item.data, 'image/jpeg')) for ix, item in enumerate(batch)]
+        batch_key = hashlib.sha256('|'.join(item.key for item in batch).encode()).hexdigest()
+        response = self.session.post(self.url, data={'manifest': json.dumps(manifest)}, files=files,
+                                     headers={'Idempotency-Key': batch_key}, timeout=self.timeout)
+        if 400 <= response.status_code < 500 and response.status_code not in RETRY_STATUS:
+            raise PermanentUploadError(f"HTTP {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+        return response.json()
+
+    def _send(self, batch, retries):
+        """
+        Upload a batch, retrying with exponential backoff. Returns False if it should be kept for later.
+        """
+        for attempt in range(retries + 1):
+            start = time.monotonic()
+            try:
+                result = self._post(batch)
+            except PermanentUploadError as e:
+                metrics.inc('aiseed_upload_failures_total', reason='rejected')
+                print(f"Error: the ingestion server rejected {len(batch)} images, dropped: {e}")
+                for item in batch:
+                    self.on_status(item.path, STATUS_REJECTED)
+                return True
+            except (requests.RequestException, ValueError) as e:
+                metrics.inc('aiseed_upload_failures_total', reason='error')
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"Error: upload of {len(batch)} images failed (attempt {attempt + 1}): {e}")
+                if attempt < retries and not self._stop.wait(delay):
+                    continue
+                with self._lock:
+                    self.failed_batches += 1
+                return False
+            latency = time.monotonic() - start
+            metrics.observe('aiseed_upload_seconds', latency)
+            metrics.inc('aiseed_bytes_uploaded_total', sum(len(item.data) for item in batch))
+            with self._lock:
+                self.uploaded += len(result.get('stored', []))
+                self.duplicates += len(result.get('duplicates', []))
+                self.last_upload_latency = latency
+            for item in batch:
+                self.on_status(item.path, STATUS_UPLOADED)
+            return True
+
+    @staticmethod
+    def _sidecar_path(outbox_path):
+        # Hidden file next to an outbox image holding its catalog path (the share path is not always rel_path
+        # under share_root, see relative_path)
+        return os.path.join(os.path.dirname(outbox_path), f".{os.path.basename(outbox_path)}.path")
+
+    def _save_outbox(self, batch):
+        for item in batch:
+            try:
+                outbox_path = os.path.join(self.outbox_dir, item.rel_path)
+                os.makedirs(os.path.dirname(outbox_path), exist_ok=True)
+                write_atomic(self._sidecar_path(outbox_path), item.path.encode())
+                write_atomic(outbox_path, item.data)
+            except OSError as e:
+                print(f"Error: unable to keep {item.rel_path} in the outbox, dropped: {e}")
+                continue
+            self.on_status(item.path, STATUS_OUTBOX)
+            with self._lock:
+                self.outboxed += 1
+
+    def _outbox_files(self):
+        entries = []
+        for root, _, files in os.walk(self.outbox_dir):
+            for name in files:
+                if not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    try:
+                        entries.append((os.stat(path).st_mtime, path))
+                    except OSError:
+                        continue
+        return [path for _, path in sorted(entries)]
+
+    def _drain_outbox(self):
+        paths = self._outbox_files()
+        metrics.set('aiseed_outbox_files', len(paths))
+        batch, size = [], 0
+        for path in paths:
+            if len(batch) >= self.batch_size or size >= self.batch_bytes or not self.queue.empty():
+                break
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError as e:
+                print(f"Error: unable to read {path} from the outbox: {e}")
+                continue
+            rel_path = os.path.relpath(path, self.outbox_dir)
+            try:
+                with open(self._sidecar_path(path), 'r') as f:
+                    catalog_path = f.read()
+            except OSError:
+                # Outbox written before the sidecar files existed
+                catalog_path = os.path.join(self.share_root, rel_path)
+            key = f"{self.device}:{rel_path}:{hashlib.sha256(data).hexdigest()[:16]}"
+            batch.append((path, UploadItem(catalog_path, rel_path, data, key)))
+            size += len(data)
+        if batch and self._send([item for _, item in batch], retries=0):
+            for path, _ in batch:
+                for remove_path in (path, self._sidecar_path(path)):
+                    try:
+                        os.remove(remove_path)
+                    except OSError:
+                        pass
+            self._outbox_failures = 0
+            print(f"Outbox: uploaded {len(batch)} images")
+        elif batch:
+            # The server is still unreachable: the live uploads go on, the outbox is retried later
+            delay = min(self.max_backoff, self.backoff * 2 ** self._outbox_failures) * random.uniform(0.5, 1.5)
+            self._outbox_failures += 1
+            self._outbox_retry_at = time.monotonic() + delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'uploaded': self.uploaded,
+                'duplicates': self.duplicates,
+                'failed_batches': self.failed_batches,
+                'outboxed': self.outboxed,
+                'last_upload_latency': self.last_upload_latency,
+            }
+
+    def report(self):
+        s = self.stats()
+        print(f"HTTP sink: queue {s['queue_depth']}, uploaded {s['uploaded']}, duplicates {s['duplicates']}, "
+              f"failed batches {s['failed_batches']}, outboxed {s['outboxed']}, "
+              f"last upload {s['last_upload_latency']:.3f}s")
+
+    def close(self):
+        """
+        Upload what is still queued (one attempt, the rest goes to the outbox) and stop the sender thread.
+        """
+        self._stop.set()
+        self._thread.join()
+        self.session.close()
+        self.report()
+
+
+def sink_from_config(config, spool=None):
+    sink_type = (config.get('SINK') or {}).get('TYPE', SINK_CIFS)
+    if sink_type == SINK_HTTP:
+        return HttpSink.from_config(config)
+    return FileSink(spool)
@@ -0,0 +1,243 @@
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from image_writer import write_atomic
+from catalog import STATUS_WRITTEN, STATUS_SPOOLED, STATUS_EVICTED
+
+NETWORK_FILESYSTEMS = ('cifs', 'smb3', 'smbfs')
+
+
+def is_network_mount(mountpoint):
+    """
+    Check /proc/mounts for a CIFS mount on `mountpoint`. Unlike touching the share itself this never blocks on a
+    stalled SMB server, and it is False when the share dropped and only the bare mountpoint directory is left.
+    """
+    mountpoint = os.path.realpath(mountpoint)
+    try:
+        with open('/proc/mounts', 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # /proc/mounts escapes spaces in paths as \040
+                target = fields[1].replace('\\040', ' ')
+                if target == mountpoint and fields[2] in NETWORK_FILESYSTEMS:
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+class Spool:
+    """
+    Local store-and-forward spool for the shared folder.
+
+    While the CIFS share is not mounted (or a write to it fails) images are kept under `spool_dir` on the SD card,
+    with the same path relative to the home directory. The spool is bounded by `max_bytes` and `max_files`, evicting
+    the oldest images first. A background thread moves the backlog to the share, oldest first, at `drain_rate`
+    bytes per second once the mount is back, and pauses whenever live captures are waiting to be written.
+    """
+
+    def __init__(self, share_root, spool_dir, max_bytes, max_files, drain_rate, mount_check_interval=10):
+        self.home = os.path.expanduser('~')
+        self.share_root = os.path.expanduser(share_root)
+        self.spool_dir = os.path.expanduser(spool_dir)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.drain_rate = drain_rate
+        self.mount_check_interval = mount_check_interval
+        self.is_busy = lambda: False
+        # on_status(path, status): called when an image leaves the spool (see catalog.py)
+        self.on_status = lambda path, status: None
+
+        self._lock = threading.Lock()
+        # relative path -> size, oldest first
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._mount_live = False
+        self._mount_checked_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.spooled = 0
+        self.evicted = 0
+        self.drained = 0
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._load_index()
+
+    @classmethod
+    def from_config(cls, config):
+        spool_config = config.get('SPOOL') or {}
+        return cls(share_root=spool_config.get('SHARE_ROOT', '~/shared_folder'),
+                   spool_dir=spool_config.get('DIR', '~/spool'),
+                   max_bytes=spool_config.get('MAX_MB', 4096) * 1024 * 1024,
+                   max_files=spool_config.get('MAX_FILES', 20000),
+                   drain_rate=spool_config.get('DRAIN_RATE_KB', 2048) * 1024)
+
+    def _load_index(self):
+        # Rebuild the index of a spool left over from a previous run, oldest first
+        entries = []
+        for root, _, files in os.walk(self.spool_dir):
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, os.path.relpath(path, self.spool_dir), st.st_size))
+        for _, rel_path, size in sorted(entries):
+            self._index[rel_path] = size
+            self._bytes += size
+        if entries:
+            print(f"Spool: {len(entries)} images ({self._bytes / 1e6:.1f}MB) waiting for the shared folder")
+
+    def mount_live(self):
+        now = time.monotonic()
+        if self._mount_checked_at is None or now - self._mount_checked_at >= self.mount_check_interval:
+            live = is_network_mount(self.share_root)
+            if live != self._mount_live:
+                print(f"Shared folder {self.share_root} is {'mounted' if live else 'NOT mounted'}")
+            self._mount_live = live
+            self._mount_checked_at = now
+        return self._mount_live
+
+    def covers(self, path):
+        return os.path.abspath(path).startswith(self.share_root + os.sep)
+
+    def write(self, path, data):
+        """
+        Write `data` to `path` on the share, or into the spool when the share is unavailable.
+        Returns the catalog status of the image (written, spooled, or evicted when it is too large to spool).
+        """
+        if not self.covers(path):
+            write_atomic(path, data)
+            return STATUS_WRITTEN
+        if self.mount_live():
+            try:
+                write_atomic(path, data)
+                return STATUS_WRITTEN
+            except OSError as e:
+                print(f"Error: unable to write {path} to the shared folder, spooling it: {e}")
+        return STATUS_SPOOLED if self.put(path, data) else STATUS_EVICTED
+
+    def put(self, path, data):
+        rel_path = os.path.relpath(os.path.abspath(path), self.home)
+        if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+            # (SHARE_ROOT outside the home directory, rejected by the config validation) the spooled copy would
+            # land outside the spool, on the bare mountpoint
+            print(f"Error: {path} is outside the home directory, it can not be spooled, dropped")
+            return False
+        size = len(data)
+        if size > self.max_bytes:
+            print(f"Error: {path} is larger than the spool quota, dropped")
+            return False
+
+        evicted = []
+        with self._lock:
+            while self._index and (self._bytes + size > self.max_bytes or len(self._index) >= self.max_files):
+                evicted.append(self._evict_oldest())
+        # (outside the lock: the callback writes to the catalog)
+        for evicted_path in evicted:
+            self.on_status(os.path.join(self.home, evicted_path), STATUS_EVICTED)
+        spool_path = os.path.join(self.spool_dir, rel_path)
+        os.makedirs(os.path.dirname(spool_path), exist_ok=True)
+        write_atomic(spool_path, data)
+        with self._lock:
+            self._index[rel_path] = size
+            self._bytes += size
+            self.spooled += 1
+        return True
+
+    def _evict_oldest(self):
+        # With the lock held, returns the relative path of the evicted image
+        rel_path, size = self._index.popitem(last=False)
+        self._bytes -= size
+        self.evicted += 1
+        try:
+            os.remove(os.path.join(self.spool_dir, rel_path))
+        except OSError:
+            pass
+        print(f"Spool full: evicted {rel_path}")
+        return rel_path
+
+    def start(self, is_busy=None):
+        if is_busy is not None:
+            self.is_busy = is_busy
+        self._thread = threading.Thread(target=self._drain_loop, name='spool-drain', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _drain_loop(self):
+        while not self._stop.is_set():
+            with self._lock:
+                pending = len(self._index)
+            if not pending or not self.mount_live() or self.is_busy():
+                self._stop.wait(1 if pending else self.mount_check_interval)
+                continue
+            size = self._drain_one()
+            if size is None:
+                # The share is failing: back off until the next mount check
+                self._stop.wait(self.mount_check_interval)
+                continue
+            # Rate limit, so the drain leaves bandwidth for the live captures
+            self._stop.wait(size / self.drain_rate)
+
+    def _drain_one(self):
+        with self._lock:
+            if not self._index:
+                return 0
+            rel_path, size = next(iter(self._index.items()))
+        spool_path = os.path.join(self.spool_dir, rel_path)
+        target = os.path.join(self.home, rel_path)
+        tmp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.tmp")
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(spool_path, tmp_path)
+            os.replace(tmp_path, target)
+            os.remove(spool_path)
+        except OSError as e:
+            if isinstance(e, FileNotFoundError) and not os.path.exists(spool_path):
+                # Evicted while it was being copied
+                pass
+            else:
+                print(f"Error: unable to drain {rel_path} to the shared folder: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return None
+
+        with self._lock:
+            if self._index.pop(rel_path, None) is not None:
+                self._bytes -= size
+                self.drained += 1
+        self.on_status(target, STATUS_WRITTEN)
+        return size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mount_live': self._mount_live,
+                'files': len(self._index),
+                'bytes': self._bytes,
+                'spooled': self.spooled,
+                'evicted': self.evicted,
+                'drained': self.drained,
+            }
+
+    def report(self):
+        s = self.stats()
+        if s['files'] or s['spooled']:
+            print(f"Spool: {s['files']} images ({s['bytes'] / 1e6:.1f}MB) pending, spooled {s['spooled']}, "
+                  f"drained {s['drained']}, evicted {s['evicted']}")
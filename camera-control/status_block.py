@@ -0,0 +1,161 @@
+"""
+Fixed-layout capture status block shared between the recorder and the API through a memory-mapped file.
+
+The recorder is the only writer. Updates are guarded by a sequence counter (seqlock): the writer makes it odd
+before changing the block and even again afterwards, and a reader retries until it sees the same even value
+before and after copying the block, so it never returns a half-updated status.
+"""
+import mmap
+import os
+import struct
+import time
+
+STATUS_BLOCK_PATH = '/dev/shm/aiseed-capture-status' if os.path.isdir('/dev/shm') \
+    else os.path.join(os.path.expanduser('~'), '.aiseed-capture-status')
+
+MAGIC = b'AICS'
+VERSION = 1
+MAX_CAMERAS = 16
+NAME_SIZE = 64
+
+# magic, version, number of cameras, sequence, updated at (last cycle), cycle duration (s), write queue depth,
+# heartbeat (epoch s, refreshed between the cycles too, 0 for a block written before it existed)
+HEADER = struct.Struct('<4sHHQddII')
+# name, last capture, last success, last failure (epoch s, 0 = never), last capture ok, frame width, height
+CAMERA = struct.Struct(f'<{NAME_SIZE}sdddB3xII')
+BLOCK_SIZE = HEADER.size + MAX_CAMERAS * CAMERA.size
+SEQ_OFFSET = 8
+
+
+class CameraStatus:
+    __slots__ = ('name', 'last_capture', 'last_success', 'last_failure', 'ok', 'width', 'height')
+
+    def __init__(self, name, last_capture=0.0, last_success=0.0, last_failure=0.0, ok=False, width=0, height=0):
+        self.name = name
+        self.last_capture = last_capture
+        self.last_success = last_success
+        self.last_failure = last_failure
+        self.ok = ok
+        self.width = width
+        self.height = height
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class StatusBlockWriter:
+    def __init__(self, names, path=STATUS_BLOCK_PATH):
+        if len(names) > MAX_CAMERAS:
+            raise ValueError(f"The status block holds at most {MAX_CAMERAS} cameras")
+        self.cameras = [CameraStatus(name) for name in names]
+        self.seq = 0
+        # Reuse the file (and its inode) so the readers that already mapped it keep working across restarts
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, BLOCK_SIZE)
+            self._map = mmap.mmap(fd, BLOCK_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.seq = struct.unpack_from('<Q', self._map, SEQ_OFFSET)[0]
+        if self.seq % 2:
+            # The previous writer died in the middle of an update
+            self.seq += 1
+        # Status of the last cycle, kept by the heartbeats (and from the previous run until the first cycle)
+        magic, version, _, _, self.updated_at, self.cycle_duration, self.queue_depth, _ = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.updated_at, self.cycle_duration, self.queue_depth = 0.0, 0.0, 0
+
+    def update(self, frames, capture_times, cycle_duration, queue_depth):
+        """
+        Record one capture cycle. `capture_times` are the wall-clock capture times (None for a failed camera).
+        """
+        for camera, frame, captured_at in zip(self.cameras, frames, capture_times):
+            camera.last_capture = captured_at or time.time()
+            camera.ok = frame is not None
+            if camera.ok:
+                camera.last_success = camera.last_capture
+                camera.height, camera.width = frame.shape[:2]
+            else:
+                camera.last_failure = camera.last_capture
+        self.updated_at = time.time()
+        self.cycle_duration = cycle_duration
+        self.queue_depth = queue_depth
+        self.write()
+
+    def heartbeat(self):
+        """
+        Show that the recorder is alive between the cycles (it sleeps all night outside the capture window), the
+        status of the last cycle is unchanged.
+        """
+        self.write()
+
+    def write(self):
+        buf = self._map
+        self.seq += 1
+        struct.pack_into('<Q', buf, SEQ_OFFSET, self.seq)
+        HEADER.pack_into(buf, 0, MAGIC, VERSION, len(self.cameras), self.seq, self.updated_at, self.cycle_duration,
+                         self.queue_depth, int(time.time()))
+        for ix, camera in enumerate(self.cameras):
+            CAMERA.pack_into(buf, HEADER.size + ix * CAMERA.size,
+                             camera.name.encode()[:NAME_SIZE], camera.last_capture, camera.last_success,
+                             camera.last_failure, camera.ok, camera.width, camera.height)
+        self.seq += 1
+        struct.pack_into('<Q', buf, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        self._map.close()
+
+
+class StatusBlockReader:
+    def __init__(self, path=STATUS_BLOCK_PATH):
+        self.path = path
+        self._map = None
+
+    def _open(self):
+        if self._map is None:
+            try:
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), BLOCK_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+            except (OSError, ValueError):
+                # The recorder has not created the block yet
+                return False
+        return True
+
+    def read(self, retries=100):
+        """
+        Consistent snapshot of the block as a dict, or None if the recorder never wrote it.
+        """
+        if not self._open():
+            return None
+        buf = self._map
+        for _ in range(retries):
+            seq = struct.unpack_from('<Q', buf, SEQ_OFFSET)[0]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            data = buf[:BLOCK_SIZE]
+            if struct.unpack_from('<Q', buf, SEQ_OFFSET)[0] == seq:
+                return self._parse(data)
+        return None
+
+    @staticmethod
+    def _parse(data):
+        magic, version, num_cameras, seq, updated_at, cycle_duration, queue_depth, heartbeat_at = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            return None
+        cameras = []
+        for ix in range(min(num_cameras, MAX_CAMERAS)):
+            name, *fields = CAMERA.unpack_from(data, HEADER.size + ix * CAMERA.size)
+            camera = CameraStatus(name.rstrip(b'\0').decode(errors='replace'), *fields)
+            camera.ok = bool(camera.ok)
+            cameras.append(camera.to_dict())
+        return {
+            'seq': seq,
+            'updated_at': updated_at,
+            'cycle_duration': cycle_duration,
+            'queue_depth': queue_depth,
+            'heartbeat_at': heartbeat_at,
+            'cameras': cameras,
+        }
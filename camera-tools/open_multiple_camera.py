@@ -5,6 +5,7 @@ import time
 import os
 import pytz
 import datetime
+from functools import lru_cache
 
 # YAML Configuration
 config_data = """
@@ -62,14 +63,17 @@ def get_cpu_temperature():
         return f"Unable to retrieve CPU temperature: {e}"
 
 
-def adjust_gamma(image, gamma=1.0):
+@lru_cache(maxsize=16)
+def gamma_table(gamma):
     # build a lookup table mapping the pixel values [0, 255] to
-    # their adjusted gamma values
+    # their adjusted gamma values (built once per gamma value)
     invGamma = 1.0 / gamma
-    table = np.array([((i / 255.0) ** invGamma) * 255
-                      for i in np.arange(0, 256)]).astype("uint8")
+    return (np.power(np.arange(0, 256) / 255.0, invGamma) * 255).astype("uint8")
+
+
+def adjust_gamma(image, gamma=1.0):
     # apply gamma correction using the lookup table
-    return cv2.LUT(image, table)
+    return cv2.LUT(image, gamma_table(gamma))
 
 
 def read_config(config_file):
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The recorder modules are flat files in camera-control/ (imported by name, like api/run.py does)
+sys.path.insert(0, os.path.join(ROOT, 'camera-control'))
+sys.path.insert(0, ROOT)
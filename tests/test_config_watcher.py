@@ -0,0 +1,138 @@
+import copy
+import os
+
+import pytest
+import yaml
+
+from config_watcher import ConfigWatcher, check_number, check_section
+from recording import validate_config
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'camera-control',
+                           'config.yaml')
+
+
+@pytest.fixture
+def running():
+    with open(CONFIG_FILE, 'r') as f:
+        return yaml.safe_load(f)
+
+
+@pytest.fixture
+def config_path(tmp_path, running):
+    path = tmp_path / 'config.yaml'
+    path.write_text(yaml.safe_dump(running))
+    return path
+
+
+def save(path, config):
+    # Editors save within the same second: move the mtime so the edit is always seen
+    path.write_text(config if isinstance(config, str) else yaml.safe_dump(config))
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_shipped_config_is_valid(running):
+    assert validate_config(running) == []
+
+
+def test_unchanged_file_is_not_read(config_path, running):
+    watcher = ConfigWatcher(str(config_path), running, validate_config)
+    assert not watcher.changed()
+    assert watcher.poll() is None
+
+
+def test_valid_edit_is_returned_with_its_changed_keys(config_path, running):
+    watcher = ConfigWatcher(str(config_path), running, validate_config)
+    edited = copy.deepcopy(running)
+    edited['INTERVAL_TIME'] = 10
+    edited['LIGHT_END_HOUR'] = 19
+    save(config_path, edited)
+
+    config, keys = watcher.poll()
+    assert keys == ['INTERVAL_TIME', 'LIGHT_END_HOUR']
+    assert config['INTERVAL_TIME'] == 10
+    assert watcher.config is config
+    assert not watcher.changed()
+
+
+@pytest.mark.parametrize('edit', [
+    lambda config: config.update(INTERVAL_TIME=0),
+    lambda config: config.update(RES_DROP=[800, 600]),
+    lambda config: config.update(SINK='http'),
+    lambda config: config['ROI'].__setitem__(0, {'REGIONS': 'bed1'}),
+    lambda config: config['MOTION'].update(MASKS=[0.5, []]),
+])
+def test_invalid_edit_keeps_the_running_config(config_path, running, edit):
+    watcher = ConfigWatcher(str(config_path), running, validate_config)
+    edited = copy.deepcopy(running)
+    edit(edited)
+    save(config_path, edited)
+
+    assert watcher.poll() is None
+    assert watcher.config is running
+    # The rejected version is not read (nor logged) again
+    assert not watcher.changed()
+
+
+def test_unreadable_files_and_failing_validations_are_rejected(config_path, running):
+    watcher = ConfigWatcher(str(config_path), running, validate_config)
+    save(config_path, "INTERVAL_TIME: [5")
+    assert watcher.poll() is None
+    save(config_path, "- 5")
+    assert watcher.poll() is None
+
+    def crashing(config):
+        raise KeyError('CAMERA_INDEXES')
+
+    watcher = ConfigWatcher(str(config_path), running, crashing)
+    save(config_path, running)
+    assert watcher.poll() is None
+    assert watcher.config is running
+
+
+def test_restart_only_keys_keep_their_running_value(config_path, running):
+    watcher = ConfigWatcher(str(config_path), running, validate_config)
+    edited = copy.deepcopy(running)
+    edited['CAMERAS_NAME'] = ['shared_folder/a', 'shared_folder/b']
+    edited['IMAGE_WRITER'].update(WORKERS=4, JPEG_QUALITY=90)
+    save(config_path, edited)
+
+    config, keys = watcher.poll()
+    assert config['CAMERAS_NAME'] == running['CAMERAS_NAME']
+    assert config['IMAGE_WRITER']['WORKERS'] == running['IMAGE_WRITER']['WORKERS']
+    assert config['IMAGE_WRITER']['JPEG_QUALITY'] == 90
+    assert 'CAMERAS_NAME' not in keys and 'IMAGE_WRITER' in keys
+
+
+def test_rollback_after_a_failed_apply(config_path, running):
+    watcher = ConfigWatcher(str(config_path), running, validate_config)
+    edited = copy.deepcopy(running)
+    edited['INTERVAL_TIME'] = 10
+    save(config_path, edited)
+    config, _ = watcher.poll()
+
+    # The recorder could not apply `config`: back to the running one, without reading the same file again
+    watcher.rollback(running)
+    assert watcher.config is running
+    assert not watcher.changed()
+
+    # The next edit is compared with the running config, so the rolled back change is reported again
+    edited['LIGHT_START_HOUR'] = 7
+    save(config_path, edited)
+    config, keys = watcher.poll()
+    assert keys == ['INTERVAL_TIME', 'LIGHT_START_HOUR']
+
+
+def test_check_helpers():
+    errors = []
+    check_number(errors, 'A', True)
+    check_number(errors, 'B', 1.5, integer=True)
+    check_number(errors, 'C', 0, above=0)
+    check_number(errors, 'D', 5, low=0, high=10, integer=True)
+    assert errors == ["Check the config A, must be a number",
+                      "Check the config B, must be an integer",
+                      "Check the config C, must be a number above 0"]
+    assert check_section(errors, {'S': {'K': 1}}, 'S') == {'K': 1}
+    assert check_section(errors, {}, 'S') == {}
+    assert check_section(errors, {'S': [1]}, 'S') == {}
+    assert errors[-1] == "Check the config S, must be a mapping"
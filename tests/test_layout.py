@@ -0,0 +1,86 @@
+import datetime
+import fnmatch
+import os
+
+import pytest
+
+from layout import StorageLayout, template_errors, get_layout, DEFAULT_TEMPLATE
+
+MOMENT = datetime.datetime(2024, 5, 1, 12, 3, 9)
+
+TEMPLATES = [
+    ('{camera}/{timestamp}.jpg', '2024-05-01-12-03-09.jpg'),
+    ('{camera}/{YYYY}/{MM}/{DD}/{HHMMSS}.jpg', '2024/05/01/120309.jpg'),
+    ('{camera}/{date}/{HH}-{MIN}-{SS}.png', '2024-05-01/12-03-09.png'),
+    ('{camera}/{YYYY}{MM}/{DD}_{HH}{MIN}{SS}.jpg', '202405/01_120309.jpg'),
+]
+
+
+@pytest.mark.parametrize('template, rel_path', TEMPLATES)
+def test_format_parse_round_trip(template, rel_path):
+    layout = StorageLayout(template)
+    assert template_errors(template) == []
+    assert layout.relative_path(MOMENT) == rel_path
+    assert layout.parse(rel_path) == MOMENT
+    assert layout.path('/home/pi', 'cam', MOMENT) == os.path.join('/home/pi', 'cam', rel_path)
+
+
+@pytest.mark.parametrize('template, rel_path', TEMPLATES)
+def test_derivatives_parse_to_their_image(template, rel_path):
+    layout = StorageLayout(template)
+    stem, ext = os.path.splitext(rel_path)
+    derivative = f"{stem}_thumb{ext}"
+    assert layout.parse(derivative) == MOMENT
+    assert layout.is_derivative(derivative)
+    assert not layout.is_derivative(rel_path)
+    assert layout.derivative_suffix(derivative) == '_thumb'
+
+
+def test_paths_outside_the_layout_do_not_parse():
+    layout = StorageLayout('{camera}/{YYYY}/{MM}/{DD}/{HHMMSS}.jpg')
+    assert layout.parse('2024-05-01-12-03-09.jpg') is None
+    assert layout.parse('2024/05/01/120309.png') is None
+    assert layout.parse('packs/2024-05-01.tar') is None
+    # Matches the pattern but is not a date
+    assert layout.parse('2024/13/01/120309.jpg') is None
+
+
+@pytest.mark.parametrize('template, rel_path', TEMPLATES)
+def test_day_pattern_matches_the_images_of_the_day(template, rel_path):
+    layout = StorageLayout(template)
+    stem, ext = os.path.splitext(rel_path)
+    other_day = layout.relative_path(MOMENT + datetime.timedelta(days=1))
+    pattern = layout.day_pattern('cam', MOMENT.date())
+    assert fnmatch.fnmatch(os.path.join('cam', rel_path), pattern)
+    assert fnmatch.fnmatch(os.path.join('cam', f"{stem}_thumb{ext}"), pattern)
+    assert not fnmatch.fnmatch(os.path.join('cam', other_day), pattern)
+
+
+def test_rehome_keeps_the_derivative_suffix():
+    flat = get_layout(DEFAULT_TEMPLATE)
+    sharded = get_layout('{camera}/{YYYY}/{MM}/{DD}/{HHMMSS}.jpg')
+    assert sharded.rehome('2024-05-01-12-03-09_preview.jpg', MOMENT, flat) == '2024/05/01/120309_preview.jpg'
+
+
+def test_walk_yields_the_images_of_the_layout(tmp_path):
+    layout = get_layout('{camera}/{date}/{HHMMSS}.jpg')
+    for rel_path in ('2024-05-01/120309.jpg', '2024-05-01/120309_thumb.jpg', '2024-05-01/.120309.jpg.tmp',
+                     'packs/2024-05-01.tar', 'notes.txt'):
+        path = tmp_path / rel_path
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'')
+    assert sorted(layout.walk(str(tmp_path))) == [(os.path.join('2024-05-01', '120309.jpg'), MOMENT),
+                                                   (os.path.join('2024-05-01', '120309_thumb.jpg'), MOMENT)]
+
+
+@pytest.mark.parametrize('template', [
+    '{timestamp}.jpg',
+    '{camera}/{year}.jpg',
+    '{camera}/{date}/{date}-{HHMMSS}.jpg',
+    '{camera}/{HHMMSS}.jpg',
+    '{camera}/{date}.jpg',
+    '{camera}/{date',
+])
+def test_invalid_templates(template):
+    errors = template_errors(template)
+    assert len(errors) == 1 and errors[0].startswith("Check the config PATH_TEMPLATE")
@@ -0,0 +1,111 @@
+import datetime
+import os
+import tarfile
+
+from layout import get_layout
+from packer import pack_day, read_index, index_path, PackReader, Packer
+
+DAY = datetime.date(2024, 5, 1)
+
+
+def capture(camera_dir, layout, moment, data, suffix=''):
+    stem, ext = os.path.splitext(layout.relative_path(moment))
+    path = os.path.join(camera_dir, f"{stem}{suffix}{ext}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def at(hour, minute=0, date=DAY):
+    return datetime.datetime.combine(date, datetime.time(hour, minute))
+
+
+def test_pack_day_indexes_every_member(tmp_path):
+    layout = get_layout('{camera}/{timestamp}.jpg')
+    camera_dir = str(tmp_path)
+    images = {at(8): b'eight' * 100, at(12): b'noon', at(12, 5): b'x' * 513}
+    for moment, data in images.items():
+        capture(camera_dir, layout, moment, data)
+    capture(camera_dir, layout, at(12), b'small', suffix='_thumb')
+    next_day = capture(camera_dir, layout, at(8, date=DAY + datetime.timedelta(days=1)), b'tomorrow')
+
+    assert pack_day(camera_dir, DAY, layout) == 4
+    tar_path = os.path.join(camera_dir, 'packs', '2024-05-01.tar')
+    # Only the images of the day were packed and removed
+    assert sorted(os.listdir(camera_dir)) == ['2024-05-02-08-00-00.jpg', 'packs']
+    assert os.path.exists(next_day)
+
+    reader = PackReader(tar_path)
+    assert len(reader.names()) == 4
+    for moment, data in images.items():
+        assert reader.read(layout.relative_path(moment)) == data
+    assert reader.read('2024-05-01-12-00-00_thumb.jpg') == b'small'
+    # The offsets point at the same bytes as the tar headers
+    with tarfile.open(tar_path, 'r:') as tar:
+        for member in tar:
+            assert reader.members[member.name][:2] == [member.offset_data, member.size]
+
+
+def test_name_at_finds_the_original_at_or_before_a_time(tmp_path):
+    layout = get_layout('{camera}/{timestamp}.jpg')
+    camera_dir = str(tmp_path)
+    for moment in (at(8), at(12)):
+        capture(camera_dir, layout, moment, b'image')
+    capture(camera_dir, layout, at(12), b'preview', suffix='_preview')
+    pack_day(camera_dir, DAY, layout)
+    reader = PackReader(os.path.join(camera_dir, 'packs', '2024-05-01.tar'))
+
+    assert reader.name_at(at(7, 59)) is None
+    assert reader.name_at(at(8)) == '2024-05-01-08-00-00.jpg'
+    assert reader.name_at(at(11, 59)) == '2024-05-01-08-00-00.jpg'
+    # Derivatives are never picked
+    assert reader.name_at(at(23)) == '2024-05-01-12-00-00.jpg'
+    assert reader.read_at(at(23)) == b'image'
+    assert reader.read_at(at(7)) is None
+
+
+def test_sharded_layout_and_late_images_extend_the_pack(tmp_path):
+    layout = get_layout('{camera}/{YYYY}/{MM}/{DD}/{HHMMSS}.jpg')
+    camera_dir = str(tmp_path)
+    capture(camera_dir, layout, at(8), b'first')
+    assert pack_day(camera_dir, DAY, layout) == 1
+    # The emptied day folders are removed
+    assert os.listdir(camera_dir) == ['packs']
+
+    # Drained late from the spool
+    capture(camera_dir, layout, at(9), b'late')
+    assert pack_day(camera_dir, DAY, layout) == 1
+    reader = PackReader(os.path.join(camera_dir, 'packs', '2024-05-01.tar'))
+    assert reader.names() == ['2024/05/01/080000.jpg', '2024/05/01/090000.jpg']
+    assert reader.read_at(at(8, 30)) == b'first'
+    assert reader.read_at(at(9)) == b'late'
+
+
+def test_index_is_rebuilt_from_the_tar(tmp_path):
+    layout = get_layout('{camera}/{date}/{HHMMSS}.jpg')
+    camera_dir = str(tmp_path)
+    capture(camera_dir, layout, at(8), b'image')
+    pack_day(camera_dir, DAY, layout, remove=False)
+    tar_path = os.path.join(camera_dir, 'packs', '2024-05-01.tar')
+    members = read_index(tar_path)['members']
+    os.remove(index_path(tar_path))
+
+    # The template can not be read from a lost index, it is given by the caller
+    reader = PackReader(tar_path, layout.template)
+    assert reader.members == members
+    assert reader.name_at(at(9)) == '2024-05-01/080000.jpg'
+    assert os.path.exists(index_path(tar_path))
+
+
+def test_packer_packs_each_day_once_while_the_loose_files_stay(tmp_path):
+    layout = get_layout('{camera}/{timestamp}.jpg')
+    camera_dir = str(tmp_path)
+    capture(camera_dir, layout, at(8), b'image')
+    packer = Packer([camera_dir], layout, remove=False)
+    assert packer.pending_days(camera_dir, DAY) == {DAY: 1}
+    packer.pack_pending(DAY)
+    assert packer.pending_days(camera_dir, DAY) == {}
+
+    capture(camera_dir, layout, at(9), b'late')
+    assert packer.pending_days(camera_dir, DAY) == {DAY: 2}
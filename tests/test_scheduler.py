@@ -0,0 +1,104 @@
+import datetime
+
+import pytest
+import pytz
+
+from scheduler import (CaptureScheduler, HourWindow, SolarWindow, sun_times, MISSED_SKIP, MISSED_COALESCE,
+                       WINDOW_SOLAR)
+
+SEOUL = pytz.timezone('Asia/Seoul')
+
+
+def at(hour, minute=0, second=0, day=21, month=6, tz=SEOUL):
+    return tz.localize(datetime.datetime(2024, month, day, hour, minute, second))
+
+
+def hour_scheduler(interval_minutes=5, missed_policy=MISSED_SKIP):
+    return CaptureScheduler(interval_minutes * 60, HourWindow(6, 20, SEOUL), SEOUL, missed_policy)
+
+
+def test_ticks_are_aligned_on_the_wall_clock():
+    scheduler = hour_scheduler()
+    assert scheduler.next_tick(at(12, 3, 10)) == at(12, 5)
+    assert scheduler.next_tick(at(12, 5)) == at(12, 5)
+    # Counted from midnight: 12:01 is the 103rd tick of 7 minutes
+    assert hour_scheduler(interval_minutes=7).next_tick(at(11, 55)) == at(12, 1)
+
+
+def test_ticks_stay_inside_the_hour_window():
+    scheduler = hour_scheduler()
+    assert scheduler.next_tick(at(3)) == at(6)
+    assert scheduler.next_tick(at(20, 52)) == at(20, 55)
+    # LIGHT_END_HOUR 20 covers up to 20:59
+    assert scheduler.next_tick(at(20, 58)) == at(6, day=22)
+    assert scheduler.in_window(at(20, 59))
+    assert not scheduler.in_window(at(21))
+
+
+def test_overrun_skips_the_missed_ticks():
+    scheduler = hour_scheduler()
+    scheduler.last_tick = at(12)
+    assert scheduler.plan(at(12, 17)) == (at(12, 20), at(12, 20))
+    # 12:05, 12:10 and 12:15
+    assert scheduler.missed_ticks == 3
+
+
+def test_overrun_coalesces_the_missed_ticks():
+    scheduler = hour_scheduler(missed_policy=MISSED_COALESCE)
+    scheduler.last_tick = at(12)
+    now = at(12, 17)
+    # One capture right away, standing for the latest missed tick
+    assert scheduler.plan(now) == (at(12, 15), now)
+    assert scheduler.missed_ticks == 2
+
+
+def test_plan_without_overrun_waits_for_the_next_tick():
+    scheduler = hour_scheduler()
+    scheduler.last_tick = at(12)
+    assert scheduler.plan(at(12, 1)) == (at(12, 5), at(12, 5))
+    assert scheduler.missed_ticks == 0
+
+
+def test_sun_times_in_seoul():
+    # Published times: 05:11-19:57 at the summer solstice, 07:43-17:17 at the winter solstice
+    for date, sunrise, sunset in ((datetime.date(2024, 6, 21), at(5, 11), at(19, 57)),
+                                  (datetime.date(2024, 12, 21), at(7, 43, day=21, month=12),
+                                   at(17, 17, day=21, month=12))):
+        start, end = sun_times(date, 37.5665, 126.9780, SEOUL)
+        assert abs((start - sunrise).total_seconds()) < 120
+        assert abs((end - sunset).total_seconds()) < 120
+
+
+def test_sun_times_polar_night_and_day():
+    tz = pytz.timezone('Arctic/Longyearbyen')
+    assert sun_times(datetime.date(2024, 12, 21), 78.22, 15.65, tz) == (None, None)
+    start, end = sun_times(datetime.date(2024, 6, 21), 78.22, 15.65, tz)
+    assert end - start == datetime.timedelta(days=1)
+
+
+def test_solar_window_ticks_follow_sunrise_and_offsets():
+    window = SolarWindow(37.5665, 126.9780, SEOUL, sunrise_offset=30, sunset_offset=-30)
+    scheduler = CaptureScheduler(600, window, SEOUL)
+    # Sunrise 05:10:46 + 30 minutes: first 10 minute tick after 05:40:46
+    assert scheduler.next_tick(at(3)) == at(5, 50)
+    # Sunset 19:56:29 - 30 minutes: the 19:30 tick is out of the window
+    assert scheduler.next_tick(at(19, 11)) == at(19, 20)
+    assert scheduler.next_tick(at(19, 20, 1)) == at(5, 50, day=22)
+
+
+def test_solar_window_without_sunrise_for_a_week():
+    tz = pytz.timezone('Arctic/Longyearbyen')
+    scheduler = CaptureScheduler(600, SolarWindow(78.22, 15.65, tz), tz)
+    with pytest.raises(RuntimeError):
+        scheduler.next_tick(at(12, day=21, month=12, tz=tz))
+
+
+def test_from_config_picks_the_window():
+    config = {'INTERVAL_TIME': 5, 'LIGHT_START_HOUR': 6, 'LIGHT_END_HOUR': 20,
+              'SCHEDULE': {'WINDOW': WINDOW_SOLAR, 'LATITUDE': 37.5665, 'LONGITUDE': 126.9780,
+                           'MISSED_TICKS': MISSED_COALESCE}}
+    scheduler = CaptureScheduler.from_config(config, SEOUL)
+    assert isinstance(scheduler.window, SolarWindow)
+    assert (scheduler.interval, scheduler.missed_policy) == (300, MISSED_COALESCE)
+    del config['SCHEDULE']
+    assert isinstance(CaptureScheduler.from_config(config, SEOUL).window, HourWindow)
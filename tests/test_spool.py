@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+import spool as spool_module
+from catalog import STATUS_WRITTEN, STATUS_SPOOLED, STATUS_EVICTED
+from spool import Spool
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def mounted(monkeypatch):
+    state = {'live': False}
+    monkeypatch.setattr(spool_module, 'is_network_mount', lambda mountpoint: state['live'])
+    return state
+
+
+def make_spool(max_bytes=1024, max_files=10):
+    spool = Spool('~/share', '~/spool', max_bytes, max_files, drain_rate=1024 * 1024, mount_check_interval=0)
+    statuses = []
+    spool.on_status = lambda path, status: statuses.append((path, status))
+    return spool, statuses
+
+
+def test_write_spools_while_unmounted_and_drains_oldest_first(home, mounted):
+    spool, statuses = make_spool()
+    first = str(home / 'share' / 'cam' / 'a.jpg')
+    second = str(home / 'share' / 'cam' / 'b.jpg')
+    assert spool.write(first, b'first') == STATUS_SPOOLED
+    assert spool.write(second, b'second') == STATUS_SPOOLED
+    assert (home / 'spool' / 'share' / 'cam' / 'a.jpg').read_bytes() == b'first'
+    assert not os.path.exists(first)
+
+    mounted['live'] = True
+    assert spool.mount_live()
+    assert spool._drain_one() == len(b'first')
+    assert open(first, 'rb').read() == b'first'
+    assert not os.path.exists(second)
+    assert spool._drain_one() == len(b'second')
+    assert open(second, 'rb').read() == b'second'
+
+    assert statuses == [(first, STATUS_WRITTEN), (second, STATUS_WRITTEN)]
+    assert not os.listdir(home / 'spool' / 'share' / 'cam')
+    stats = spool.stats()
+    assert (stats['files'], stats['bytes'], stats['spooled'], stats['drained']) == (0, 0, 2, 2)
+
+
+def test_write_goes_to_the_share_while_mounted(home, mounted):
+    mounted['live'] = True
+    spool, statuses = make_spool()
+    path = str(home / 'share' / 'cam' / 'a.jpg')
+    assert spool.write(path, b'data') == STATUS_WRITTEN
+    assert open(path, 'rb').read() == b'data'
+    assert spool.stats()['files'] == 0
+
+
+def test_evicts_the_oldest_image_above_max_files(home, mounted):
+    spool, statuses = make_spool(max_files=2)
+    paths = [str(home / 'share' / 'cam' / f'{name}.jpg') for name in 'abc']
+    for path in paths:
+        assert spool.put(path, b'x' * 10)
+    assert statuses == [(paths[0], STATUS_EVICTED)]
+    assert not (home / 'spool' / 'share' / 'cam' / 'a.jpg').exists()
+    assert list(spool._index) == [os.path.join('share', 'cam', 'b.jpg'), os.path.join('share', 'cam', 'c.jpg')]
+    assert spool.stats()['evicted'] == 1
+
+
+def test_evicts_until_the_new_image_fits_in_max_bytes(home, mounted):
+    spool, statuses = make_spool(max_bytes=100)
+    paths = [str(home / 'share' / 'cam' / f'{name}.jpg') for name in 'abc']
+    spool.put(paths[0], b'x' * 40)
+    spool.put(paths[1], b'x' * 40)
+    spool.put(paths[2], b'x' * 70)
+    assert statuses == [(paths[0], STATUS_EVICTED), (paths[1], STATUS_EVICTED)]
+    assert spool.stats()['bytes'] == 70
+
+
+def test_rejects_images_it_can_not_hold(home, mounted):
+    spool, _ = make_spool(max_bytes=10)
+    assert spool.write(str(home / 'share' / 'cam' / 'big.jpg'), b'x' * 11) == STATUS_EVICTED
+    # Outside the home directory the spooled copy would land outside the spool
+    assert not spool.put(os.path.join(os.path.dirname(home), 'elsewhere.jpg'), b'x')
+    assert spool.stats()['files'] == 0
+
+
+def test_index_is_rebuilt_from_a_previous_run(home, mounted):
+    spool, _ = make_spool()
+    spool.put(str(home / 'share' / 'cam' / 'a.jpg'), b'aaa')
+    spool.put(str(home / 'share' / 'cam' / 'b.jpg'), b'bb')
+    os.utime(home / 'spool' / 'share' / 'cam' / 'a.jpg', (1, 1))
+    os.utime(home / 'spool' / 'share' / 'cam' / 'b.jpg', (2, 2))
+
+    restarted, _ = make_spool()
+    assert list(restarted._index) == [os.path.join('share', 'cam', 'a.jpg'), os.path.join('share', 'cam', 'b.jpg')]
+    assert restarted.stats()['bytes'] == 5
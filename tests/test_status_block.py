@@ -0,0 +1,80 @@
+import struct
+
+import numpy as np
+import pytest
+
+from status_block import StatusBlockWriter, StatusBlockReader, MAX_CAMERAS, SEQ_OFFSET
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'status')
+
+
+def test_reader_sees_the_last_cycle(path):
+    writer = StatusBlockWriter(['cam0', 'cam1'], path)
+    writer.update([np.zeros((360, 480, 3), np.uint8), None], [1000.0, None], cycle_duration=1.5, queue_depth=3)
+    status = StatusBlockReader(path).read()
+
+    assert status['seq'] % 2 == 0
+    assert (status['cycle_duration'], status['queue_depth']) == (1.5, 3)
+    assert status['heartbeat_at'] > 0
+    ok, failed = status['cameras']
+    assert (ok['name'], ok['ok'], ok['last_success'], ok['width'], ok['height']) == ('cam0', True, 1000.0, 480, 360)
+    assert (failed['name'], failed['ok'], failed['last_success']) == ('cam1', False, 0.0)
+    assert failed['last_failure'] == failed['last_capture'] > 0
+    writer.close()
+
+
+def test_every_write_leaves_an_even_sequence(path):
+    writer = StatusBlockWriter(['cam0'], path)
+    reader = StatusBlockReader(path)
+    seqs = []
+    for _ in range(3):
+        writer.update([None], [None], 0.1, 0)
+        seqs.append(reader.read()['seq'])
+    assert seqs == [2, 4, 6]
+    writer.close()
+
+
+def test_reader_gives_up_on_a_block_being_written(path):
+    writer = StatusBlockWriter(['cam0'], path)
+    writer.update([None], [None], 0.1, 0)
+    # A writer stopped in the middle of an update: the sequence stays odd
+    struct.pack_into('<Q', writer._map, SEQ_OFFSET, writer.seq + 1)
+    assert StatusBlockReader(path).read(retries=3) is None
+
+    # The next writer starts from an even sequence again
+    restarted = StatusBlockWriter(['cam0'], path)
+    assert restarted.seq % 2 == 0
+    restarted.heartbeat()
+    assert StatusBlockReader(path).read()['seq'] == restarted.seq
+    writer.close()
+    restarted.close()
+
+
+def test_heartbeat_keeps_the_last_cycle(path, monkeypatch):
+    writer = StatusBlockWriter(['cam0'], path)
+    writer.update([None], [None], cycle_duration=2.5, queue_depth=4)
+    before = StatusBlockReader(path).read()
+
+    monkeypatch.setattr('status_block.time.time', lambda: before['heartbeat_at'] + 60)
+    writer.heartbeat()
+    after = StatusBlockReader(path).read()
+    assert after['heartbeat_at'] == before['heartbeat_at'] + 60
+    assert (after['updated_at'], after['cycle_duration'], after['queue_depth']) == \
+        (before['updated_at'], 2.5, 4)
+    assert after['cameras'] == before['cameras']
+
+    # A restarted recorder keeps reporting the previous cycle until its first one
+    restarted = StatusBlockWriter(['cam0'], path)
+    restarted.heartbeat()
+    assert StatusBlockReader(path).read()['cycle_duration'] == 2.5
+    writer.close()
+    restarted.close()
+
+
+def test_missing_block_and_too_many_cameras(path):
+    assert StatusBlockReader(path).read() is None
+    with pytest.raises(ValueError):
+        StatusBlockWriter([f'cam{ix}' for ix in range(MAX_CAMERAS + 1)], path)
@@ -0,0 +1,49 @@
+import sys
+
+# api/run.py sends stdout and stderr to ~/api.log when it is imported
+stdout, stderr = sys.stdout, sys.stderr
+try:
+    from api.run import ByteLRU
+finally:
+    sys.stdout, sys.stderr = stdout, stderr
+
+
+def test_least_recently_used_values_are_evicted_first():
+    cache = ByteLRU(10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    # 'a' is now the most recently used
+    assert cache.get('a') == b'aaaa'
+    cache.put('c', b'cccc')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.get('c') == b'cccc'
+    assert cache.evictions == 1
+    assert cache._bytes == 8
+
+
+def test_eviction_keeps_the_total_size_under_the_bound():
+    cache = ByteLRU(10)
+    for key in 'abcde':
+        cache.put(key, b'xx')
+    cache.put('big', b'x' * 9)
+    assert list(cache._items) == ['big']
+    assert (cache._bytes, cache.evictions) == (9, 5)
+
+
+def test_replacing_a_key_counts_its_new_size_only():
+    cache = ByteLRU(10)
+    cache.put('a', b'x' * 6)
+    cache.put('a', b'x' * 8)
+    assert cache._bytes == 8 and cache.evictions == 0
+    cache.put('b', b'xx')
+    assert cache._bytes == 10 and cache.evictions == 0
+
+
+def test_values_larger_than_the_cache_are_not_kept():
+    cache = ByteLRU(10)
+    cache.put('a', b'aaaa')
+    cache.put('huge', b'x' * 11)
+    assert cache.get('huge') is None
+    assert cache.get('a') == b'aaaa'
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 0)